@@ -1,14 +1,24 @@
 # neo4j_crud.py
 from admin_neo4j.neo4j_driver import get_session
+from utils.shelf_kernel import adjacent_mask
 from collections import defaultdict
-from datetime import datetime
+import logging
+import time
 import uuid
 
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
 
 class BookshelfNeo4j:
 
     PX_SCALE = 1.2
     ADJACENCY_GAP_PX = 1
+    BULK_BATCH_SIZE = 1000   # add_books_with_meaning の1トランザクションあたりの冊数
+
+    def __init__(self):
+        self.last_layout_sync: dict | None = None   # 直近の update_shelf_layout_chain の件数と段階ごとの時間
 
     # ============================================================
     # 内部ユーティリティ
@@ -30,8 +40,9 @@ class BookshelfNeo4j:
         return round(min(1.0, w_row * w_col * w_iso), 4)
 
     @staticmethod
-    def _spine_width_px(pages: int) -> float:
-        return min(100.0, max(1.0, pages * 0.08))
+    def _spine_width_px(pages):
+        """背幅(px)。ページ数の配列を渡すと配列で返す"""
+        return np.clip(np.asarray(pages, dtype=np.float64) * 0.08, 1.0, 100.0)
 
     # ============================================================
     # 書籍登録（既存）
@@ -160,6 +171,191 @@ class BookshelfNeo4j:
                     publisher=publisher,
                 )
 
+    @staticmethod
+    def _book_row(book_obj, meaning_text: str = None) -> dict:
+        """add_books_with_meaning 用に1冊分のパラメータを組み立てる（add_book_with_meaning と同じ正規化）"""
+        def get_val(key, default=None):
+            if isinstance(book_obj, dict):
+                return book_obj.get(key, default)
+            return getattr(book_obj, key, default)
+
+        ndc_full = get_val("ndc") or ""
+        authors  = get_val("authors")
+        if isinstance(authors, list):
+            author_list = [a.strip() for a in authors if a.strip()]
+            authors_str = ", ".join(author_list)
+        else:
+            authors_str = str(authors) if authors else "不明"
+            author_list = [a.strip() for a in authors_str.split(",") if a.strip() and a.strip() != "不明"]
+
+        return {
+            "isbn":           get_val("isbn"),
+            "title":          get_val("title"),
+            "authors":        authors_str,
+            "author_list":    author_list,
+            "publisher":      get_val("publisher") or "",
+            "published_year": get_val("published_year"),
+            "cover":          get_val("cover"),
+            "spine_image":    get_val("spine_image"),
+            "height_mm":      get_val("height_mm"),
+            "pages":          get_val("pages"),
+            "size_label":     get_val("size_label"),
+            "description":    get_val("description"),
+            "ndc_full":       ndc_full,
+            "ndc_l1":         ndc_full[0] if len(ndc_full) >= 1 and ndc_full[0].isdigit() else None,
+            "ndc_l2":         ndc_full[:2] if len(ndc_full) >= 2 and ndc_full[:2].isdigit() else None,
+            "ndc_l3":         ndc_full[:3] if len(ndc_full) >= 3 and ndc_full[:3].isdigit() else None,
+            "meaning":        meaning_text,
+        }
+
+    @staticmethod
+    def _ndc_graph(rows: list[dict]) -> tuple[list[dict], list[dict], list[dict]]:
+        """
+        NDC ノード・BROADER・CLASSIFIED_AS を重複なしで組み立てる。
+        add_book_with_meaning と同じく、階層と分類は l1〜l3 が揃っている本だけに張る。
+        """
+        nodes:      dict[str, int] = {}
+        broader:    set[tuple]     = set()
+        classified: list[dict]     = []
+        for r in rows:
+            l1, l2, l3, full = r["ndc_l1"], r["ndc_l2"], r["ndc_l3"], r["ndc_full"]
+            for code, level in ((l1, 1), (l2, 2), (l3, 3)):
+                if code is not None:
+                    nodes.setdefault(code, level)
+            if l1 is None or l2 is None or l3 is None:
+                continue
+            nodes.setdefault(full, 4)
+            broader.update({(l2, l1), (l3, l2)})
+            if full != l3:
+                broader.add((full, l3))
+            classified.append({"isbn": r["isbn"], "code": full})
+        return (
+            [{"code": c, "level": lv} for c, lv in nodes.items()],
+            [{"child": c, "parent": p} for c, p in broader],
+            classified,
+        )
+
+    def add_books_with_meaning(
+        self, books: list, meaning_text: str = None, batch_size: int = None, on_batch=None,
+    ) -> int:
+        """
+        add_book_with_meaning の一括版。NDC の階層・著者・出版社は Python 側で
+        組み立てておき、batch_size 冊（省略時 BULK_BATCH_SIZE）ごとに1つの書き込み
+        トランザクションで UNWIND 文を数本流す。on_batch(済んだ冊数, 全冊数) で進捗を受け取れる。
+        反映した冊数を返す。
+        """
+        rows = [self._book_row(b, meaning_text) for b in books]
+        rows = [r for r in rows if r["isbn"]]
+        batch_size = batch_size or self.BULK_BATCH_SIZE
+
+        with get_session() as session:
+            for start in range(0, len(rows), batch_size):
+                session.execute_write(self._write_books, rows[start:start + batch_size])
+                if on_batch:
+                    on_batch(min(start + batch_size, len(rows)), len(rows))
+        return len(rows)
+
+    def _write_books(self, tx, rows: list[dict]) -> None:
+        """add_books_with_meaning の1バッチ分（トランザクション関数）"""
+        ndc_nodes, ndc_broader, classified = self._ndc_graph(rows)
+        written_by = [
+            {"isbn": r["isbn"], "name": name} for r in rows for name in r["author_list"]
+        ]
+        published_by = [
+            {"isbn": r["isbn"], "name": r["publisher"]} for r in rows if r["publisher"]
+        ]
+        meanings = [
+            {"isbn": r["isbn"], "text": r["meaning"]} for r in rows if r["meaning"]
+        ]
+
+        tx.run(
+            """
+            UNWIND $rows AS row
+            MERGE (b:Book {isbn: row.isbn})
+            SET
+                b.title = row.title,
+                b.authors = row.authors,
+                b.publisher = row.publisher,
+                b.published_year = row.published_year,
+                b.cover = row.cover,
+                b.spine_image = row.spine_image,
+                b.height_mm = row.height_mm,
+                b.pages = row.pages,
+                b.size_label = row.size_label,
+                b.description = row.description,
+                b.updatedAt = datetime()
+            """,
+            rows=rows,
+        )
+        tx.run(
+            """
+            UNWIND $nodes AS node
+            MERGE (n:NDC {code: node.code}) ON CREATE SET n.level = node.level
+            """,
+            nodes=ndc_nodes,
+        )
+        tx.run(
+            """
+            UNWIND $edges AS edge
+            MATCH (c:NDC {code: edge.child})
+            MATCH (p:NDC {code: edge.parent})
+            MERGE (c)-[:BROADER]->(p)
+            """,
+            edges=ndc_broader,
+        )
+        tx.run(
+            """
+            UNWIND $classified AS cls
+            MATCH (b:Book {isbn: cls.isbn})
+            MATCH (n:NDC {code: cls.code})
+            MERGE (b)-[:CLASSIFIED_AS]->(n)
+            """,
+            classified=classified,
+        )
+        # 著者・出版社はノードを先に重複なしで MERGE してから関係を張る
+        tx.run(
+            """
+            UNWIND $names AS name
+            MERGE (:Author {name: name})
+            """,
+            names=sorted({p["name"] for p in written_by}),
+        )
+        tx.run(
+            """
+            UNWIND $pairs AS pair
+            MATCH (b:Book {isbn: pair.isbn})
+            MATCH (a:Author {name: pair.name})
+            MERGE (b)-[:WRITTEN_BY]->(a)
+            """,
+            pairs=written_by,
+        )
+        tx.run(
+            """
+            UNWIND $names AS name
+            MERGE (:Publisher {name: name})
+            """,
+            names=sorted({p["name"] for p in published_by}),
+        )
+        tx.run(
+            """
+            UNWIND $pairs AS pair
+            MATCH (b:Book {isbn: pair.isbn})
+            MATCH (p:Publisher {name: pair.name})
+            MERGE (b)-[:PUBLISHED_BY]->(p)
+            """,
+            pairs=published_by,
+        )
+        if meanings:
+            tx.run(
+                """
+                UNWIND $meanings AS m
+                MATCH (b:Book {isbn: m.isbn})
+                CREATE (mn:Meaning {text: m.text, createdAt: datetime()})
+                MERGE (b)-[:HAS_MEANING]->(mn)
+                """,
+                meanings=meanings,
+            )
+
     # ============================================================
     # NDCグルーピング（既存）
     # ============================================================
@@ -218,7 +414,13 @@ class BookshelfNeo4j:
     #   bs:adjacentTo    → [:SHELF_NEXT]  ← 既存リレーションをそのまま流用
     # ============================================================
 
-    def update_shelf_layout_chain(self, layout_data: list[dict]):
+    def update_shelf_layout_chain(
+        self,
+        layout_data: list[dict],
+        changed_isbns: list[str] | None = None,
+        removed_isbns: list[str] | None = None,
+        shelves: list[int] | None = None,
+    ):
         """
         layout_data: [
             {
@@ -233,9 +435,30 @@ class BookshelfNeo4j:
 
         実行内容:
           1. ShelfPosition ノードを生成・更新し memoryWeight を付与
-          2. ShelfPosition → Book の LOCATES リレーションを張る
+          2. ShelfPosition → Book の LOCATES リレーションを張る（前の位置からの LOCATES は外す）
           3. 隣接 Book 間に SHELF_NEXT リレーションを張る（既存ロジック）
-          4. PlacementEvent を自動記録する（変遷ログ）
+        いずれも1つの execute_write の中で UNWIND にまとめて流すので、
+        往復回数は冊数によらず一定（直前位置の取得1 + 位置1 + SHELF_NEXT 最大3）。
+        SHELF_NEXT は既存の組を読み、無くなった組の削除と新しい組の作成だけを行う。
+        直前の位置と比べて何も変わっていない本の ShelfPosition は書かない。
+
+        戻り値（self.last_layout_sync にも残す）:
+          {"books", "relations", "moved", "positions_written", "locates_removed",
+           "relations_deleted", "relations_created",
+           "timing_ms": {"prepare", "previous", "positions", "shelf_next", "total"}}
+
+        配置の変遷ログは PlacementEvent ノードではなく SQLite の
+        shelf_layout_history に差分で残す（utils/layout_history.py）。
+
+        changed_isbns を渡した場合は差分更新として扱う:
+          - layout_data は「変更のあった段」に並ぶ本すべて（段ごとに完全なリスト）
+          - SHELF_NEXT はその段の分だけ差分を取って付け替える
+          - shelves には変更のあった段をすべて渡す。本が無くなった段は layout_data に
+            現れないが、その段に残っている SHELF_NEXT もここで消す
+        None の場合は従来どおり layout_data を棚全体とみなす。
+
+        棚から外した本は removed_isbns で渡すと LOCATES を外す（同じトランザクション）。
+        layout_data が棚全体のときは、そこに無い本の LOCATES もすべて外す。
         """
         # ── 棚ごとにグループ化・ソート ───────────────────────────
         rows: dict[int, list[dict]] = defaultdict(list)
@@ -247,142 +470,316 @@ class BookshelfNeo4j:
 
         # ── isEdge / isIsolated を計算 ───────────────────────────
         # （ShelfPosition.memoryWeight の算出に必要）
-        enriched: list[dict] = []
+        started = time.perf_counter()
+        positions: list[dict] = []
         for shelf_index, shelf_books in rows.items():
             n = len(shelf_books)
             for i, book in enumerate(shelf_books):
                 is_edge     = (i == 0) or (i == n - 1)
                 # 両隣が空 = このスロットだけ孤立（shelf 内で隣接本がない）
                 is_isolated = n == 1
-                enriched.append({**book, "is_edge": is_edge, "is_isolated": is_isolated})
+                positions.append({
+                    "isbn":          book["isbn"],
+                    "pos_id":        f"pos_r{shelf_index}_c{book['order_index']}",
+                    "shelf_index":   shelf_index,
+                    "column_index":  book["order_index"],
+                    "x_pos":         book.get("x_pos") or 0.0,
+                    "is_edge":       is_edge,
+                    "is_isolated":   is_isolated,
+                    "memory_weight": self._calc_memory_weight(shelf_index, is_edge, is_isolated),
+                })
 
         # ── SHELF_NEXT 用の隣接ペアを計算 ────────────────────────
-        relations = []
-        for shelf_index, shelf_books in rows.items():
-            for i in range(len(shelf_books) - 1):
-                a = shelf_books[i]
-                b = shelf_books[i + 1]
-                sw_a    = self._spine_width_px(a.get("pages", 200))
-                gap_px  = (b.get("x_pos", 0) - a.get("x_pos", 0)) * self.PX_SCALE - sw_a
-                if gap_px < self.ADJACENCY_GAP_PX:
-                    relations.append({
-                        "from":        a["isbn"],
-                        "to":          b["isbn"],
-                        "shelf_index": shelf_index,
-                    })
-
-        # ── Neo4j 更新 ────────────────────────────────────────────
+        #    段ごとに x 順で並べた1列に対して shelf_kernel でまとめて判定する
+        ordered = [book for shelf_books in rows.values() for book in shelf_books]
+        shelves = np.array([b["shelf_index"] for b in ordered], dtype=np.int64)
+        adjacent = adjacent_mask(
+            shelves,
+            np.array([b.get("x_pos") or 0 for b in ordered], dtype=np.float64),
+            self._spine_width_px([b.get("pages") or 200 for b in ordered]),
+            self.PX_SCALE,
+            self.ADJACENCY_GAP_PX,
+        )
+        relations = [
+            {
+                "from":        ordered[i]["isbn"],
+                "to":          ordered[i + 1]["isbn"],
+                "shelf_index": int(shelves[i]),
+            }
+            for i in np.flatnonzero(adjacent).tolist()
+        ]
+        stats = {"books": len(positions), "relations": len(relations)}
+        timing = {"prepare_ms": (time.perf_counter() - started) * 1000}
+
+        # ── Neo4j 更新（1トランザクション・文の数は冊数によらず一定） ──
         with get_session() as session:
+            session.execute_write(
+                self._write_layout,
+                positions,
+                None if changed_isbns is None else sorted(set(rows) | set(shelves or [])),
+                relations,
+                list(removed_isbns or []),
+                stats,
+                timing,
+            )
 
-            # 1. ShelfPosition ノードを MERGE・memoryWeight をセット
-            #    LOCATES リレーションも同時に張る
-            for item in enriched:
-                shelf_index  = item["shelf_index"]
-                column_index = item["order_index"]
-                is_edge      = item["is_edge"]
-                is_isolated  = item["is_isolated"]
-                pos_id       = f"pos_r{shelf_index}_c{column_index}"
-                memory_weight = self._calc_memory_weight(shelf_index, is_edge, is_isolated)
+        timing["total_ms"] = (time.perf_counter() - started) * 1000
+        stats["timing_ms"] = {k[:-3]: round(v, 2) for k, v in timing.items()}
+        self.last_layout_sync = stats
+        logger.info(f"[neo4j] 棚レイアウト反映 {stats}")
+        return stats
+
+    def _write_layout(
+        self,
+        tx,
+        positions: list[dict],
+        shelves: list[int] | None,
+        relations: list[dict],
+        removed: list[str],
+        stats: dict,
+        timing: dict,
+    ) -> None:
+        """
+        update_shelf_layout_chain のトランザクション関数。
+        shelves が None なら SHELF_NEXT を全体で、そうでなければその段だけ新しい組と突き合わせる。
+        各段階の所要時間を timing に、書いた件数を stats に入れる
+        （execute_write が再試行した場合は最後の試行の値が残る）。
+        """
+        # 1. 直前の位置を1回で取る（1冊1行に畳み、LOCATES の本数も数える）。
+        #    compact_locates 前の古いデータで LOCATES が複数ある本は、下で必ず書き直して余分を外す
+        t = time.perf_counter()
+        previous = {
+            r["isbn"]: r
+            for r in tx.run(
+                """
+                UNWIND $isbns AS isbn
+                MATCH (pos:ShelfPosition)-[:LOCATES]->(:Book {isbn: isbn})
+                WITH isbn, collect(pos) AS located
+                WITH isbn, located, located[0] AS pos
+                RETURN isbn,
+                       size(located)    AS located,
+                       pos.posId        AS pos_id,
+                       pos.xPos         AS x_pos,
+                       pos.isEdge       AS is_edge,
+                       pos.isIsolated   AS is_isolated,
+                       pos.memoryWeight AS memory_weight
+                """,
+                isbns=[p["isbn"] for p in positions],
+            ).data()
+        }
+        timing["previous_ms"] = (time.perf_counter() - t) * 1000
+
+        # 位置も属性も変わっておらず LOCATES が1本だけの本は書かない
+        fields  = ("pos_id", "x_pos", "is_edge", "is_isolated", "memory_weight")
+        changed = [
+            p for p in positions
+            if (prev := previous.get(p["isbn"])) is None
+            or prev["located"] > 1
+            or any(prev[f] != p[f] for f in fields)
+        ]
+        stats["moved"] = sum(
+            1 for p in changed if p["isbn"] in previous and previous[p["isbn"]]["pos_id"] != p["pos_id"]
+        )
+        stats["positions_written"] = len(changed)
+
+        # 2. bs:ShelfPosition ノードと bs:locates → [:LOCATES]
+        #    本が前にいた位置からの LOCATES は同じ文で外し、本ごとに常に1本にする
+        t = time.perf_counter()
+        stats["locates_removed"] = 0
+        if changed:
+            stats["locates_removed"] = tx.run(
+                """
+                UNWIND $positions AS p
+                MERGE (pos:ShelfPosition {posId: p.pos_id})
+                SET
+                    pos.shelfIndex   = p.shelf_index,
+                    pos.columnIndex  = p.column_index,
+                    pos.xPos         = p.x_pos,
+                    pos.isEdge       = p.is_edge,
+                    pos.isIsolated   = p.is_isolated,
+                    pos.memoryWeight = p.memory_weight,
+                    pos.updatedAt    = datetime()
+                WITH pos, p
+                MATCH (b:Book {isbn: p.isbn})
+                MERGE (pos)-[:LOCATES]->(b)
+                WITH pos, b
+                OPTIONAL MATCH (old:ShelfPosition)-[stale:LOCATES]->(b)
+                WHERE old <> pos
+                DELETE stale
+                RETURN count(stale) AS removed
+                """,
+                positions=changed,
+            ).single()["removed"]
 
-                session.run(
-                    """
-                    // bs:ShelfPosition ノード
-                    MERGE (pos:ShelfPosition {posId: $pos_id})
-                    SET
-                        pos.shelfIndex   = $shelf_index,
-                        pos.columnIndex  = $column_index,
-                        pos.xPos         = $x_pos,
-                        pos.isEdge       = $is_edge,
-                        pos.isIsolated   = $is_isolated,
-                        pos.memoryWeight = $memory_weight,
-                        pos.updatedAt    = datetime()
-
-                    // bs:locates → [:LOCATES]
-                    WITH pos
-                    MATCH (b:Book {isbn: $isbn})
-                    MERGE (pos)-[:LOCATES]->(b)
-                    """,
-                    pos_id=pos_id,
-                    shelf_index=shelf_index,
-                    column_index=column_index,
-                    x_pos=item.get("x_pos", 0.0),
-                    is_edge=is_edge,
-                    is_isolated=is_isolated,
-                    memory_weight=memory_weight,
-                    isbn=item["isbn"],
-                )
+        #    棚に無い本の LOCATES を外す（全体のときは layout_data に無い本すべて）
+        if shelves is None:
+            stats["locates_removed"] += tx.run(
+                """
+                MATCH (:ShelfPosition)-[r:LOCATES]->(b:Book)
+                WHERE NOT b.isbn IN $isbns
+                DELETE r
+                RETURN count(r) AS removed
+                """,
+                isbns=[p["isbn"] for p in positions],
+            ).single()["removed"]
+        elif removed:
+            stats["locates_removed"] += tx.run(
+                """
+                UNWIND $isbns AS isbn
+                MATCH (:ShelfPosition)-[r:LOCATES]->(:Book {isbn: isbn})
+                DELETE r
+                RETURN count(r) AS removed
+                """,
+                isbns=removed,
+            ).single()["removed"]
+        timing["positions_ms"] = (time.perf_counter() - t) * 1000
+
+        # 3. SHELF_NEXT は今ある組と新しい組の差分だけ削除・作成する（bs:adjacentTo に対応）
+        #    全消ししないので、同じトランザクションの外から辺が一瞬消えて見えることもない
+        t = time.perf_counter()
+        existing = tx.run(
+            """
+            MATCH (a:Book)-[r:SHELF_NEXT]->(b:Book)
+            WHERE $shelves IS NULL OR r.shelf_index IN $shelves
+            RETURN a.isbn AS from, b.isbn AS to, r.shelf_index AS shelf_index
+            """,
+            shelves=shelves,
+        ).data()
+        old_pairs = {(r["from"], r["to"], r["shelf_index"]) for r in existing}
+        new_pairs = {(r["from"], r["to"], r["shelf_index"]) for r in relations}
+        stale = [{"from": f, "to": to, "shelf_index": i} for f, to, i in old_pairs - new_pairs]
+        added = [{"from": f, "to": to, "shelf_index": i} for f, to, i in new_pairs - old_pairs]
+        if stale:
+            tx.run(
+                """
+                UNWIND $relations AS rel
+                MATCH (:Book {isbn: rel.from})-[r:SHELF_NEXT]->(:Book {isbn: rel.to})
+                WHERE coalesce(r.shelf_index, -1) = coalesce(rel.shelf_index, -1)   // 段番号の無い古い辺も消す
+                DELETE r
+                """,
+                relations=stale,
+            )
+        if added:
+            tx.run(
+                """
+                UNWIND $relations AS rel
+                MATCH (a:Book {isbn: rel.from})
+                MATCH (b:Book {isbn: rel.to})
+                MERGE (a)-[:SHELF_NEXT {shelf_index: rel.shelf_index}]->(b)
+                """,
+                relations=added,
+            )
+        stats["relations_deleted"] = len(stale)
+        stats["relations_created"] = len(added)
+        timing["shelf_next_ms"] = (time.perf_counter() - t) * 1000
 
-            # 2. SHELF_NEXT を全削除して張り直す（既存ロジックをそのまま維持）
-            #    bs:adjacentTo に対応
-            session.run("MATCH ()-[r:SHELF_NEXT]-() DELETE r")
-            if relations:
-                session.run(
-                    """
-                    UNWIND $relations AS rel
-                    MATCH (a:Book {isbn: rel.from})
-                    MATCH (b:Book {isbn: rel.to})
-                    MERGE (a)-[:SHELF_NEXT {shelf_index: rel.shelf_index}]->(b)
-                    """,
-                    relations=relations,
-                )
+    # ============================================================
+    # LOCATES の保守（本ごとに現在位置への1本だけにする）
+    # ============================================================
 
-            # 3. PlacementEvent を記録（bs:PlacementEvent / 変遷ログ）
-            #    既存の ShelfPosition と比較して「移動」があった場合のみ
-            #    previousPosition を記録する
-            for item in enriched:
-                isbn         = item["isbn"]
-                pos_id       = f"pos_r{item['shelf_index']}_c{item['order_index']}"
-                event_id     = f"evt_{isbn}_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+    def compact_locates(self, current: dict[str, str] | None = None, batch_size: int = 5000) -> dict:
+        """
+        本ごとに複数残っている LOCATES を1本に揃える一回限りの掃除
+        （update_shelf_layout_chain が古い LOCATES を外すようになる前のデータ向け）。
+
+        current: isbn → 現在の posId（SQLite の shelflayout から作る）。
+                 渡すとその位置からの LOCATES を残し、棚に無い本の LOCATES は外す。
+                 その位置からの LOCATES がまだ無い本（write-behind の反映待ちで SQLite が
+                 先に進んでいる）は、消してしまわず updatedAt が最も新しい1本を残す。
+                 None のときはすべての本で updatedAt が最も新しい1本を残す。
+        どの本にも LOCATES しなくなった ShelfPosition ノードも消す。
+        """
+        removed = 0
+        with get_session() as session:
+            if current is not None:
+                rows = [{"isbn": k, "pos_id": v} for k, v in current.items()]
+                for start in range(0, len(rows), batch_size):
+                    removed += session.execute_write(
+                        lambda tx, chunk: tx.run(
+                            """
+                            UNWIND $rows AS row
+                            MATCH (pos:ShelfPosition)-[r:LOCATES]->(:Book {isbn: row.isbn})
+                            WITH row, pos, r ORDER BY pos.updatedAt DESC
+                            WITH row, collect(r) AS rels, collect(pos.posId) AS ids
+                            WITH rels, coalesce(
+                                head([i IN range(0, size(ids) - 1) WHERE ids[i] = row.pos_id]), 0
+                            ) AS keep
+                            WITH [i IN range(0, size(rels) - 1) WHERE i <> keep | rels[i]] AS stale
+                            FOREACH (r IN stale | DELETE r)
+                            RETURN coalesce(sum(size(stale)), 0) AS removed
+                            """,
+                            rows=chunk,
+                        ).single()["removed"],
+                        rows[start:start + batch_size],
+                    )
+                removed += session.execute_write(
+                    lambda tx: tx.run(
+                        """
+                        MATCH (:ShelfPosition)-[r:LOCATES]->(b:Book)
+                        WHERE NOT b.isbn IN $isbns
+                        DELETE r
+                        RETURN count(r) AS removed
+                        """,
+                        isbns=list(current),
+                    ).single()["removed"]
+                )
+            else:
+                while True:
+                    done = session.execute_write(
+                        lambda tx: tx.run(
+                            """
+                            MATCH (b:Book)
+                            WHERE size([(p:ShelfPosition)-[:LOCATES]->(b) | p]) > 1
+                            WITH b LIMIT $batch_size
+                            MATCH (pos:ShelfPosition)-[r:LOCATES]->(b)
+                            WITH b, r, pos ORDER BY pos.updatedAt DESC
+                            WITH b, collect(r) AS rels
+                            FOREACH (r IN rels[1..] | DELETE r)
+                            RETURN count(b) AS books, sum(size(rels) - 1) AS removed
+                            """,
+                            batch_size=batch_size,
+                        ).single()
+                    )
+                    if not done["books"]:
+                        break
+                    removed += done["removed"]
 
-                # 直前の配置位置を取得（移動検出）
-                prev = session.run(
+            orphans = session.execute_write(
+                lambda tx: tx.run(
                     """
-                    MATCH (prev_pos:ShelfPosition)-[:LOCATES]->(b:Book {isbn: $isbn})
-                    WHERE prev_pos.posId <> $pos_id
-                    RETURN prev_pos.posId AS prevPosId
-                    LIMIT 1
-                    """,
-                    isbn=isbn,
-                    pos_id=pos_id,
-                ).single()
-
-                prev_pos_id = prev["prevPosId"] if prev else None
-
-                session.run(
+                    MATCH (pos:ShelfPosition)
+                    WHERE NOT (pos)-[:LOCATES]->()
+                    DETACH DELETE pos
+                    RETURN count(pos) AS removed
                     """
-                    // bs:PlacementEvent ノード
-                    CREATE (e:PlacementEvent {
-                        eventId:   $event_id,
-                        timestamp: datetime(),
-                        createdAt: datetime()
-                    })
-
-                    // bs:placedBook → [:PLACED_BOOK]
-                    WITH e
-                    MATCH (b:Book {isbn: $isbn})
-                    MERGE (e)-[:PLACED_BOOK]->(b)
-
-                    // bs:placedAt → [:PLACED_AT]
-                    WITH e
-                    MATCH (pos:ShelfPosition {posId: $pos_id})
-                    MERGE (e)-[:PLACED_AT]->(pos)
-                    """,
-                    event_id=event_id,
-                    isbn=isbn,
-                    pos_id=pos_id,
-                )
+                ).single()["removed"]
+            )
+        return {"locates_removed": removed, "positions_removed": orphans, **self.locates_stats()}
 
-                # bs:previousPosition → [:PREVIOUS_POSITION]（移動の場合のみ）
-                if prev_pos_id:
-                    session.run(
-                        """
-                        MATCH (e:PlacementEvent {eventId: $event_id})
-                        MATCH (prev:ShelfPosition {posId: $prev_pos_id})
-                        MERGE (e)-[:PREVIOUS_POSITION]->(prev)
-                        """,
-                        event_id=event_id,
-                        prev_pos_id=prev_pos_id,
-                    )
+    def locates_stats(self) -> dict:
+        """本ごとの LOCATES 本数（1 を超える本が無ければ位置の引き当ては1冊1行で済む）"""
+        with get_session() as session:
+            r = session.run(
+                """
+                MATCH (b:Book)
+                WITH size([(p:ShelfPosition)-[:LOCATES]->(b) | p]) AS n
+                RETURN
+                    count(CASE WHEN n > 0 THEN 1 END) AS books_located,
+                    sum(n)                             AS locates_edges,
+                    max(n)                             AS max_per_book,
+                    count(CASE WHEN n > 1 THEN 1 END) AS books_with_multiple
+                """
+            ).single()
+            positions = session.run("MATCH (pos:ShelfPosition) RETURN count(pos) AS n").single()["n"]
+        located = r["books_located"]
+        return {
+            "books_located":       located,
+            "locates_edges":       r["locates_edges"] or 0,
+            "locates_per_book":    round((r["locates_edges"] or 0) / located, 3) if located else 0.0,
+            "max_per_book":        r["max_per_book"] or 0,
+            "books_with_multiple": r["books_with_multiple"],
+            "shelf_positions":     positions,
+        }
 
     # ============================================================
     # 分析クエリ（研究目的：知識体系の広がりと成長の分析）
@@ -415,6 +812,8 @@ class BookshelfNeo4j:
         """
         1冊の本の配置変遷履歴を時系列で取得。
         「知識成長の追跡」クエリ。
+        以前の版が Neo4j に残した PlacementEvent ノードを返す。現在の変遷は
+        SQLite の配置履歴にあり、/bookshelf/history/{isbn} で合わせて返す。
         """
         with get_session() as session:
             result = session.run(
@@ -872,12 +1271,16 @@ class BookshelfNeo4j:
 _neo4j = BookshelfNeo4j()
 
 add_book_with_meaning      = _neo4j.add_book_with_meaning
+add_books_with_meaning     = _neo4j.add_books_with_meaning
 groups_from_neo4j          = _neo4j.groups_from_neo4j
 save_concept               = _neo4j.save_concept
 update_shelf_layout_chain  = _neo4j.update_shelf_layout_chain
+compact_locates            = _neo4j.compact_locates
+locates_stats              = _neo4j.locates_stats
 query_high_memory_books    = _neo4j.query_high_memory_books
 query_placement_history    = _neo4j.query_placement_history
 query_knowledge_growth     = _neo4j.query_knowledge_growth
+calc_memory_weight         = _neo4j._calc_memory_weight
 get_graph_overview         = _neo4j.get_graph_overview
 get_book_relations         = _neo4j.get_book_relations
 get_book_edges             = _neo4j.get_book_edges
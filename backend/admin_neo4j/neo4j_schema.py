@@ -0,0 +1,123 @@
+# neo4j_schema.py
+"""Neo4j の一意制約とインデックスを用意する（起動時と scripts/ensure_neo4j_schema.py から）。
+
+MERGE / MATCH のキーに制約もインデックスも無いと、毎回ラベル全体を走査することになる。
+すべて CREATE ... IF NOT EXISTS なので何度流してもよい。作成後に SHOW CONSTRAINTS /
+SHOW INDEXES で (ラベル, プロパティ) ごとに確認し、無いもの・作成中のものを報告する。
+既存データに重複があると一意制約は作れないので、その場合は failed に理由を残す。
+"""
+import logging
+
+from neo4j.exceptions import ServiceUnavailable
+
+from admin_neo4j.neo4j_driver import get_session
+
+logger = logging.getLogger(__name__)
+
+
+class Neo4jSchema:
+
+    # (名前, 種類, ラベル or リレーション型, プロパティ)
+    #   unique: ノードの一意制約（裏で RANGE インデックスも作られる）
+    #   index:  ノードの RANGE インデックス
+    #   rel_index: リレーションの RANGE インデックス
+    DEFINITIONS = [
+        ("book_isbn_unique",           "unique",    "Book",           "isbn"),
+        ("ndc_code_unique",            "unique",    "NDC",            "code"),
+        ("author_name_unique",         "unique",    "Author",         "name"),
+        ("publisher_name_unique",      "unique",    "Publisher",      "name"),
+        ("shelf_position_id_unique",   "unique",    "ShelfPosition",  "posId"),
+        ("placement_event_id_unique",  "unique",    "PlacementEvent", "eventId"),
+        ("concept_text",               "index",     "Concept",        "text"),
+        ("placement_event_timestamp",  "index",     "PlacementEvent", "timestamp"),
+        ("shelf_next_shelf_index",     "rel_index", "SHELF_NEXT",     "shelf_index"),
+    ]
+
+    _instance: "Neo4jSchema | None" = None
+
+    @classmethod
+    def get_instance(cls) -> "Neo4jSchema":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def _statement(name: str, kind: str, target: str, prop: str) -> str:
+        if kind == "unique":
+            return f"CREATE CONSTRAINT {name} IF NOT EXISTS FOR (n:{target}) REQUIRE n.{prop} IS UNIQUE"
+        if kind == "index":
+            return f"CREATE INDEX {name} IF NOT EXISTS FOR (n:{target}) ON (n.{prop})"
+        return f"CREATE INDEX {name} IF NOT EXISTS FOR ()-[r:{target}]-() ON (r.{prop})"
+
+    def ensure(self) -> dict:
+        """
+        制約・インデックスを作成してから verify() の結果を返す。
+        1つ失敗しても残りは続け、失敗したものは failed に {name: エラー} で入れる。
+        Neo4j に繋がらないときは ServiceUnavailable をそのまま投げる。
+        """
+        failed: dict[str, str] = {}
+        with get_session() as session:
+            for name, kind, target, prop in self.DEFINITIONS:
+                try:
+                    session.run(self._statement(name, kind, target, prop)).consume()
+                except ServiceUnavailable:
+                    raise   # 繋がらないなら残りを試しても同じ
+                except Exception as e:
+                    failed[name] = str(e)
+                    logger.warning(f"[neo4j-schema] {name} を作成できません: {e}")
+        report = self.verify()
+        report["failed"] = failed
+        if report["missing"] or report["pending"]:
+            logger.warning(f"[neo4j-schema] 未作成 {report['missing']} / 作成中 {report['pending']}")
+        else:
+            logger.info(f"[neo4j-schema] 制約・インデックス {len(report['present'])} 件を確認")
+        return report
+
+    def verify(self) -> dict:
+        """
+        SHOW CONSTRAINTS / SHOW INDEXES で定義ごとの有無を確かめる。名前ではなく
+        (ラベル, プロパティ) で照合するので、別名で作られた同等のものも有効とみなす。
+          present: 使える状態のもの / pending: インデックスが作成中（POPULATING）/ missing: 無いもの
+        """
+        with get_session() as session:
+            constraints = session.run(
+                "SHOW CONSTRAINTS YIELD labelsOrTypes, properties, type"
+            ).data()
+            indexes = session.run(
+                "SHOW INDEXES YIELD labelsOrTypes, properties, type, entityType, state"
+            ).data()
+
+        unique = {
+            (c["labelsOrTypes"][0], c["properties"][0])
+            for c in constraints
+            if "UNIQUE" in c["type"] and len(c["properties"] or []) == 1
+        }
+        index_state = {
+            (i["entityType"], i["labelsOrTypes"][0], i["properties"][0]): i["state"]
+            for i in indexes
+            if i["type"] == "RANGE" and i["labelsOrTypes"] and len(i["properties"] or []) == 1
+        }
+
+        present, pending, missing = [], [], []
+        for name, kind, target, prop in self.DEFINITIONS:
+            if kind == "unique":
+                if (target, prop) in unique:
+                    present.append(name)
+                else:
+                    missing.append(name)
+                continue
+            state = index_state.get(("NODE" if kind == "index" else "RELATIONSHIP", target, prop))
+            if state is None:
+                missing.append(name)
+            elif state == "ONLINE":
+                present.append(name)
+            else:
+                pending.append(name)
+        return {"present": present, "pending": pending, "missing": missing}
+
+
+# モジュールレベル互換
+_schema = Neo4jSchema.get_instance()
+
+ensure_schema = _schema.ensure
+verify_schema = _schema.verify
@@ -1,25 +1,65 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import text
 
-from database import Base, engine
+from admin_neo4j.neo4j_schema import ensure_schema
+from database import Base, SessionLocal, engine
+from models import ShelfLayout, ShelfOccupancy
 import routers.myhand as myhand_router
 import routers.knowledge_graph as knowledge_graph_router
 import routers.bookshelf as bookshelf_router
 import routers.search as search_router
 import routers.register as register_router
-from routers.search import lifespan
+from routers.search import lifespan as search_lifespan
+from utils.neo4j_sync_worker import shelf_sync_worker
+from utils.shelf_utils import rebuild_occupancy
+
+logger = logging.getLogger(__name__)
 
 # DB初期化
 Base.metadata.create_all(bind=engine)
 
-# spine_color カラムが存在しない場合に追加（既存DB向けマイグレーション）
+# 追加カラムが存在しない場合に追加（既存DB向けマイグレーション）
+_ADDED_COLUMNS = [
+    ("registered_books", "spine_color",    "VARCHAR"),
+    ("registered_books", "spine_hash",     "VARCHAR"),
+    ("shelfdesign",      "layout_version", "INTEGER NOT NULL DEFAULT 0"),
+]
 with engine.connect() as _conn:
+    for _table, _column, _type in _ADDED_COLUMNS:
+        try:
+            _conn.execute(text(f"ALTER TABLE {_table} ADD COLUMN {_column} {_type}"))
+            _conn.commit()
+        except Exception:
+            _conn.rollback()  # カラムが既に存在する場合は無視
+
+# 既存テーブルに後から追加したインデックスを作成
+for _table in Base.metadata.sorted_tables:
+    for _index in _table.indexes:
+        _index.create(bind=engine, checkfirst=True)
+
+# shelf_occupancy を追加する前の DB は、起動時に shelflayout から作る
+with SessionLocal() as _db:
+    if _db.query(ShelfLayout.id).first() and not _db.query(ShelfOccupancy.shelf_index).first():
+        rebuild_occupancy(_db)
+        _db.commit()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Neo4j の一意制約・インデックス（Neo4j が落ちていてもアプリは起動する）
     try:
-        _conn.execute(text("ALTER TABLE registered_books ADD COLUMN spine_color VARCHAR"))
-        _conn.commit()
-    except Exception:
-        pass  # カラムが既に存在する場合は無視
+        await asyncio.to_thread(ensure_schema)
+    except Exception as e:
+        logger.warning(f"Neo4j のスキーマを確認できません: {e}")
+    async with search_lifespan(app):
+        yield
+    # 未反映の本棚配置を Neo4j に書き出してから終了する
+    await asyncio.to_thread(shelf_sync_worker.stop)
+
 
 app = FastAPI(lifespan=lifespan)
 
@@ -30,6 +70,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # ルータ登録
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, LargeBinary, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -56,6 +56,25 @@ class ShelfLayout(Base):
 
     order_index = Column(Integer, nullable=False, default=0)
 
+    # 段ごとの範囲取得（/bookshelf/?from_shelf=&to_shelf=）と段ごとの集計用
+    __table_args__ = (
+        Index("ix_shelflayout_shelf_index_x_pos", "shelf_index", "x_pos"),
+    )
+
+class ShelfOccupancy(Base):
+    """
+    段ごとの占有状況（本のある段だけ）。1冊配置で空きのある最初の段を
+    shelflayout を全件読まずに探すための索引で、配置を変える書き込みと同じ
+    トランザクションで更新する。free_px は「次に置ける位置から右枠までの幅」。
+    """
+    __tablename__ = "shelf_occupancy"
+
+    shelf_index = Column(Integer, primary_key=True, autoincrement=False)
+    next_x      = Column(Integer, nullable=False)   # 右端の本の右 + 隙間
+    count       = Column(Integer, nullable=False, default=0)
+    free_px     = Column(Integer, nullable=False, index=True)
+
+
 class RegisteredBook(Base):
     """背表紙画像とNDL書誌情報を紐づけて保存するテーブル"""
     __tablename__ = "registered_books"
@@ -70,15 +89,52 @@ class RegisteredBook(Base):
     pages          = Column(Integer, default=200)
     height_mm      = Column(Integer, default=180)
     size_label     = Column(String)
-    spine_image    = Column(String)        # ローカル背表紙画像パス (/spine_image/{isbn}.jpg)
+    spine_image    = Column(String)        # ローカル背表紙画像パス (/spine_image/{sha256}.{ext}、内容アドレス。以前の登録分は {isbn}.jpg)
     spine_color    = Column(String)        # 背表紙の代表色 "R,G,B"
+    spine_hash     = Column(String)        # 背表紙画像の知覚ハッシュ (pHash, 16進)
     cover          = Column(String)        # NDL/Google Books の書影URL
     description    = Column(String)
     registered_at  = Column(DateTime, server_default=func.now())
 
+    # /register/list のキーセットページネーション用（registered_at, id の降順をそのまま読む）。
+    # ndc の方は前方一致の範囲絞り込みにだけ使い、その場合の並べ替えはソートになる
+    __table_args__ = (
+        Index("ix_registered_books_registered_at_id", "registered_at", "id"),
+        Index("ix_registered_books_ndc_registered_at_id", "ndc", "registered_at", "id"),
+        Index(
+            "ix_registered_books_spine_registered_at_id", "registered_at", "id",
+            sqlite_where=spine_image.isnot(None),
+        ),
+    )
+
 
 class ShelfDesign(Base):
     __tablename__ = "shelfdesign"
     id = Column(Integer, primary_key=True, index=True)
     shelf_size = Column(Integer)
-    total_shelves = Column(Integer)
\ No newline at end of file
+    total_shelves = Column(Integer)
+    layout_version = Column(Integer, nullable=False, default=0)   # 配置が変わるたびに +1
+
+
+class ShelfLayoutChange(Base):
+    """配置の変更ログ（version ごとの move / insert / remove 操作）。/bookshelf/changes の差分配信用"""
+    __tablename__ = "shelf_layout_changes"
+
+    id         = Column(Integer, primary_key=True, autoincrement=True)
+    version    = Column(Integer, unique=True, index=True, nullable=False)
+    ops        = Column(Text, nullable=False)   # JSON 配列
+    created_at = Column(DateTime, server_default=func.now())
+
+
+class ShelfLayoutHistory(Base):
+    """
+    配置の長期履歴。version ごとに「動いた本だけ」の差分を zlib 圧縮して保存し、
+    一定間隔で全体のチェックポイントを挟む（任意時点の棚を復元するため）。
+    """
+    __tablename__ = "shelf_layout_history"
+
+    id            = Column(Integer, primary_key=True, autoincrement=True)
+    version       = Column(Integer, unique=True, nullable=False)
+    created_at    = Column(DateTime, nullable=False, server_default=func.now(), index=True)   # UTC（shelf_layout_changes と同じ）
+    is_checkpoint = Column(Boolean, nullable=False, default=False)
+    data          = Column(LargeBinary, nullable=False)   # zlib(JSON)
@@ -1,11 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
-from typing import List
+from typing import List, Literal
 from models import ShelfLayout, ShelfDesign, RegisteredBook
 from sqlalchemy.orm import Session
 from database import get_db
-from admin_neo4j.neo4j_driver import get_session
-from admin_neo4j.neo4j_crud import update_shelf_layout_chain, save_concept
+from admin_neo4j.neo4j_crud import calc_memory_weight, locates_stats, query_placement_history, save_concept
+from utils.neo4j_sync_worker import shelf_sync_worker
+from utils.shelf_read_model import shelf_read_model
+from utils.shelf_broadcast import shelf_broadcaster
+from utils.shelf_changes import (
+    LayoutVersionConflict, current_layout_version, record_layout_change, layout_changes_since,
+)
+from utils.layout_history import layout_state_at, placement_events
+from utils.shelf_utils import refresh_occupancy
+from utils.shelf_kernel import shelf_x_positions, spine_widths
+from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,7 +35,9 @@ def add_shelves(db: Session = Depends(get_db)):
         db.add(design)
     else:
         design.total_shelves += 1
+    version = record_layout_change(db, [{"op": "shelves", "total_shelves": design.total_shelves}])
     db.commit()
+    shelf_read_model.set_total_shelves(design.total_shelves, version)
     return {"total_shelves": design.total_shelves}
 
 
@@ -45,8 +58,10 @@ def remove_shelves(db: Session = Depends(get_db)):
         raise HTTPException(status_code=400, detail="一番下の段に本があるため削除できません")
 
     design.total_shelves -= 1
+    version = record_layout_change(db, [{"op": "shelves", "total_shelves": design.total_shelves}])
     db.commit()
-    
+    shelf_read_model.set_total_shelves(design.total_shelves, version)
+
     return {"total_shelves": design.total_shelves}
 
 FRAME     = 20   # 棚の左右フレーム幅（フロントと合わせる）
@@ -59,94 +74,349 @@ class BookPosition(BaseModel):
     order_index: int = 0  # 互換性のため残す
 
 class SyncLayoutRequest(BaseModel):
-    layout: List[BookPosition]
+    layout:       List[BookPosition]
+    base_version: int | None = None   # 指定すると、最新でなければ 409 を返す
 
+class LayoutOp(BaseModel):
+    op:          Literal["move", "insert", "remove"]
+    isbn:        str
+    shelf_index: int | None = None
+    x_pos:       float | None = 0
+    order_index: int = 0
 
+class LayoutDeltaRequest(BaseModel):
+    base_version: int
+    ops:          List[LayoutOp]
 
-@router.get("/")
-def fetch_bookshelf(db: Session = Depends(get_db)):
-    design = db.query(ShelfDesign).first()
-    if not design:
-        design = ShelfDesign(total_shelves=1)
-        db.add(design)
-        db.commit()
 
-    layouts = db.query(ShelfLayout)\
-        .order_by(ShelfLayout.shelf_index, ShelfLayout.x_pos)\
-        .all()
-
-    if not layouts:
-        return {"shelves": [], "total_shelves": design.total_shelves}
-
-    layout_map = {l.isbn: l for l in layouts}
-
-    title_map: dict[str, str] = {}
-    with get_session() as session:
-        result = session.run(
-            "MATCH (b:Book) WHERE b.isbn IN $isbns RETURN b.isbn AS isbn, b.title AS title",
-            isbns=list(layout_map.keys())
-        )
-        for r in result:
-            title_map[r["isbn"]] = r["title"]
-
-    reg_books = db.query(RegisteredBook).filter(RegisteredBook.isbn.in_(list(layout_map.keys()))).all()
-    spine_map = {rb.isbn: rb.spine_image for rb in reg_books}
-    ndc_map = {rb.isbn: rb.ndc for rb in reg_books}
-
-    shelves: dict[int, list] = {}
-    for l in layouts:
-        shelves.setdefault(l.shelf_index, []).append({
-            "isbn":            l.isbn,
-            "title":           title_map.get(l.isbn, ""),
-            "cover":           l.cover,
-            "spine_image":     spine_map.get(l.isbn),
-            "size_label":      l.size_label,
-            "shelf_index":     l.shelf_index,
-            "x_pos":           l.x_pos,
-            "order_index":     l.order_index,
-            "pages":           l.pages,
-            "height_mm":       l.height_mm,
-            "ndc":             ndc_map.get(l.isbn),
+@router.get("/")
+def fetch_bookshelf(
+    from_shelf: int | None = Query(None, ge=0, description="この段から（含む）"),
+    to_shelf:   int | None = Query(None, ge=0, description="この段まで（含む）"),
+    x_from:     float | None = Query(None, description="横方向の表示範囲の左端(px)"),
+    x_to:       float | None = Query(None, description="横方向の表示範囲の右端(px)"),
+    db: Session = Depends(get_db),
+):
+    """
+    本棚を返す。範囲の指定が無ければ全体を、shelflayout と registered_books を
+    1回の JOIN で読んだリードモデル（シリアライズ済み）から返す。
+    from_shelf / to_shelf / x_from / x_to を指定すると、画面に見えている段・範囲の
+    本だけを返す（大きな蔵書で画面外の段を遅延取得するため）。Neo4j には問い合わせない。
+    """
+    if from_shelf is None and to_shelf is None and x_from is None and x_to is None:
+        return Response(content=shelf_read_model.get_payload(db), media_type="application/json")
+
+    from_shelf = from_shelf or 0
+    if to_shelf is not None and to_shelf < from_shelf:
+        raise HTTPException(status_code=400, detail="to_shelf must be >= from_shelf")
+    return shelf_read_model.get_range(db, from_shelf, to_shelf, x_from, x_to)
+
+
+@router.get("/summary")
+def fetch_bookshelf_summary(db: Session = Depends(get_db)):
+    """段ごとの冊数・使用幅・空き幅だけを返す軽量版（仮想スクロールの高さ計算用）"""
+    return shelf_read_model.get_summary(db, SHELF_MAX_WIDTH_PX, FRAME, SPINE_GAP)
+
+
+def _diff_layout(db: Session, layout: List[BookPosition]) -> tuple[list[dict], set[int]]:
+    """
+    受け取った配置を保存済みの配置と比べ、変わった行だけを返す。
+    返り値は (bulk_update_mappings 用の行, 変更前後で関係する段番号)。
+    """
+    incoming = {pos.isbn: pos for pos in layout}
+    stored   = db.query(
+        ShelfLayout.id, ShelfLayout.isbn, ShelfLayout.shelf_index,
+        ShelfLayout.x_pos, ShelfLayout.order_index,
+    ).filter(ShelfLayout.isbn.in_(list(incoming))).all()
+
+    changed:  list[dict] = []
+    affected: set[int]   = set()
+    for row in stored:
+        pos   = incoming[row.isbn]
+        x_pos = round(pos.x_pos or 0, 2)
+        if (row.shelf_index, row.x_pos, row.order_index) == (pos.shelf_index, x_pos, pos.order_index):
+            continue
+        changed.append({
+            "id":          row.id,
+            "isbn":        row.isbn,
+            "shelf_index": pos.shelf_index,
+            "x_pos":       x_pos,
+            "order_index": pos.order_index,
         })
+        affected.update((row.shelf_index, pos.shelf_index))
+    return changed, affected
+
+
+def _version_conflict(db: Session, base_version: int) -> HTTPException:
+    current = current_layout_version(db)
+    return HTTPException(status_code=409, detail={
+        "message":         "配置が他で更新されています",
+        "current_version": current,
+        "changes":         layout_changes_since(db, base_version),   # None なら全体を取り直す
+    })
+
+
+def _check_base_version(db: Session, base_version: int | None) -> None:
+    """
+    別のタブ・端末が先に書き込んでいたら、足りない差分を付けて 409 を返す。
+    ここは早めに断るための確認で、最終的な判定は record_layout_change(expected_version=...)
+    の条件付き UPDATE（同時に通った2つ目はそこで LayoutVersionConflict → 409）。
+    """
+    if base_version is None:
+        return
+    if base_version != current_layout_version(db):
+        raise _version_conflict(db, base_version)
+
+
+def _forward_to_neo4j(
+    db: Session, affected: set[int], moved_isbns: list[str], removed_isbns: list[str] = (),
+) -> None:
+    """
+    SHELF_NEXT・端判定は段単位で決まるので、関係する段の本を丸ごと write-behind ワーカーに渡す。
+    棚から外した本は removed_isbns で渡す（Neo4j 側で LOCATES を外す）。
+    """
+    if not affected and not removed_isbns:
+        return
+    shelf_rows = db.query(
+        ShelfLayout.isbn, ShelfLayout.shelf_index, ShelfLayout.x_pos,
+        ShelfLayout.order_index, ShelfLayout.pages,
+    ).filter(ShelfLayout.shelf_index.in_(affected)).all()
+    neo4j_payload = [
+        {
+            "isbn":        r.isbn,
+            "shelf_index": r.shelf_index,
+            "x_pos":       r.x_pos,
+            "order_index": r.order_index,
+            "pages":       r.pages or 200,
+        }
+        for r in shelf_rows
+    ]
+    shelf_sync_worker.submit(
+        neo4j_payload, changed_isbns=moved_isbns, removed_isbns=removed_isbns, shelves=sorted(affected),
+    )
 
-    return {
-        "shelves":       [{"shelf_index": k, "books": v} for k, v in sorted(shelves.items())],
-        "total_shelves": design.total_shelves,
-    }
+
+def _move_op(row: dict) -> dict:
+    return {"op": "move", **{k: row[k] for k in ("isbn", "shelf_index", "x_pos", "order_index")}}
 
 
 @router.post("/sync-layout")
-async def sync_layout(body: SyncLayoutRequest, db: Session = Depends(get_db)):
+def sync_layout(body: SyncLayoutRequest, db: Session = Depends(get_db)):
+    """
+    ドラッグ後の配置を保存する。フロントは棚全体を送ってくるので、
+    保存済みの配置と比べて変わった本だけを1回の bulk update で書き込み、
+    Neo4j には変更のあった段の分だけを write-behind ワーカー経由で送る
+    （SQLite の commit でレスポンスを返し、グラフ反映は裏で行う）。
+    """
+    _check_base_version(db, body.base_version)
     try:
-        for pos in body.layout:
-            db.query(ShelfLayout)\
-                .filter(ShelfLayout.isbn == pos.isbn)\
-                .update({
-                    "shelf_index": pos.shelf_index,
-                    "x_pos":       round(pos.x_pos, 2),
-                    "order_index": pos.order_index,
-                }, synchronize_session=False)
+        changed, affected = _diff_layout(db, body.layout)
+        if not changed:
+            return {"status": "success", "changed": 0, "version": current_layout_version(db)}
 
+        db.bulk_update_mappings(ShelfLayout, changed)
+        refresh_occupancy(db, affected)
+        version = record_layout_change(db, [_move_op(c) for c in changed], expected_version=body.base_version)
         db.commit()
+        shelf_read_model.apply_positions(changed, version)
 
-        isbns = [pos.isbn for pos in body.layout]
-        pages_map = {
-            r.isbn: r.pages
-            for r in db.query(ShelfLayout).filter(ShelfLayout.isbn.in_(isbns)).all()
-        }
-        neo4j_payload = [
-            {**pos.model_dump(), "pages": pages_map.get(pos.isbn, 200)}
-            for pos in body.layout
-        ]
-        update_shelf_layout_chain(neo4j_payload)
+        _forward_to_neo4j(db, affected, [c["isbn"] for c in changed])
 
-        return {"status": "success"}
+        return {"status": "success", "changed": len(changed), "version": version}
+    except LayoutVersionConflict:
+        db.rollback()
+        raise _version_conflict(db, body.base_version)
     except Exception as e:
         import traceback
         traceback.print_exc()
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.post("/layout-delta")
+def apply_layout_delta(body: LayoutDeltaRequest, db: Session = Depends(get_db)):
+    """
+    base_version に対する move / insert / remove の操作列を適用する。
+    base_version が最新でなければ何も書かずに 409（足りない差分付き）を返す。
+    """
+    _check_base_version(db, body.base_version)
+
+    isbns  = {op.isbn for op in body.ops}
+    stored = {
+        r.isbn: r for r in db.query(ShelfLayout.id, ShelfLayout.isbn, ShelfLayout.shelf_index)
+        .filter(ShelfLayout.isbn.in_(isbns)).all()
+    }
+    registered = {
+        b.isbn: b for b in db.query(RegisteredBook)
+        .filter(RegisteredBook.isbn.in_([op.isbn for op in body.ops if op.op == "insert"])).all()
+    }
+
+    updates:  dict[str, dict] = {}
+    inserts:  dict[str, dict] = {}
+    removes:  set[str]        = set()
+    affected: set[int]        = set()
+    for op in body.ops:
+        on_shelf = op.isbn in inserts or (op.isbn in stored and op.isbn not in removes)
+        if op.op != "remove" and op.shelf_index is None:
+            raise HTTPException(status_code=400, detail=f"shelf_index is required: {op.isbn}")
+        if op.op in ("move", "remove") and not on_shelf:
+            raise HTTPException(status_code=404, detail=f"本が棚にありません: {op.isbn}")
+        if op.op == "insert" and on_shelf:
+            raise HTTPException(status_code=400, detail=f"本は既に棚にあります: {op.isbn}")
+
+        position = {
+            "shelf_index": op.shelf_index,
+            "x_pos":       round(op.x_pos or 0, 2),
+            "order_index": op.order_index,
+        }
+        if op.op == "remove":
+            inserts.pop(op.isbn, None)
+            updates.pop(op.isbn, None)
+            if op.isbn in stored:
+                removes.add(op.isbn)
+                affected.add(stored[op.isbn].shelf_index)
+        elif op.op == "insert":
+            book = registered.get(op.isbn)
+            if not book:
+                raise HTTPException(status_code=404, detail=f"未登録の本です: {op.isbn}")
+            inserts[op.isbn] = {
+                "isbn":       op.isbn,
+                "height_mm":  book.height_mm,
+                "pages":      book.pages,
+                "cover":      book.cover,
+                "size_label": book.size_label,
+                **position,
+            }
+            affected.add(op.shelf_index)
+        elif op.isbn in inserts:
+            inserts[op.isbn].update(position)
+            affected.add(op.shelf_index)
+        else:
+            updates[op.isbn] = {"id": stored[op.isbn].id, "isbn": op.isbn, **position}
+            affected.update((stored[op.isbn].shelf_index, op.shelf_index))
+
+    # 同じ本を削除→再挿入した場合は、既存行を消してから入れ直す
+    try:
+        if removes:
+            db.query(ShelfLayout).filter(ShelfLayout.isbn.in_(removes)).delete(synchronize_session=False)
+        if updates:
+            db.bulk_update_mappings(ShelfLayout, list(updates.values()))
+        if inserts:
+            db.bulk_insert_mappings(ShelfLayout, list(inserts.values()))
+        refresh_occupancy(db, affected)
+        version = record_layout_change(db, [
+            {"op": "remove", "isbn": op.isbn} if op.op == "remove"
+            else {**op.model_dump(), "x_pos": round(op.x_pos or 0, 2)}
+            for op in body.ops
+        ], expected_version=body.base_version)
+        db.commit()
+    except LayoutVersionConflict:
+        db.rollback()
+        raise _version_conflict(db, body.base_version)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"[layout-delta] 適用エラー: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    shelf_read_model.apply_positions(updates.values(), version)
+    if inserts or removes:
+        shelf_read_model.refresh_books(db, set(inserts) | removes)
+
+    _forward_to_neo4j(db, affected, list(updates) + list(inserts), list(removes - set(inserts)))
+    return {"status": "success", "version": version}
+
+
+@router.get("/changes")
+def layout_changes(since: int = Query(..., ge=0), db: Session = Depends(get_db)):
+    """
+    version since より後の配置変更を返す。クライアントはこれを順に適用すれば追いつける。
+    履歴が残っていない場合は reset: true（/bookshelf/ を取り直す）。
+    """
+    current = current_layout_version(db)
+    changes = layout_changes_since(db, since)
+    if changes is None:
+        return {"version": current, "reset": True, "changes": []}
+    return {"version": current, "reset": False, "changes": changes}
+
+
+@router.get("/history")
+def layout_history(
+    at:      datetime | None = Query(None, description="この時刻の棚を復元する（ISO 8601。タイムゾーンが無ければ UTC）"),
+    version: int | None      = Query(None, ge=0, description="この version の棚を復元する"),
+    db: Session = Depends(get_db),
+):
+    """配置履歴から任意の時点の棚を復元する（タイムトラベル）。省略時は最新。"""
+    state = layout_state_at(db, at=at, version=version)
+    if state is None:
+        raise HTTPException(status_code=404, detail="その時点の配置履歴がありません")
+    return state
+
+
+@router.get("/history/{isbn}")
+def placement_history(isbn: str, db: Session = Depends(get_db)):
+    """
+    1冊の配置変遷を時系列で返す（「知識成長の追跡」）。
+    SQLite の配置履歴から復元したものに、以前の版が Neo4j に残した PlacementEvent を前に足す。
+    """
+    try:
+        legacy = query_placement_history(isbn)
+        for e in legacy:
+            if hasattr(e["timestamp"], "iso_format"):   # neo4j.time.DateTime
+                e["timestamp"] = e["timestamp"].iso_format()
+    except Exception as e:
+        logger.warning(f"PlacementEvent の取得に失敗: {e}")
+        legacy = []
+
+    events = []
+    prev_weight = None
+    for e in placement_events(isbn, db):
+        to_weight = calc_memory_weight(e["shelf_index"], e["is_edge"], e["is_isolated"])
+        events.append({
+            "event":         f"v{e['version']}_{isbn}",
+            "timestamp":     e["timestamp"].isoformat(),
+            "to_position":   f"pos_r{e['shelf_index']}_c{e['order_index']}",
+            "to_weight":     to_weight,
+            "from_position": (
+                f"pos_r{e['from']['shelf_index']}_c{e['from']['order_index']}" if e["from"] else None
+            ),
+            "from_weight":   prev_weight if e["from"] else None,
+        })
+        prev_weight = to_weight
+    return legacy + events
+
+
+@router.get("/sync-status")
+def sync_status(graph: bool = Query(False, description="Neo4j の LOCATES 本数（本ごと）も返す")):
+    """Neo4j への配置反映の遅れ（未反映の冊数・経過秒数・再試行回数など）"""
+    stats = shelf_sync_worker.stats()
+    if graph:
+        try:
+            stats["graph"] = locates_stats()
+        except Exception as e:
+            logger.warning(f"LOCATES の集計に失敗: {e}")
+            stats["graph"] = {"error": str(e)}
+    return stats
+
+
+@router.websocket("/ws")
+async def shelf_updates(ws: WebSocket):
+    """
+    配置の変更（isbn, shelf_index, x_pos の差分）を push する。
+    送信が追いつかない場合は途中の状態を飛ばして最新の位置だけを送る。
+    """
+    await ws.accept()
+    client = shelf_broadcaster.connect()
+    sender = asyncio.create_task(client.pump(ws))
+    try:
+        while True:
+            await ws.receive_text()   # クライアントからの受信は使わない（切断検知のため）
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        shelf_broadcaster.disconnect(client)
+
+
 class SaveConceptRequest(BaseModel):
     meaning: str
     isbns: List[str]
@@ -157,8 +427,13 @@ def remove_book_from_shelf(isbn: str, db: Session = Depends(get_db)):
     layout = db.query(ShelfLayout).filter(ShelfLayout.isbn == isbn).first()
     if not layout:
         raise HTTPException(status_code=404, detail="本が見つかりません")
+    shelf_index = layout.shelf_index
     db.delete(layout)
+    refresh_occupancy(db, [shelf_index])
+    version = record_layout_change(db, [{"op": "remove", "isbn": isbn}])
     db.commit()
+    shelf_read_model.remove(isbn, version)
+    _forward_to_neo4j(db, {shelf_index}, [], [isbn])
     return {"status": "deleted", "isbn": isbn}
 
 
@@ -174,17 +449,27 @@ def save_concept_endpoint(body: SaveConceptRequest):
 
 @router.post("/migrate-x-pos")
 def migrate_x_pos(db: Session = Depends(get_db)):
-    """order_index → x_pos への一回限りのマイグレーション"""
-    layouts = db.query(ShelfLayout)\
-        .order_by(ShelfLayout.shelf_index, ShelfLayout.order_index)\
-        .all()
-    shelves: dict[int, list] = {}
-    for l in layouts:
-        shelves.setdefault(l.shelf_index, []).append(l)
-    for shelf_books in shelves.values():
-        acc = FRAME
-        for book in shelf_books:
-            book.x_pos = acc
-            acc += book.spine_width_px + SPINE_GAP
+    """order_index → x_pos への一回限りのマイグレーション（段ごとに背幅 + 隙間で左から詰める）"""
+    layouts = db.query(
+        ShelfLayout.id, ShelfLayout.isbn, ShelfLayout.shelf_index,
+        ShelfLayout.x_pos, ShelfLayout.order_index, ShelfLayout.pages,
+    ).order_by(ShelfLayout.shelf_index, ShelfLayout.order_index).all()
+
+    shelf_index = np.array([l.shelf_index for l in layouts], dtype=np.int64)
+    x_pos       = shelf_x_positions(shelf_index, spine_widths(l.pages for l in layouts), FRAME, SPINE_GAP)
+    changed = [
+        {"id": l.id, "isbn": l.isbn, "shelf_index": l.shelf_index, "x_pos": x, "order_index": l.order_index}
+        for l, x in zip(layouts, x_pos.tolist())
+        if l.x_pos != x
+    ]
+    if not changed:
+        return {"status": "migrated", "changed": 0}
+
+    affected = {c["shelf_index"] for c in changed}
+    db.bulk_update_mappings(ShelfLayout, changed)
+    refresh_occupancy(db, affected)
+    version = record_layout_change(db, [_move_op(c) for c in changed])
     db.commit()
-    return {"status": "migrated"}
\ No newline at end of file
+    shelf_read_model.apply_positions(changed, version)
+    _forward_to_neo4j(db, affected, [c["isbn"] for c in changed])
+    return {"status": "migrated", "changed": len(changed)}
\ No newline at end of file
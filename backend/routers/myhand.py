@@ -3,9 +3,13 @@ from schemas import AddFromHandRequest
 from sqlalchemy.orm import Session
 from database import get_db
 from models import MyHand, RegisteredBook
-from admin_neo4j.neo4j_crud import add_book_with_meaning
+from admin_neo4j.neo4j_crud import add_book_with_meaning, add_books_with_meaning
+import logging
 
-from utils.shelf_utils import add_to_shelf
+from utils.shelf_utils import add_many_to_shelf
+from utils.shelf_read_model import shelf_read_model
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/books", tags=["books"])
 
@@ -56,46 +60,63 @@ def add_to_hand(
     return {"message": "added", "isbn": isbn}
 
 @router.post("/add_from_hand")
-async def add_from_hand(
+def add_from_hand(
     req: AddFromHandRequest,
     db: Session = Depends(get_db)
 ):
     if not req.isbns:
         raise HTTPException(status_code=400, detail="No books selected")
 
-    added, skipped = [], []
-
-    for isbn in req.isbns:
-        hand_book = _myhand_by_isbn(isbn, db)
-        if not hand_book:
-            skipped.append(isbn)
-            continue
-
-        reg_book = hand_book.book  # RegisteredBook オブジェクト
-
-        try:
-            add_book_with_meaning(reg_book)
-        except Exception as e:
-            print(f"Neo4j保存エラー [{isbn}]: {e}")
-            skipped.append(isbn)
-            continue
-
-        success = add_to_shelf(db, reg_book)
-        if not success:
-            print(f"警告: Neo4j保存済みだがSQL保存失敗 [{isbn}]")
-            skipped.append(isbn)
-            continue
-
-        db.delete(hand_book)
-        try:
-            db.commit()
-            added.append(isbn)
-        except Exception as e:
-            db.rollback()
-            print(f"コミットエラー [{isbn}]: {e}")
-            skipped.append(isbn)
-
-    return {"message": "Success", "added": added, "skipped": skipped}
+    # 手元の本を1回の JOIN でまとめて引く
+    hand_books = {
+        hand.book.isbn: hand
+        for hand in db.query(MyHand)
+        .join(RegisteredBook, MyHand.registered_book_id == RegisteredBook.id)
+        .filter(RegisteredBook.isbn.in_(req.isbns))
+        .all()
+    }
+    targets = [hand_books[isbn] for isbn in dict.fromkeys(req.isbns) if isbn in hand_books]
+    skipped = [isbn for isbn in req.isbns if isbn not in hand_books]
+    if not targets:
+        return {"message": "Success", "added": [], "skipped": skipped}
+
+    reg_books = [hand.book for hand in targets]
+
+    # まとめて保存し、失敗したら1冊ずつやり直して保存できなかった本だけ外す
+    try:
+        add_books_with_meaning(reg_books)
+    except Exception as e:
+        logger.error(f"Neo4j保存エラー ({len(reg_books)}冊): {e} → 1冊ずつ再試行")
+        saved = []
+        for book in reg_books:
+            try:
+                add_book_with_meaning(book)
+                saved.append(book)
+            except Exception as e:
+                logger.error(f"Neo4j保存エラー ({book.isbn}): {e}")
+                skipped.append(book.isbn)
+        if not saved:
+            return {"message": "Success", "added": [], "skipped": skipped}
+        saved_set = {b.isbn for b in saved}
+        targets   = [hand for hand in targets if hand.book.isbn in saved_set]
+        reg_books = saved
+
+    # 配置・手元からの削除・変更ログを1トランザクションで
+    try:
+        placed = add_many_to_shelf(db, reg_books)
+        placed_set = set(placed)
+        for hand in targets:
+            if hand.book.isbn in placed_set:
+                db.delete(hand)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"コミットエラー ({len(reg_books)}冊): {e}")
+        return {"message": "Success", "added": [], "skipped": skipped + [b.isbn for b in reg_books]}
+
+    shelf_read_model.refresh_books(db, placed)
+    skipped += [b.isbn for b in reg_books if b.isbn not in placed_set]
+    return {"message": "Success", "added": placed, "skipped": skipped}
 
 
 @router.delete("/remove_from_hand/{isbn}")
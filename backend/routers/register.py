@@ -1,14 +1,25 @@
 import re
+import io
+import csv
 import json
+import base64
+import asyncio
+import logging
 from pathlib import Path
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Query
 from fastapi.responses import Response
+from sqlalchemy import String, and_, or_, type_coerce
 from sqlalchemy.orm import Session
 from lxml import etree
 
 from database import get_db
 from models import MyHand, RegisteredBook
+from schemas import BulkImportRequest
 from utils.llm_provider import get_llm_client
+from utils.spine_color import extract_dominant_color
+from utils.image_hash import phash, to_hex, spine_hash_index
+from utils.shelf_read_model import shelf_read_model
+from utils.upload_store import StagedUpload, stage_upload, commit_to_store
 from routers.search import (
     get_http_client,
     _extract_ndc_from_bib,
@@ -16,15 +27,19 @@ from routers.search import (
     _isbn10_to_13,
     NDL_TIMEOUT,
     fetch_openbd_descriptions,
-    fetch_google_description,
+    fetch_google_volume,
 )
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/register", tags=["register"])
 
 NDL_SRU_URL     = "https://ndlsearch.ndl.go.jp/api/sru"
 SPINE_IMAGE_DIR = (
     Path(__file__).parent.parent.parent / "frontend" / "public" / "spine_image"
 )
+# 受信途中・登録前の画像は公開ディレクトリ（frontend/public）の外に置く
+SPINE_STAGING_DIR = Path(__file__).parent.parent / ".upload_staging"
 
 BIB_NS = {
     "rdf":    "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
@@ -35,6 +50,14 @@ BIB_NS = {
 }
 SRW_NS = {"srw": "http://www.loc.gov/zing/srw/"}
 
+# プロンプトを変えたら ISBN_PROMPT_VERSION も上げる（Vision 応答キャッシュのキーに含まれる）
+ISBN_PROMPT = (
+    "この本の背表紙の画像からISBNコードを抽出してください。"
+    "ISBNコードのみを返してください（数字とハイフンのみ）。"
+    "見つからない場合は NOT_FOUND とだけ返してください。"
+)
+ISBN_PROMPT_VERSION = "isbn-v1"
+
 
 # ============================================================
 # 書籍登録サービス
@@ -42,10 +65,52 @@ SRW_NS = {"srw": "http://www.loc.gov/zing/srw/"}
 
 class BookRegistrationService:
 
-    async def fetch_ndl_by_isbn(self, isbn: str) -> dict | None:
-        """search.py と同じ SRU API + パース方法で書誌情報を取得"""
-        clean = re.sub(r"[^0-9X]", "", isbn.upper())
+    # 書誌情報の取得元。全ソースを同時に問い合わせ、必須ソースが返った時点で
+    # それまでに返ってきた結果だけをマージする（間に合わない任意ソースは無視して部分結果を返す）
+    SOURCE_DEADLINES = {
+        "ndl":    10.0,
+        "openbd":  3.0,
+        "google":  3.0,
+    }
+    # 必須ソース。失敗・締め切り超過はそのままエラーにし、書誌が無ければ見つからない扱い
+    REQUIRED_SOURCES = ("ndl",)
+    # 同じフィールドを複数ソースが返した場合は、この順で先にあるソースの値を採用する
+    SOURCE_PRIORITY = ("ndl", "openbd", "google")
+
+    def __init__(self, source_priority: tuple[str, ...] | None = None,
+                 source_deadlines: dict[str, float] | None = None):
+        self.source_priority  = source_priority or self.SOURCE_PRIORITY
+        self.source_deadlines = {**self.SOURCE_DEADLINES, **(source_deadlines or {})}
+
+    @staticmethod
+    def _parse_bib(bib) -> dict:
+        """dcndl:BibResource ノードから登録用のフィールドを取り出す"""
+        title = bib.xpath("dcterms:title/text()", namespaces=BIB_NS)
+        if not title:
+            title = bib.xpath("dc:title//rdf:value/text()", namespaces=BIB_NS)
+
+        creators      = bib.xpath("dc:creator/text()",                       namespaces=BIB_NS)
+        publisher     = bib.xpath("dcterms:publisher//foaf:name/text()",     namespaces=BIB_NS)
+        issued        = bib.xpath("dcterms:issued/text()",                   namespaces=BIB_NS)
+        extent        = bib.xpath("dcterms:extent/text()",                   namespaces=BIB_NS)
+
+        ndc              = _extract_ndc_from_bib(bib, BIB_NS)
+        pages, height_mm = _extract_extent(extent)
+
+        return {
+            "title":          title[0] if title else None,
+            "authors":        ",".join(creators),
+            "publisher":      publisher[0] if publisher else None,
+            "published_year": issued[0] if issued else None,
+            "ndc_full":       ndc,
+            "pages":          pages,
+            "height_mm":      height_mm,
+        }
 
+    # ── 各ソース ────────────────────────────────────────────
+
+    async def _source_ndl(self, clean: str) -> dict | None:
+        """search.py と同じ SRU API + パース方法で書誌情報を取得"""
         params = {
             "operation":      "searchRetrieve",
             "query":          f'isbn="{clean}"',
@@ -71,65 +136,111 @@ class BookRegistrationService:
         if not bib_list:
             return None
 
-        bib = bib_list[0]
+        return self._parse_bib(bib_list[0])
 
-        title = bib.xpath("dcterms:title/text()", namespaces=BIB_NS)
-        if not title:
-            title = bib.xpath("dc:title//rdf:value/text()", namespaces=BIB_NS)
+    async def _source_openbd(self, isbn13: str) -> dict | None:
+        openbd      = await fetch_openbd_descriptions([isbn13])
+        description = openbd.get(isbn13)
+        return {"description": description} if description else None
 
-        creators      = bib.xpath("dc:creator/text()",                       namespaces=BIB_NS)
-        publisher     = bib.xpath("dcterms:publisher//foaf:name/text()",     namespaces=BIB_NS)
-        issued        = bib.xpath("dcterms:issued/text()",                   namespaces=BIB_NS)
-        subjects      = bib.xpath("dc:subject/text()",                       namespaces=BIB_NS)
-        extent        = bib.xpath("dcterms:extent/text()",                   namespaces=BIB_NS)
+    async def _source_google(self, isbn13: str) -> dict | None:
+        volume = await fetch_google_volume(isbn13)
+        if not volume:
+            return None
+        title = volume.get("title")
+        if title and volume.get("subtitle"):
+            title = f"{title} : {volume['subtitle']}"
+        return {
+            "title":          title,
+            "authors":        ",".join(volume.get("authors") or []),
+            "publisher":      volume.get("publisher"),
+            "published_year": volume.get("publishedDate"),
+            "pages":          volume.get("pageCount"),
+            "description":    volume.get("description"),
+        }
 
-        ndc              = _extract_ndc_from_bib(bib, BIB_NS)
-        pages, height_mm = _extract_extent(extent)
+    async def _run_source(self, name: str, coro) -> dict | None:
+        """任意ソースの失敗は None（ログのみ）、必須ソースの失敗は HTTPException にする。"""
+        required = name in self.REQUIRED_SOURCES
+        deadline = self.source_deadlines[name]
+        try:
+            return await asyncio.wait_for(coro, timeout=deadline)
+        except asyncio.TimeoutError:
+            if required:
+                raise HTTPException(status_code=504, detail=f"{name} が締め切り({deadline:.1f}s)までに応答しませんでした")
+            logger.warning("[fetch] %s が締め切り(%.1fs)に間に合わず除外", name, deadline)
+        except Exception as e:
+            if required:
+                raise HTTPException(status_code=502, detail=f"{name} の取得に失敗: {e}")
+            logger.warning("[fetch] %s の取得に失敗: %s", name, e)
+        return None
+
+    # ── 統合 ────────────────────────────────────────────────
 
+    async def fetch_ndl_by_isbn(self, isbn: str) -> dict | None:
+        """
+        NDL SRU・OpenBD・Google Books を同時に問い合わせて書誌情報を組み立てる。
+        必須ソース（NDL）が返った時点で打ち切り、それまでに返った任意ソースだけをマージする
+        （レイテンシは NDL の応答時間で決まる）。NDL の失敗は 502/504、
+        NDL に書誌が無い・タイトルが得られなければ None。
+        """
+        clean  = re.sub(r"[^0-9X]", "", isbn.upper())
         isbn13 = clean if len(clean) == 13 else _isbn10_to_13(clean)
-        cover  = f"https://ndlsearch.ndl.go.jp/thumbnail/{isbn13}.jpg"
 
-        openbd      = await fetch_openbd_descriptions([isbn13])
-        description = openbd.get(isbn13)
-        if not description:
-            description = await fetch_google_description(isbn13)
+        sources = {
+            "ndl":    self._source_ndl(clean),
+            "openbd": self._source_openbd(isbn13),
+            "google": self._source_google(isbn13),
+        }
+        tasks = {name: asyncio.create_task(self._run_source(name, coro)) for name, coro in sources.items()}
+        try:
+            await asyncio.gather(*[tasks[name] for name in self.REQUIRED_SOURCES])
+            results = {name: task.result() for name, task in tasks.items() if task.done()}
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+        if any(not results.get(name) for name in self.REQUIRED_SOURCES):
+            return None
+
+        merged: dict = {}
+        for name in self.source_priority:
+            for key, value in (results.get(name) or {}).items():
+                if value not in (None, "") and merged.get(key) in (None, ""):
+                    merged[key] = value
+
+        if not merged.get("title"):
+            return None
 
         return {
             "isbn":           clean,
-            "title":          title[0] if title else None,
-            "authors":        ",".join(creators),
-            "publisher":      publisher[0] if publisher else None,
-            "published_year": issued[0] if issued else None,
-            "ndc_full":       ndc,
-            "pages":          pages,
-            "height_mm":      height_mm,
+            "title":          merged.get("title"),
+            "authors":        merged.get("authors", ""),
+            "publisher":      merged.get("publisher"),
+            "published_year": merged.get("published_year"),
+            "ndc_full":       merged.get("ndc_full"),
+            "pages":          merged.get("pages"),
+            "height_mm":      merged.get("height_mm"),
             "size_label":     None,
-            "cover":          cover,
-            "description":    description,
+            "cover":          f"https://ndlsearch.ndl.go.jp/thumbnail/{isbn13}.jpg",
+            "description":    merged.get("description"),
+            "sources":        [name for name in sources if results.get(name)],
         }
 
     @staticmethod
-    def extract_dominant_color(image_data: bytes) -> str | None:
-        """colorthief のメジアンカット法で代表色を抽出して 'R,G,B' 形式で返す。"""
-        try:
-            import io
-            from colorthief import ColorThief
-
-            cf       = ColorThief(io.BytesIO(image_data))
-            r, g, b  = cf.get_color(quality=1)
-            return f"{r},{g},{b}"
-        except Exception:
-            return None
+    def extract_dominant_color(image: bytes | Path) -> str | None:
+        """縮小＋NumPy のメジアンカットで代表色を抽出して 'R,G,B' 形式で返す。"""
+        return extract_dominant_color(image)
 
     @staticmethod
-    async def ocr_extract_text(image_data: bytes) -> str:
+    async def ocr_extract_text(image: bytes | Path) -> str:
         """Tesseract OCR でテキスト抽出。0°/90°/270° を試して最長テキストを返す。"""
         try:
             import pytesseract
             from PIL import Image
             import io
 
-            img  = Image.open(io.BytesIO(image_data))
+            img  = Image.open(io.BytesIO(image) if isinstance(image, bytes) else image)
             best = ""
             for angle in [0, 90, 270]:
                 rotated = img.rotate(angle, expand=True) if angle else img
@@ -193,6 +304,174 @@ class BookRegistrationService:
         except Exception:
             return None
 
+    # ── 一括インポート ──────────────────────────────────────
+
+    BULK_SRU_BATCH       = 50    # 1回の SRU クエリに OR で詰める ISBN 数
+    BULK_SRU_CONCURRENCY = 3     # NDL への同時リクエスト数（負荷をかけすぎない）
+
+    @staticmethod
+    def normalize_isbn13(isbn: str) -> str | None:
+        """ハイフン等を除いて ISBN-13 に揃える。ISBN として不正なら None"""
+        clean = re.sub(r"[^0-9X]", "", isbn.upper())
+        if len(clean) == 13 and clean.isdigit():
+            return clean
+        if len(clean) == 10 and clean[:9].isdigit():
+            return _isbn10_to_13(clean)
+        return None
+
+    async def _fetch_ndl_batch(self, isbn13s: list[str]) -> dict[str, dict]:
+        """複数 ISBN を OR でまとめた1回の SRU クエリで取得し、{isbn13: 書誌} に振り分ける"""
+        params = {
+            "operation":      "searchRetrieve",
+            "query":          " OR ".join(f'isbn="{i}"' for i in isbn13s),
+            "maximumRecords": min(len(isbn13s) * 2, 200),   # 版違いで1 ISBN に複数件ヒットすることがある
+            "recordSchema":   "dcndl",
+        }
+        client   = get_http_client()
+        response = await client.get(NDL_SRU_URL, params=params, timeout=NDL_TIMEOUT)
+        response.raise_for_status()
+
+        wanted  = set(isbn13s)
+        results: dict[str, dict] = {}
+        root    = etree.fromstring(response.content)
+        for record_node in root.xpath("//srw:recordData", namespaces=SRW_NS):
+            raw_text = (record_node.text or "").strip()
+            if not raw_text:
+                continue
+            try:
+                rdf = etree.fromstring(raw_text.encode("utf-8"))
+            except etree.XMLSyntaxError:
+                continue
+            for bib in rdf.xpath(".//dcndl:BibResource", namespaces=BIB_NS):
+                identifiers = bib.xpath(
+                    "dcterms:identifier[@rdf:datatype='http://ndl.go.jp/dcndl/terms/ISBN']/text()",
+                    namespaces=BIB_NS,
+                )
+                for ident in identifiers:
+                    isbn13 = self.normalize_isbn13(ident)
+                    if isbn13 in wanted and isbn13 not in results:
+                        results[isbn13] = self._parse_bib(bib)
+        return results
+
+    async def fetch_ndl_bulk(self, isbns: list[str]) -> tuple[dict[str, dict], int]:
+        """
+        ISBN のリストを BULK_SRU_BATCH 件ずつ SRU に問い合わせ、概要は OpenBD の一括APIで補う。
+        返り値は ({isbn13: 登録用 dict}, 発行した SRU リクエスト数)。
+        """
+        isbn13s = list(dict.fromkeys(i for i in (self.normalize_isbn13(x) for x in isbns) if i))
+        batches = [isbn13s[i:i + self.BULK_SRU_BATCH] for i in range(0, len(isbn13s), self.BULK_SRU_BATCH)]
+        sem     = asyncio.Semaphore(self.BULK_SRU_CONCURRENCY)
+
+        async def _one(batch: list[str]) -> dict[str, dict]:
+            async with sem:
+                try:
+                    records = await self._fetch_ndl_batch(batch)
+                except Exception as e:
+                    logger.warning("[bulk] SRU バッチ取得に失敗 (%d件): %s", len(batch), e)
+                    return {}
+                descriptions = await fetch_openbd_descriptions(list(records))
+                for isbn13, record in records.items():
+                    record["description"] = descriptions.get(isbn13)
+                return records
+
+        merged: dict[str, dict] = {}
+        for records in await asyncio.gather(*[_one(b) for b in batches]):
+            merged.update(records)
+
+        books = {
+            isbn13: {
+                "isbn":       isbn13,
+                "size_label": None,
+                "cover":      f"https://ndlsearch.ndl.go.jp/thumbnail/{isbn13}.jpg",
+                **record,
+            }
+            for isbn13, record in merged.items()
+        }
+        return books, len(batches)
+
+    async def import_isbns(self, db: Session, isbns: list[str]) -> dict:
+        """ISBN のリストを一括取得し、未登録の本を1トランザクションで registered_books に追加する"""
+        normalized = {}
+        invalid    = []
+        for raw in isbns:
+            isbn13 = self.normalize_isbn13(raw)
+            if isbn13:
+                normalized.setdefault(isbn13, raw)
+            elif raw.strip():
+                invalid.append(raw)
+
+        existing = {
+            isbn for (isbn,) in
+            db.query(RegisteredBook.isbn).filter(RegisteredBook.isbn.in_(list(normalized))).all()
+        }
+        targets = [i for i in normalized if i not in existing]
+
+        books, requests = await self.fetch_ndl_bulk(targets) if targets else ({}, 0)
+
+        rows = [
+            {
+                "isbn":           isbn13,
+                "title":          b.get("title"),
+                "authors":        b.get("authors") or "",
+                "publisher":      b.get("publisher"),
+                "published_year": b.get("published_year"),
+                "ndc":            b.get("ndc_full"),
+                "height_mm":      b.get("height_mm") or 180,
+                "pages":          b.get("pages") or 200,
+                "size_label":     b.get("size_label"),
+                "cover":          b.get("cover"),
+                "description":    b.get("description"),
+            }
+            for isbn13, b in books.items()
+        ]
+        try:
+            db.bulk_insert_mappings(RegisteredBook, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        shelf_read_model.refresh_books(db, [r["isbn"] for r in rows])
+
+        return {
+            "imported":           [r["isbn"] for r in rows],
+            "already_registered": sorted(existing),
+            "not_found":          [i for i in targets if i not in books],
+            "invalid":            invalid,
+            "sru_requests":       requests,
+        }
+
+
+def parse_isbn_csv(text: str) -> list[str]:
+    """
+    CSV / テキストから ISBN を取り出す。ヘッダーに isbn 列があればその列、
+    なければ各行の最初のセルを使う。
+    """
+    rows = list(csv.reader(io.StringIO(text)))
+    if not rows:
+        return []
+    header = [c.strip().lower() for c in rows[0]]
+    if "isbn" in header:
+        col = header.index("isbn")
+        return [r[col].strip() for r in rows[1:] if len(r) > col and r[col].strip()]
+    return [r[0].strip() for r in rows if r and r[0].strip()]
+
+
+def _registered_to_book(b: RegisteredBook) -> dict:
+    """登録済みの本を fetch_ndl_by_isbn と同じ形の dict にする。"""
+    return {
+        "isbn":           b.isbn,
+        "title":          b.title,
+        "authors":        b.authors,
+        "publisher":      b.publisher,
+        "published_year": b.published_year,
+        "ndc_full":       b.ndc,
+        "pages":          b.pages,
+        "height_mm":      b.height_mm,
+        "size_label":     b.size_label,
+        "cover":          b.cover,
+        "description":    b.description,
+    }
+
 
 # ============================================================
 # サービスインスタンス
@@ -234,37 +513,140 @@ async def proxy_cover(isbn: str, db: Session = Depends(get_db)):
 
 
 # ── 登録済み一覧を返す ───────────────────────────────
+LIST_FIELDS = {
+    "isbn":           RegisteredBook.isbn,
+    "title":          RegisteredBook.title,
+    "authors":        RegisteredBook.authors,
+    "publisher":      RegisteredBook.publisher,
+    "published_year": RegisteredBook.published_year,
+    "ndc":            RegisteredBook.ndc,
+    "pages":          RegisteredBook.pages,
+    "height_mm":      RegisteredBook.height_mm,
+    "spine_image":    RegisteredBook.spine_image,
+    "spine_color":    RegisteredBook.spine_color,
+    "cover":          RegisteredBook.cover,
+    "description":    RegisteredBook.description,
+    "registered_at":  RegisteredBook.registered_at,
+}
+LIST_MAX_LIMIT = 500
+
+# キーセット用。DateTime 型を通すとマイクロ秒の有無で文字列比較がずれるため、保存値のまま比較する
+_registered_at_raw = type_coerce(RegisteredBook.registered_at, String)
+
+
+def _encode_cursor(registered_at_raw: str | None, book_id: int) -> str:
+    """registered_at が NULL の行は空文字で表す"""
+    return base64.urlsafe_b64encode(f"{registered_at_raw or ''}|{book_id}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[str | None, int]:
+    try:
+        raw, book_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return raw or None, int(book_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="cursor が不正です")
+
+
+def _serialize_field(name: str, value):
+    if name == "authors":
+        return value.split(",") if value else []
+    if name == "registered_at":
+        return value.isoformat() if value else None
+    return value
+
+
 @router.get("/list")
-def list_registered(db: Session = Depends(get_db)):
-    books = db.query(RegisteredBook).order_by(RegisteredBook.registered_at.desc()).all()
+def list_registered(
+    response: Response,
+    limit: int | None = Query(None, ge=1, le=LIST_MAX_LIMIT, description="1ページの件数（省略時は全件）"),
+    cursor: str | None = Query(None, description="前のページの X-Next-Cursor"),
+    fields: str | None = Query(None, description="返すフィールドをカンマ区切りで指定（例: isbn,title,spine_image）"),
+    ndc_prefix: str | None = Query(None, description="NDC の前方一致（例: 9, 91, 913）"),
+    has_spine: bool | None = Query(None, description="背表紙画像の有無で絞り込む"),
+    db: Session = Depends(get_db),
+):
+    """
+    registered_at の新しい順に返す（registered_at が無い行は最後に id の降順）。
+    (registered_at, id) のキーセットページネーションで、limit を指定すると
+    次ページのカーソルを X-Next-Cursor ヘッダーで返す。
+    """
+    names = list(LIST_FIELDS) if not fields else [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [n for n in names if n not in LIST_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不明なフィールド: {', '.join(unknown)}")
+
+    query = db.query(
+        RegisteredBook.id.label("_id"),
+        _registered_at_raw.label("_registered_at_raw"),
+        *[LIST_FIELDS[n].label(n) for n in names],
+    )
+
+    if ndc_prefix:
+        # LIKE ではなく範囲条件にして ndc のインデックスで絞り込む（並べ替えは別にソート）
+        upper = ndc_prefix[:-1] + chr(ord(ndc_prefix[-1]) + 1)
+        query = query.filter(RegisteredBook.ndc >= ndc_prefix, RegisteredBook.ndc < upper)
+    if has_spine is True:
+        query = query.filter(RegisteredBook.spine_image.isnot(None))
+    elif has_spine is False:
+        query = query.filter(RegisteredBook.spine_image.is_(None))
+
+    if cursor:
+        raw, last_id = _decode_cursor(cursor)
+        if raw is None:
+            query = query.filter(RegisteredBook.registered_at.is_(None), RegisteredBook.id < last_id)
+        else:
+            query = query.filter(or_(
+                _registered_at_raw < raw,
+                and_(_registered_at_raw == raw, RegisteredBook.id < last_id),
+                RegisteredBook.registered_at.is_(None),
+            ))
+
+    # SQLite の降順では NULL が最後に来る
+    query = query.order_by(_registered_at_raw.desc(), RegisteredBook.id.desc())
+    rows  = query.limit(limit + 1).all() if limit else query.all()
+
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1]._registered_at_raw, rows[-1]._id)
+
     return [
-        {
-            "isbn":           b.isbn,
-            "title":          b.title,
-            "authors":        b.authors.split(",") if b.authors else [],
-            "publisher":      b.publisher,
-            "published_year": b.published_year,
-            "ndc":            b.ndc,
-            "pages":          b.pages,
-            "height_mm":      b.height_mm,
-            "spine_image":    b.spine_image,
-            "spine_color":    b.spine_color,
-            "cover":          b.cover,
-            "description":    b.description,
-            "registered_at":  b.registered_at.isoformat() if b.registered_at else None,
-        }
-        for b in books
+        {n: _serialize_field(n, getattr(r, n)) for n in names}
+        for r in rows
     ]
 
 
 # ── 2ステップISBN抽出：OCR → NDL、失敗時は Gemini ────
 @router.post("/extract-isbn")
-async def extract_isbn(file: UploadFile = File(...)):
-    image_data = await file.read()
-    mime_type  = file.content_type or "image/jpeg"
+async def extract_isbn(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    # 画像はメモリに載せず一時ファイルへストリーミング受信し、各段はファイルを読む
+    staged = await stage_upload(file, SPINE_STAGING_DIR)
+    try:
+        return await _extract_isbn_from_file(staged, db)
+    finally:
+        staged.discard()
+
+
+async def _extract_isbn_from_file(staged: StagedUpload, db: Session) -> dict:
+    mime_type = staged.content_type or "image/jpeg"
+
+    # ── Step 0: 登録済み背表紙との照合（撮り直し） ─────────
+    try:
+        match = spine_hash_index.find(db, phash(staged.path))
+    except Exception:
+        match = None
+    if match:
+        isbn, distance = match
+        registered = db.query(RegisteredBook).filter(RegisteredBook.isbn == isbn).first()
+        if registered:
+            return {
+                "isbn":     isbn,
+                "book":     _registered_to_book(registered),
+                "method":   "duplicate",
+                "distance": distance,
+            }
 
     # ── Step 1: Tesseract OCR → NDL キーワード検索 ──────
-    ocr_text = await _registration_service.ocr_extract_text(image_data)
+    ocr_text = await _registration_service.ocr_extract_text(staged.path)
     if ocr_text:
         # OCR テキストに ISBN パターンが含まれる場合は直接使う
         isbn_match = re.search(r"97[89][\-\d]{10,}", ocr_text)
@@ -282,14 +664,12 @@ async def extract_isbn(file: UploadFile = File(...)):
             if book:
                 return {"isbn": book["isbn"], "book": book, "method": "ocr_ndl"}
 
-    # ── Step 2: AI Vision ──────────────────────────────────
-    prompt = (
-        "この本の背表紙の画像からISBNコードを抽出してください。"
-        "ISBNコードのみを返してください（数字とハイフンのみ）。"
-        "見つからない場合は NOT_FOUND とだけ返してください。"
-    )
+    # ── Step 2: AI Vision（同じ画像・同じプロンプトの結果はキャッシュから返す） ──
     try:
-        isbn_raw = _llm.generate_from_image(image_data, mime_type, prompt)
+        isbn_raw = _llm.generate_from_image(
+            staged.path, mime_type, ISBN_PROMPT,
+            prompt_version=ISBN_PROMPT_VERSION, image_sha256=staged.sha256,
+        )
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"AI API エラー: {e}")
 
@@ -308,6 +688,22 @@ async def fetch_by_isbn(isbn: str):
     return book
 
 
+# ── ISBN の一括インポート（JSON / CSV） ──────────────
+@router.post("/bulk-import")
+async def bulk_import(body: BulkImportRequest, db: Session = Depends(get_db)):
+    if not body.isbns:
+        raise HTTPException(status_code=400, detail="isbns is required")
+    return await _registration_service.import_isbns(db, body.isbns)
+
+
+@router.post("/bulk-import/csv")
+async def bulk_import_csv(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    isbns = parse_isbn_csv((await file.read()).decode("utf-8-sig", errors="replace"))
+    if not isbns:
+        raise HTTPException(status_code=400, detail="CSV に ISBN がありません")
+    return await _registration_service.import_isbns(db, isbns)
+
+
 # ── 背表紙画像 + 書誌情報を紐づけて保存 ─────────────
 @router.post("/save")
 async def save_book(
@@ -323,17 +719,21 @@ async def save_book(
     if db.query(RegisteredBook).filter(RegisteredBook.isbn == isbn).first():
         return {"message": "already_exists", "isbn": isbn}
 
-    # 背表紙画像を spine_image/{isbn}.jpg として保存
+    # 背表紙画像は spine_image/{sha256}.{ext}（内容アドレス方式）。代表色・ハッシュは
+    # 一時ファイルから求め、公開ディレクトリへ移すのは DB の commit が通ってから
     ndl_cover   = data.get("cover")        # NDL/Google Books の書影URL
+    staged      = None
     spine_path  = None
     spine_color = None
+    spine_hash  = None
     if image and image.filename:
-        image_data = await image.read()
-        ext        = image.filename.rsplit(".", 1)[-1].lower() if "." in image.filename else "jpg"
-        SPINE_IMAGE_DIR.mkdir(parents=True, exist_ok=True)
-        (SPINE_IMAGE_DIR / f"{isbn}.{ext}").write_bytes(image_data)
-        spine_path  = f"/spine_image/{isbn}.{ext}"
-        spine_color = _registration_service.extract_dominant_color(image_data)
+        staged      = await stage_upload(image, SPINE_STAGING_DIR)
+        spine_path  = f"/spine_image/{staged.sha256}.{staged.ext}"
+        spine_color = _registration_service.extract_dominant_color(staged.path)
+        try:
+            spine_hash = phash(staged.path)
+        except Exception:
+            spine_hash = None
 
     book = RegisteredBook(
         isbn=isbn,
@@ -347,9 +747,20 @@ async def save_book(
         size_label=data.get("size_label"),
         spine_image=spine_path,
         spine_color=spine_color,
+        spine_hash=to_hex(spine_hash) if spine_hash is not None else None,
         cover=ndl_cover,
         description=data.get("description"),
     )
     db.add(book)
-    db.commit()
+    try:
+        db.commit()
+    except Exception:
+        if staged:
+            staged.discard()
+        raise
+    if staged:
+        commit_to_store(staged, SPINE_IMAGE_DIR)
+    if spine_hash is not None:
+        spine_hash_index.add(isbn, spine_hash)
+    shelf_read_model.refresh_books(db, [isbn])   # 先に棚に置かれていた本なら書誌を反映
     return {"message": "saved", "isbn": isbn, "spine_image": spine_path, "spine_color": spine_color, "cover": ndl_cover}
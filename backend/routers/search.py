@@ -403,7 +403,8 @@ class NDLSearchService:
         except Exception:
             return {}
 
-    async def fetch_google_description(self, isbn: str) -> Optional[str]:
+    async def fetch_google_volume(self, isbn: str) -> Optional[dict]:
+        """Google Books の volumeInfo（書誌情報）を返す。見つからなければ None"""
         try:
             r = await HttpClientManager.get().get(
                 self.GOOGLE_BOOKS,
@@ -413,10 +414,14 @@ class NDLSearchService:
             items = r.json().get("items")
             if not items:
                 return None
-            return items[0].get("volumeInfo", {}).get("description") or None
+            return items[0].get("volumeInfo") or None
         except Exception:
             return None
 
+    async def fetch_google_description(self, isbn: str) -> Optional[str]:
+        volume = await self.fetch_google_volume(isbn)
+        return (volume or {}).get("description") or None
+
     async def fetch_cover(self, isbn: str) -> Optional[str]:
         is_japanese = isbn.startswith("9784") or (
             len(isbn) == 10 and isbn.startswith("4")
@@ -456,6 +461,7 @@ _isbn10_to_13             = NDLSearchService._isbn10_to_13
 NDL_TIMEOUT               = NDLSearchService.NDL_TIMEOUT
 fetch_openbd_descriptions = _ndl_service.fetch_openbd_descriptions
 fetch_google_description  = _ndl_service.fetch_google_description
+fetch_google_volume       = _ndl_service.fetch_google_volume
 
 
 @asynccontextmanager
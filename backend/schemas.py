@@ -4,3 +4,7 @@ from typing import List
 
 class AddFromHandRequest(BaseModel):
     isbns: List[str]
+
+
+class BulkImportRequest(BaseModel):
+    isbns: List[str]
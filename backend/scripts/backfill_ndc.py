@@ -48,43 +48,63 @@ def _extract_ndc_from_bib(bib):
     return None
 
 
-async def fetch_ndc(client: httpx.AsyncClient, isbn: str):
+BATCH_SIZE = 50   # 1回の SRU クエリに OR で詰める ISBN 数
+
+
+def _isbn13(isbn: str):
+    """ハイフン等を除いて ISBN-13 に揃える（照合用）。"""
+    clean = re.sub(r"[^0-9X]", "", isbn.upper())
+    if len(clean) == 13:
+        return clean
+    if len(clean) == 10:
+        body  = "978" + clean[:9]
+        total = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(body))
+        return body + str((10 - total % 10) % 10)
+    return None
+
+
+async def fetch_ndc_batch(client: httpx.AsyncClient, isbns: list[str]) -> dict[str, str]:
+    """
+    複数 ISBN を OR でまとめて1回の SRU リクエストで取得し、
+    各レコードの ISBN 識別子で元の ISBN に振り分けて {isbn: ndc} を返す。
+    """
+    by_isbn13 = {_isbn13(i): i for i in isbns if _isbn13(i)}
     params = {
         "operation":      "searchRetrieve",
-        "query":          f'isbn="{isbn}"',
-        "maximumRecords": 1,
+        "query":          " OR ".join(f'isbn="{i}"' for i in by_isbn13),
+        "maximumRecords": min(len(by_isbn13) * 2, 200),
         "recordSchema":   "dcndl",
     }
     try:
-        r = await client.get(NDL_SRU_URL, params=params, timeout=15)
+        r = await client.get(NDL_SRU_URL, params=params, timeout=30)
         r.raise_for_status()
-    except Exception as e:
-        print(f"  [NDL] {isbn} fetch error: {e}")
-        return None
-
-    try:
         root = etree.fromstring(r.content)
-    except etree.XMLSyntaxError:
-        return None
-
-    record_nodes = root.xpath("//srw:recordData", namespaces=SRW_NS)
-    if not record_nodes:
-        return None
-
-    raw_text = (record_nodes[0].text or "").strip()
-    if not raw_text:
-        return None
-
-    try:
-        rdf = etree.fromstring(raw_text.encode("utf-8"))
-    except etree.XMLSyntaxError:
-        return None
-
-    bib_list = rdf.xpath(".//dcndl:BibResource", namespaces=BIB_NS)
-    if not bib_list:
-        return None
-
-    return _extract_ndc_from_bib(bib_list[0])
+    except Exception as e:
+        print(f"  [NDL] batch fetch error ({len(isbns)} isbns): {e}")
+        return {}
+
+    results: dict[str, str] = {}
+    for record_node in root.xpath("//srw:recordData", namespaces=SRW_NS):
+        raw_text = (record_node.text or "").strip()
+        if not raw_text:
+            continue
+        try:
+            rdf = etree.fromstring(raw_text.encode("utf-8"))
+        except etree.XMLSyntaxError:
+            continue
+
+        for bib in rdf.xpath(".//dcndl:BibResource", namespaces=BIB_NS):
+            ndc = _extract_ndc_from_bib(bib)
+            if not ndc:
+                continue
+            for ident in bib.xpath(
+                "dcterms:identifier[@rdf:datatype='http://ndl.go.jp/dcndl/terms/ISBN']/text()",
+                namespaces=BIB_NS,
+            ):
+                original = by_isbn13.get(_isbn13(ident) or "")
+                if original and original not in results:
+                    results[original] = ndc
+    return results
 
 
 async def main():
@@ -98,26 +118,28 @@ async def main():
         conn.close()
         return
 
-    print(f"Fetching NDC for {len(targets)} books...")
-
-    updated = 0
-    async with httpx.AsyncClient(timeout=15) as client:
-        for isbn in targets:
-            ndc = await fetch_ndc(client, isbn)
-            if ndc:
-                cur.execute(
-                    "UPDATE registered_books SET ndc = ? WHERE isbn = ?",
-                    (ndc, isbn),
-                )
-                updated += 1
-                print(f"  [OK] {isbn} -> {ndc}")
-            else:
-                print(f"  [--] {isbn}  NDC not found")
+    print(f"Fetching NDC for {len(targets)} books ({BATCH_SIZE} per request)...")
+
+    found: dict[str, str] = {}
+    async with httpx.AsyncClient(timeout=30) as client:
+        for i in range(0, len(targets), BATCH_SIZE):
+            batch = targets[i:i + BATCH_SIZE]
+            found.update(await fetch_ndc_batch(client, batch))
             await asyncio.sleep(0.3)
 
+    for isbn in targets:
+        if isbn in found:
+            print(f"  [OK] {isbn} -> {found[isbn]}")
+        else:
+            print(f"  [--] {isbn}  NDC not found")
+
+    cur.executemany(
+        "UPDATE registered_books SET ndc = ? WHERE isbn = ?",
+        [(ndc, isbn) for isbn, ndc in found.items()],
+    )
     conn.commit()
     conn.close()
-    print(f"\nDone: {updated}/{len(targets)} books updated.")
+    print(f"\nDone: {len(found)}/{len(targets)} books updated.")
 
 
 if __name__ == "__main__":
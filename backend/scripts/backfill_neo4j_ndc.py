@@ -1,15 +1,17 @@
 """
 registered_books の NDC を Neo4j Book ノードに反映するスクリプト。
-add_book_with_meaning は MERGE を使うので既存ノードの上書き更新が安全にできる。
+add_books_with_meaning は MERGE を使うので既存ノードの上書き更新が安全にできる
+（1,000 冊ずつ1トランザクションにまとめて書き込む）。
 プロジェクトルートから実行:
   python backend/scripts/backfill_neo4j_ndc.py
 """
 import sqlite3
 import sys
+import time
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from admin_neo4j.neo4j_crud import add_book_with_meaning
+from admin_neo4j.neo4j_crud import BookshelfNeo4j, add_books_with_meaning
 
 DB_PATH = Path(__file__).parent.parent / "bookshelf.db"
 
@@ -28,13 +30,14 @@ conn.close()
 if not books:
     print("NDCが設定された本がありません。")
 else:
-    print(f"{len(books)} 冊の NDC 接続を Neo4j に反映します...")
-    for b in books:
-        book_dict = dict(b)
-        try:
-            add_book_with_meaning(book_dict)
-            print(f"  [OK] {book_dict['isbn']}  NDC={book_dict['ndc']}")
-        except Exception as e:
-            print(f"  [NG] {book_dict['isbn']}  {e}")
+    print(f"{len(books)} 冊の NDC 接続を Neo4j に反映します（{BookshelfNeo4j.BULK_BATCH_SIZE} 冊ずつ）...")
+    t0 = time.perf_counter()
+    try:
+        add_books_with_meaning(
+            [dict(b) for b in books],
+            on_batch=lambda done, total: print(f"  [OK] {done}/{total} 冊"),
+        )
+    except Exception as e:
+        print(f"  [NG] {e}")
 
-    print("\n完了")
+    print(f"\n完了 ({time.perf_counter() - t0:.1f} 秒)")
@@ -2,15 +2,17 @@
 registered_books の著者・出版社ノードと関係性を Neo4j に一括追加するスクリプト。
 既存の Book ノードはそのまま、Author / Publisher ノードと
 WRITTEN_BY / PUBLISHED_BY リレーションが追加される。
+add_books_with_meaning で 1,000 冊ずつ1トランザクションにまとめて書き込む。
 プロジェクトルートから実行:
   python backend/scripts/backfill_neo4j_relations.py
 """
 import sqlite3
 import sys
+import time
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from admin_neo4j.neo4j_crud import add_book_with_meaning
+from admin_neo4j.neo4j_crud import BookshelfNeo4j, add_books_with_meaning
 
 DB_PATH = Path(__file__).parent.parent / "bookshelf.db"
 
@@ -28,18 +30,17 @@ conn.close()
 if not books:
     print("登録済みの本がありません。")
 else:
-    print(f"{len(books)} 冊の関係性を Neo4j に追加します...")
-    ok, ng = 0, 0
-    for b in books:
-        book_dict = dict(b)
-        try:
-            add_book_with_meaning(book_dict)
-            authors = book_dict.get("authors") or ""
-            publisher = book_dict.get("publisher") or ""
-            print(f"  [OK] {book_dict['isbn']}  著者={authors[:30]}  出版社={publisher}")
-            ok += 1
-        except Exception as e:
-            print(f"  [NG] {book_dict['isbn']}  {e}")
-            ng += 1
+    print(f"{len(books)} 冊の関係性を Neo4j に追加します（{BookshelfNeo4j.BULK_BATCH_SIZE} 冊ずつ）...")
+    progress = {"done": 0}
 
-    print(f"\n完了: {ok} 件成功 / {ng} 件失敗")
+    def on_batch(done: int, total: int):
+        progress["done"] = done
+        print(f"  [OK] {done}/{total} 冊")
+
+    t0 = time.perf_counter()
+    try:
+        add_books_with_meaning([dict(b) for b in books], on_batch=on_batch)
+        print(f"\n完了: {len(books)} 件 ({time.perf_counter() - t0:.1f} 秒)")
+    except Exception as e:
+        print(f"  [NG] {progress['done']} 冊目以降のバッチで失敗: {e}")
+        print(f"\n中断: {progress['done']} 件成功 / {len(books) - progress['done']} 件未反映")
@@ -1,26 +1,21 @@
 """
 spine_color が未設定のレコードを spine_image ファイルから補完するスクリプト。
+代表色の抽出は utils.spine_color のバッチAPIでまとめて行う。
 プロジェクトルートから実行:
   python backend/scripts/backfill_spine_color.py
 """
+import sqlite3
+import sys
+import time
 from pathlib import Path
 
-from colorthief import ColorThief
-import sqlite3
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.spine_color import extract_dominant_colors
 
 DB_PATH    = Path(__file__).parent.parent / "bookshelf.db"
 IMAGE_ROOT = Path(__file__).parent.parent.parent / "frontend" / "public"
 
 
-def extract_dominant_color(image_path: Path) -> str | None:
-    try:
-        r, g, b = ColorThief(str(image_path)).get_color(quality=1)
-        return f"{r},{g},{b}"
-    except Exception as e:
-        print(f"  [ERROR] {e}")
-        return None
-
-
 conn = sqlite3.connect(DB_PATH)
 cur  = conn.cursor()
 
@@ -30,27 +25,30 @@ cur.execute(
 rows = cur.fetchall()
 print(f"対象: {len(rows)} 件（全件再計算）")
 
-updated = 0
 skipped = 0
+targets = []
 for isbn, spine_image in rows:
     image_path = IMAGE_ROOT / spine_image.lstrip("/")
     if not image_path.exists():
         print(f"  [SKIP] {isbn} — ファイルなし: {image_path}")
         skipped += 1
         continue
+    targets.append((isbn, image_path))
+
+t0     = time.perf_counter()
+colors = extract_dominant_colors([path for _, path in targets])
+print(f"色抽出: {len(targets)} 件 / {time.perf_counter() - t0:.2f}s")
 
-    color = extract_dominant_color(image_path)
+updates = []
+for (isbn, _), color in zip(targets, colors):
     if color:
-        cur.execute(
-            "UPDATE registered_books SET spine_color = ? WHERE isbn = ?",
-            (color, isbn),
-        )
+        updates.append((color, isbn))
         print(f"  [OK]   {isbn} -> {color}")
-        updated += 1
     else:
         print(f"  [FAIL] {isbn} — 色抽出失敗")
         skipped += 1
 
+cur.executemany("UPDATE registered_books SET spine_color = ? WHERE isbn = ?", updates)
 conn.commit()
 conn.close()
-print(f"\n完了: {updated} 件更新 / {skipped} 件スキップ")
+print(f"\n完了: {len(updates)} 件更新 / {skipped} 件スキップ")
@@ -0,0 +1,48 @@
+"""
+spine_hash（背表紙画像の知覚ハッシュ）が未設定のレコードを spine_image ファイルから補完するスクリプト。
+撮り直し画像の重複検出（/register/extract-isbn）はこのハッシュを使う。
+プロジェクトルートから実行:
+  python backend/scripts/backfill_spine_hash.py
+"""
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.image_hash import phash, to_hex
+
+DB_PATH    = Path(__file__).parent.parent / "bookshelf.db"
+IMAGE_ROOT = Path(__file__).parent.parent.parent / "frontend" / "public"
+
+
+conn = sqlite3.connect(DB_PATH)
+cur  = conn.cursor()
+
+cur.execute(
+    "SELECT isbn, spine_image FROM registered_books "
+    "WHERE spine_image IS NOT NULL AND spine_hash IS NULL"
+)
+rows = cur.fetchall()
+print(f"対象: {len(rows)} 件")
+
+updates = []
+skipped = 0
+for isbn, spine_image in rows:
+    image_path = IMAGE_ROOT / spine_image.lstrip("/")
+    if not image_path.exists():
+        print(f"  [SKIP] {isbn} — ファイルなし: {image_path}")
+        skipped += 1
+        continue
+    try:
+        h = to_hex(phash(image_path))
+    except Exception as e:
+        print(f"  [FAIL] {isbn} — {e}")
+        skipped += 1
+        continue
+    updates.append((h, isbn))
+    print(f"  [OK]   {isbn} -> {h}")
+
+cur.executemany("UPDATE registered_books SET spine_hash = ? WHERE isbn = ?", updates)
+conn.commit()
+conn.close()
+print(f"\n完了: {len(updates)} 件更新 / {skipped} 件スキップ")
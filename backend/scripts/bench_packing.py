@@ -0,0 +1,85 @@
+"""
+全体再配置の詰め方（greedy / balanced）を合成データで比べるベンチマーク。
+ページ数と NDC グループの大きさをランダムに作り、冊数ごとに
+処理時間・段数・最終段以外の充填率・グループ途中での折り返し数を出力する。
+DB / Neo4j には触れない。プロジェクトルートから実行:
+  python backend/scripts/bench_packing.py [--sizes 1000 10000 100000] [--seed 0]
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.shelf_utils import ShelfService
+
+
+def make_library(n: int, rng: random.Random) -> tuple[list[str], dict, dict]:
+    """n 冊分の (ISBN 順, books_map, isbn → グループ番号)。グループは 1〜60 冊"""
+    isbns, books_map, group_of = [], {}, {}
+    group = 0
+    while len(isbns) < n:
+        for _ in range(min(rng.randint(1, 60), n - len(isbns))):
+            isbn = f"978{len(isbns):010d}"
+            isbns.append(isbn)
+            books_map[isbn] = {
+                "isbn":       isbn,
+                "pages":      max(48, int(rng.lognormvariate(5.6, 0.45))),   # 中央値 270 ページ前後
+                "height_mm":  rng.choice([148, 182, 188, 210]),
+                "size_label": None,
+            }
+            group_of[isbn] = group
+        group += 1
+    return isbns, books_map, group_of
+
+
+def summarize(rows: list[dict], group_of: dict, shelf_max_px: int) -> dict:
+    used: dict[int, int] = {}
+    for r in rows:
+        used[r["shelf_index"]] = used.get(r["shelf_index"], 0) + ShelfService.calc_virtual_width(r["pages"])
+    fills = [used[s] / shelf_max_px for s in sorted(used)[:-1]] or [1.0]
+    inside = sum(
+        1 for prev, cur in zip(rows, rows[1:])
+        if cur["shelf_index"] != prev["shelf_index"] and group_of[cur["isbn"]] == group_of[prev["isbn"]]
+    )
+    return {
+        "shelves":  len(used),
+        "fill_avg": statistics.mean(fills),
+        "fill_min": min(fills),
+        "fill_sd":  statistics.pstdev(fills),
+        "inside":   inside,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--penalty", type=float, default=ShelfService.NDC_BREAK_PENALTY,
+                        help="balanced の NDC グループ途中で折り返すコスト（棚幅² に対する比）")
+    args = parser.parse_args()
+
+    service      = ShelfService()
+    shelf_max_px = ShelfService.SHELF_MAX_WIDTH_PX
+
+    print(f"{'冊数':>8} {'方式':<16} {'時間(ms)':>10} {'段数':>6} {'充填率 平均':>11} {'最小':>6} {'標準偏差':>8} {'群内折返し':>10}")
+    for n in args.sizes:
+        isbns, books_map, group_of = make_library(n, random.Random(args.seed))
+        runs = [
+            ("greedy",          lambda: service._pack_into_shelves(isbns, books_map, shelf_max_px)),
+            ("balanced",        lambda: service._pack_balanced(isbns, books_map, shelf_max_px, ndc_break_penalty=0)),
+            ("balanced+ndc",    lambda: service._pack_balanced(isbns, books_map, shelf_max_px, group_of, args.penalty)),
+        ]
+        for name, run in runs:
+            t0   = time.perf_counter()
+            rows = run()
+            ms   = (time.perf_counter() - t0) * 1000
+            s    = summarize(rows, group_of, shelf_max_px)
+            print(f"{n:>8} {name:<16} {ms:>10.1f} {s['shelves']:>6} {s['fill_avg']:>11.3f} "
+                  f"{s['fill_min']:>6.3f} {s['fill_sd']:>8.3f} {s['inside']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+本棚まわりの処理を合成蔵書（synthetic_library.py）で計測するベンチマーク。
+冊数ごとに一時ディレクトリへ SQLite DB を作り、次の処理の時間と Python のメモリ使用量の
+ピーク（tracemalloc）を測って JSON に保存する。--compare で以前の結果と比べられる。
+
+  place_one            1冊を空きのある段に置く（add_to_shelf、commit 込み）
+  rebuild_full         NDC 順に全体を再配置（_rebuild_all, incremental=False）
+  rebuild_incremental  1冊のページ数が変わった後の差分再配置
+  fetch_cold           GET /bookshelf/（リードモデルを捨てた直後）
+  fetch_warm           GET /bookshelf/（キャッシュ済み）
+  fetch_range          GET /bookshelf/?from_shelf=0&to_shelf=4
+  sync_layout          POST /bookshelf/sync-layout（棚全体を送り、1冊だけ動かす）
+  layout_delta         POST /bookshelf/layout-delta（1冊の move）
+
+Neo4j には触れない（groups_from_neo4j は合成データの NDC 順に置き換え、
+write-behind ワーカーの反映先は何もしない関数にする）。
+プロジェクトルートから実行:
+  python backend/scripts/bench_shelf.py [--sizes 1000 10000 100000] [--repeat 5]
+      [--out shelf_bench.json] [--compare 前回の.json]
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+BACKEND_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+sys.path.insert(0, str(Path(__file__).parent))
+import routers.bookshelf as bookshelf_router
+import utils.shelf_utils as shelf_utils
+from database import get_db
+from models import RegisteredBook
+from utils.neo4j_sync_worker import shelf_sync_worker
+from utils.shelf_read_model import shelf_read_model
+from synthetic_library import create_library, ndc_groups
+
+try:
+    import resource   # Windows には無い
+except ImportError:
+    resource = None
+
+
+def measure(fn: Callable[[], object], repeat: int, setup: Callable[[], object] | None = None) -> dict:
+    """fn を repeat 回計測し、最後にもう1回 tracemalloc 付きで流してピークを取る"""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+
+    if setup:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "runs":      repeat,
+        "median_ms": round(statistics.median(times), 3),
+        "min_ms":    round(min(times), 3),
+        "max_ms":    round(max(times), 3),
+        "peak_kib":  round(peak / 1024, 1),
+    }
+
+
+def bench_size(n: int, repeat: int, seed: int, workdir: Path) -> list[dict]:
+    t0 = time.perf_counter()
+    # place_one は計測 + tracemalloc の1回ぶん、棚に置かない本を残しておく
+    session_factory, books = create_library(workdir / f"library_{n}.db", n, seed, unshelved=repeat + 1)
+    print(f"[{n}] 合成蔵書を作成 ({time.perf_counter() - t0:.1f} 秒)")
+
+    def _get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(bookshelf_router.router)
+    app.dependency_overrides[get_db] = _get_db
+    client = TestClient(app)
+
+    groups = ndc_groups(books)
+    shelf_utils.groups_from_neo4j = lambda: groups
+    shelf_read_model.invalidate()
+
+    service  = shelf_utils.ShelfService()
+    pending  = iter(books[n - repeat - 1:])
+    middle   = books[n // 2]["isbn"]
+    state    = {"x": 0, "version": 0}
+    results  = []
+
+    def run(name: str, fn, setup=None) -> None:
+        try:
+            result = measure(fn, repeat, setup)
+        except Exception as e:
+            result = {"error": f"{type(e).__name__}: {e}"}
+        results.append({"books": n, "op": name, **result})
+        shown = f"{result['median_ms']:>10.2f} ms  peak {result['peak_kib']:>10.1f} KiB" if "error" not in result else result["error"]
+        print(f"[{n}] {name:<20} {shown}")
+
+    def place_one():
+        with session_factory() as db:
+            book = db.query(RegisteredBook).filter(RegisteredBook.isbn == next(pending)["isbn"]).one()
+            if not service.add_to_shelf(db, book):
+                raise RuntimeError(f"配置に失敗: {book.isbn}")
+
+    def rebuild(incremental: bool):
+        with session_factory() as db:
+            service._rebuild_all(db, incremental=incremental)
+            db.commit()
+
+    def touch_middle_book():
+        with session_factory() as db:
+            book = db.query(RegisteredBook).filter(RegisteredBook.isbn == middle).one()
+            book.pages = (book.pages or 200) + 50 * nudge()
+            db.commit()
+
+    def nudge() -> int:
+        """動かす向きを交互に変える（毎回ちゃんと差分が出るように）"""
+        state["x"] += 1
+        return 1 if state["x"] % 2 else -1
+
+    def current_layout() -> list[dict]:
+        body = client.get("/bookshelf/").json()
+        state["version"] = body["layout_version"]
+        return [
+            {k: b[k] for k in ("isbn", "shelf_index", "x_pos", "order_index")}
+            for shelf in body["shelves"] for b in shelf["books"]
+        ]
+
+    def sync_layout():
+        layout[0]["x_pos"] += nudge()
+        response = client.post("/bookshelf/sync-layout", json={"layout": layout})
+        response.raise_for_status()
+        state["version"] = response.json()["version"]
+
+    def layout_delta():
+        layout[-1]["x_pos"] += nudge()
+        op = dict(layout[-1], op="move")
+        response = client.post("/bookshelf/layout-delta", json={"base_version": state["version"], "ops": [op]})
+        response.raise_for_status()
+        state["version"] = response.json()["version"]
+
+    run("place_one", place_one)
+    run("rebuild_full", lambda: rebuild(False))
+    run("rebuild_incremental", lambda: rebuild(True), setup=touch_middle_book)
+    run("fetch_cold", lambda: client.get("/bookshelf/").raise_for_status(), setup=shelf_read_model.invalidate)
+    run("fetch_warm", lambda: client.get("/bookshelf/").raise_for_status())
+    run("fetch_range", lambda: client.get("/bookshelf/", params={"from_shelf": 0, "to_shelf": 4}).raise_for_status())
+    layout = current_layout()
+    run("sync_layout", sync_layout)
+    run("layout_delta", layout_delta)
+
+    client.close()
+    return results
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(current: list[dict], previous_path: Path) -> None:
+    previous = {(r["books"], r["op"]): r for r in json.loads(previous_path.read_text())["results"]}
+    print(f"\n前回 ({previous_path}) との比較: 中央値の比（<1 が速い）")
+    for r in current:
+        old = previous.get((r["books"], r["op"]))
+        if not old or "median_ms" not in old or "median_ms" not in r:
+            continue
+        ratio = r["median_ms"] / old["median_ms"] if old["median_ms"] else float("inf")
+        print(f"  {r['books']:>8} {r['op']:<20} {old['median_ms']:>10.2f} → {r['median_ms']:>10.2f} ms  ×{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, default=Path("shelf_bench.json"))
+    parser.add_argument("--compare", type=Path, help="以前の結果の JSON")
+    args = parser.parse_args()
+
+    shelf_sync_worker._apply = lambda rows, **kwargs: None   # Neo4j には書かない
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="shelf_bench_") as tmp:
+        for n in args.sizes:
+            results.extend(bench_size(n, args.repeat, args.seed, Path(tmp)))
+    shelf_sync_worker.stop()
+
+    report = {
+        "meta": {
+            "commit":      _git_commit(),
+            "created_at":  datetime.now().isoformat(timespec="seconds"),
+            "python":      platform.python_version(),
+            "platform":    platform.platform(),
+            "seed":        args.seed,
+            "repeat":      args.repeat,
+            "max_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1) if resource else None,
+        },
+        "results": results,
+    }
+    args.out.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"\n結果 → {args.out}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
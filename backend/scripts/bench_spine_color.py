@@ -0,0 +1,60 @@
+"""
+背表紙の代表色抽出を colorthief(quality=1) と utils.spine_color で比較するベンチマーク。
+spine_image ディレクトリの画像をサンプルとして、1枚あたりの処理時間・色の差・
+colorthief と同じ色になった割合（一致率）を出力する。
+プロジェクトルートから実行:
+  python backend/scripts/bench_spine_color.py [--limit 20]
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from colorthief import ColorThief
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from utils.spine_color import dominant_color, extract_dominant_colors
+
+IMAGE_DIR = Path(__file__).parent.parent.parent / "frontend" / "public" / "spine_image"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=20, help="比較する画像の枚数（colorthief が遅いため）")
+    args = parser.parse_args()
+
+    images = sorted(IMAGE_DIR.glob("*.jpg"))[: args.limit]
+    if not images:
+        print(f"画像がありません: {IMAGE_DIR}")
+        return
+
+    ct_times, np_times, diffs = [], [], []
+    for path in images:
+        t0 = time.perf_counter()
+        ref = ColorThief(str(path)).get_color(quality=1)
+        ct_times.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        got = dominant_color(path)
+        np_times.append(time.perf_counter() - t0)
+
+        diff = max(abs(a - b) for a, b in zip(ref, got)) if got else 255
+        diffs.append(diff)
+        print(f"  {path.name:24s} colorthief={ref}  numpy={got}  diff={diff}")
+
+    t0 = time.perf_counter()
+    extract_dominant_colors(images)
+    batch_total = time.perf_counter() - t0
+
+    print(f"\n{len(images)} 枚")
+    print(f"  colorthief(quality=1): 平均 {statistics.mean(ct_times) * 1000:8.1f} ms/枚")
+    print(f"  numpy (1枚ずつ)      : 平均 {statistics.mean(np_times) * 1000:8.1f} ms/枚")
+    print(f"  numpy (バッチ)        : 平均 {batch_total / len(images) * 1000:8.1f} ms/枚")
+    exact = sum(d == 0 for d in diffs)
+    print(f"  一致率               : {exact}/{len(diffs)} 枚 ({exact / len(diffs):.0%})")
+    print(f"  色差(各チャネル最大値): 中央値 {statistics.median(diffs)} / 最大 {max(diffs)}")
+
+
+if __name__ == "__main__":
+    main()
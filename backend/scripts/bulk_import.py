@@ -0,0 +1,69 @@
+"""
+ISBN のリスト（CSV / テキスト）から registered_books に本を一括登録するスクリプト。
+NDL SRU へは 50 件ずつ OR でまとめて問い合わせ、未登録の本だけを1トランザクションで追加する。
+CSV はヘッダーに isbn 列があればその列、なければ各行の最初のセルを ISBN とみなす。
+プロジェクトルートから実行:
+  python backend/scripts/bulk_import.py isbns.csv
+  python backend/scripts/bulk_import.py 9784003101018 9784101010014
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from routers.register import _registration_service, parse_isbn_csv
+from routers.search import HttpClientManager
+
+# database.py の DB（./bookshelf.db）は実行時のカレントディレクトリ基準なので、ここでは絶対パスで開く
+DB_PATH = Path(__file__).parent.parent / "bookshelf.db"
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False,
+    bind=create_engine(f"sqlite:///{DB_PATH}", connect_args={"check_same_thread": False}),
+)
+
+
+async def main(isbns: list[str]):
+    await HttpClientManager.initialize()
+    db = SessionLocal()
+    try:
+        result = await _registration_service.import_isbns(db, isbns)
+    finally:
+        db.close()
+        await HttpClientManager.shutdown()
+
+    for isbn in result["imported"]:
+        print(f"  [OK] {isbn}")
+    for isbn in result["already_registered"]:
+        print(f"  [==] {isbn}  登録済み")
+    for isbn in result["not_found"]:
+        print(f"  [--] {isbn}  NDL に見つかりません")
+    for isbn in result["invalid"]:
+        print(f"  [NG] {isbn}  ISBN として不正")
+    print(
+        f"\n完了: {len(result['imported'])} 冊を登録"
+        f"（SRU リクエスト {result['sru_requests']} 回）"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sources", nargs="+", help="CSV / テキストファイル、または ISBN")
+    args = parser.parse_args()
+
+    isbns: list[str] = []
+    for src in args.sources:
+        path = Path(src)
+        if path.is_file():
+            isbns.extend(parse_isbn_csv(path.read_text(encoding="utf-8-sig")))
+        else:
+            isbns.append(src)
+
+    if not isbns:
+        print("ISBN がありません。")
+    else:
+        print(f"{len(isbns)} 件の ISBN を一括登録します...")
+        asyncio.run(main(isbns))
@@ -0,0 +1,50 @@
+"""
+Neo4j の LOCATES を本ごとに1本（現在の位置からの1本）に揃える一回限りのスクリプト。
+以前の update_shelf_layout_chain は本が動くたびに新しい位置から LOCATES を張るだけで
+古い位置からの LOCATES を外していなかったため、その残りを掃除する。
+現在の位置は SQLite の shelflayout（pos_r{段}_c{order_index}）から作る。
+アプリの write-behind 反映が追いついていない本（その位置からの LOCATES がまだ無い本）は
+最新の LOCATES を残すので、アプリを動かしたままでも実行できる。
+--newest を付けると SQLite を見ずに、ShelfPosition.updatedAt が最も新しい1本を残す。
+プロジェクトルートから実行:
+  python backend/scripts/compact_neo4j_locates.py [--newest]
+"""
+import argparse
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from admin_neo4j.neo4j_crud import compact_locates, locates_stats
+
+DB_PATH = Path(__file__).parent.parent / "bookshelf.db"
+
+
+def current_positions() -> dict[str, str]:
+    conn = sqlite3.connect(DB_PATH)
+    rows = conn.execute("SELECT isbn, shelf_index, order_index FROM shelflayout").fetchall()
+    conn.close()
+    return {isbn: f"pos_r{shelf_index}_c{order_index}" for isbn, shelf_index, order_index in rows}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--newest", action="store_true", help="SQLite を使わず updatedAt が最新の LOCATES を残す")
+    args = parser.parse_args()
+
+    before = locates_stats()
+    print(f"掃除前: LOCATES {before['locates_edges']} 本 / {before['books_located']} 冊 "
+          f"（1冊あたり {before['locates_per_book']}、最大 {before['max_per_book']}、"
+          f"複数ある本 {before['books_with_multiple']} 冊）")
+
+    t0 = time.perf_counter()
+    result = compact_locates(None if args.newest else current_positions())
+    print(f"LOCATES を {result['locates_removed']} 本、空の ShelfPosition を {result['positions_removed']} 個削除 "
+          f"({time.perf_counter() - t0:.1f} 秒)")
+    print(f"掃除後: LOCATES {result['locates_edges']} 本 / {result['books_located']} 冊 "
+          f"（1冊あたり {result['locates_per_book']}、最大 {result['max_per_book']}）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Neo4j の一意制約とインデックス（admin_neo4j/neo4j_schema.py の DEFINITIONS）を作成・確認するスクリプト。
+アプリの起動時にも同じ処理が走るが、既存データの重複で一意制約を作れなかった場合などに
+手で流して結果を確かめる用。何度実行してもよい。未作成のものが残れば終了コード 1。
+プロジェクトルートから実行:
+  python backend/scripts/ensure_neo4j_schema.py [--check]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from admin_neo4j.neo4j_schema import ensure_schema, verify_schema
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--check", action="store_true", help="作成せず、有無の確認だけ行う")
+    args = parser.parse_args()
+
+    report = verify_schema() if args.check else ensure_schema()
+    for name in report["present"]:
+        print(f"  [OK]     {name}")
+    for name in report["pending"]:
+        print(f"  [作成中] {name}")
+    for name in report["missing"]:
+        print(f"  [なし]   {name}")
+    for name, error in report.get("failed", {}).items():
+        print(f"  [失敗]   {name}: {error}")
+    sys.exit(1 if report["missing"] else 0)
+
+
+if __name__ == "__main__":
+    main()
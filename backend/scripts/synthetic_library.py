@@ -0,0 +1,160 @@
+"""
+ベンチマーク用の合成蔵書を作るスクリプト。
+冊数・NDC の分布・ページ数と判型の分布・著者と出版社の使い回し具合を指定して
+registered_books と shelflayout（NDC 順に先頭から詰めた配置）を持つ SQLite DB を作る。
+Neo4j には触れない。bench_shelf.py からも import して使う。
+プロジェクトルートから実行:
+  python backend/scripts/synthetic_library.py /tmp/synthetic.db --books 10000 [--seed 0]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from database import Base
+from models import RegisteredBook, ShelfDesign, ShelfLayout
+from utils.shelf_utils import ShelfService
+
+# NDC 第1次区分（類）の重み。個人の蔵書を想定して文学・社会科学・自然科学を厚めに
+NDC_CLASS_WEIGHTS = {
+    "0": 0.08, "1": 0.07, "2": 0.08, "3": 0.17, "4": 0.14,
+    "5": 0.09, "6": 0.03, "7": 0.06, "8": 0.03, "9": 0.25,
+}
+
+# 判型: (size_label, 高さ mm, 重み, ページ数の中央値)
+SIZES = [
+    ("文庫", 148, 0.30, 280),
+    ("新書", 173, 0.20, 230),
+    ("四六", 188, 0.30, 320),
+    ("A5",   210, 0.15, 360),
+    ("B5",   257, 0.05, 200),
+]
+
+
+def isbn13(serial: int) -> str:
+    """連番から 978 始まりの ISBN-13（チェックディジット付き）を作る"""
+    body = f"978{serial % 10**9:09d}"
+    total = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(body))
+    return body + str((10 - total % 10) % 10)
+
+
+def _zipf_pool(rng: random.Random, size: int, n: int, s: float = 1.1) -> list[int]:
+    """0..size-1 から Zipf 風（上位ほど多い）に n 個選ぶ"""
+    weights = [1 / (k + 1) ** s for k in range(size)]
+    return rng.choices(range(size), weights=weights, k=n)
+
+
+def generate_books(
+    n: int,
+    seed: int = 0,
+    ndc_weights: dict[str, float] | None = None,
+    books_per_author: float = 3.0,
+    publishers: int = 300,
+    missing_pages: float = 0.02,
+) -> list[dict]:
+    """
+    registered_books に入れる n 冊分の dict を返す。
+      ndc_weights      NDC 類ごとの重み（省略時は NDC_CLASS_WEIGHTS）
+      books_per_author 著者1人あたりの平均冊数（著者は Zipf 分布で使い回す）
+      publishers       出版社の数（同じく Zipf）
+      missing_pages    ページ数不明（None）の割合
+    """
+    rng     = random.Random(seed)
+    weights = ndc_weights or NDC_CLASS_WEIGHTS
+    classes = rng.choices(list(weights), weights=list(weights.values()), k=n)
+    sizes   = rng.choices(SIZES, weights=[s[2] for s in SIZES], k=n)
+    authors = _zipf_pool(rng, max(1, int(n / books_per_author)), n)
+    pubs    = _zipf_pool(rng, publishers, n)
+
+    books = []
+    for i in range(n):
+        label, height, _, median_pages = sizes[i]
+        # 綱（2桁目）は小さい番号ほど多く、目（3桁目）は一様
+        ndc = classes[i] + str(min(9, int(rng.paretovariate(1.5)) - 1)) + str(rng.randrange(10))
+        if rng.random() < 0.4:
+            ndc += "." + str(rng.randrange(1, 10))
+        pages = None if rng.random() < missing_pages else max(32, int(rng.lognormvariate(0, 0.35) * median_pages))
+        books.append({
+            "isbn":           isbn13(seed * 10**7 + i),
+            "title":          f"合成書籍 {i:06d}",
+            "authors":        f"著者{authors[i]:05d}",
+            "publisher":      f"出版社{pubs[i]:03d}",
+            "published_year": str(rng.randint(1960, 2026)),
+            "ndc":            ndc,
+            "pages":          pages,
+            "height_mm":      height,
+            "size_label":     label,
+        })
+    return books
+
+
+def ndc_groups(books: list[dict]) -> list[dict]:
+    """groups_from_neo4j と同じ形（NDC 順・同じ NDC の中はタイトル順）のグループ"""
+    by_ndc: dict[str, list[dict]] = {}
+    for b in books:
+        by_ndc.setdefault(b["ndc"] or "未分類", []).append(b)
+    groups = []
+    for ndc in sorted(by_ndc, key=lambda c: (not c[0].isdigit(), float(c) if c[0].isdigit() else 0)):
+        members = sorted(by_ndc[ndc], key=lambda b: b["title"])
+        groups.append({"ndc": ndc, "books": [{"isbn": b["isbn"], "title": b["title"], "cover": None} for b in members]})
+    return groups
+
+
+def fill_database(db: Session, books: list[dict], unshelved: int = 0) -> None:
+    """
+    books を registered_books に入れ、最後の unshelved 冊以外を NDC 順に棚へ詰める。
+    shelf_occupancy も作る。
+    """
+    service = ShelfService()
+    db.bulk_insert_mappings(RegisteredBook, books)
+
+    shelved   = books[: len(books) - unshelved]
+    isbns     = [b["isbn"] for g in ndc_groups(shelved) for b in g["books"]]
+    books_map = {b["isbn"]: b for b in shelved}
+    rows      = service._pack_into_shelves(isbns, books_map, ShelfService.SHELF_MAX_WIDTH_PX)
+    db.bulk_insert_mappings(ShelfLayout, rows)
+    db.add(ShelfDesign(total_shelves=rows[-1]["shelf_index"] + 1 if rows else 1, layout_version=0))
+    db.flush()
+    service.rebuild_occupancy(db)
+    db.commit()
+
+
+def create_library(path: Path, n: int, seed: int = 0, unshelved: int = 0, **kwargs) -> tuple[sessionmaker, list[dict]]:
+    """path に合成蔵書の DB を作り、(その DB の sessionmaker, 本の一覧) を返す"""
+    path.unlink(missing_ok=True)
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    books = generate_books(n, seed, **kwargs)
+    with session_factory() as db:
+        fill_database(db, books, unshelved)
+    return session_factory, books
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", type=Path, help="作成する SQLite ファイル（既存なら上書き）")
+    parser.add_argument("--books", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--unshelved", type=int, default=0, help="棚に置かずに登録だけする冊数")
+    parser.add_argument("--books-per-author", type=float, default=3.0)
+    parser.add_argument("--publishers", type=int, default=300)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    _, books = create_library(
+        args.path, args.books, args.seed, args.unshelved,
+        books_per_author=args.books_per_author, publishers=args.publishers,
+    )
+    print(f"{len(books)} 冊 → {args.path} ({time.perf_counter() - t0:.1f} 秒)")
+
+
+if __name__ == "__main__":
+    main()
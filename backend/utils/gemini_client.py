@@ -7,6 +7,8 @@ from google.genai import types
 from google.genai.errors import ClientError as GeminiClientError, ServerError as GeminiServerError
 from dotenv import load_dotenv
 
+from utils.vision_cache import cached_vision
+
 load_dotenv(Path(__file__).parent.parent / ".env")
 
 
@@ -63,6 +65,7 @@ class GeminiClient:
         """モデルにJSON出力を強制させる（構造化データの抽出用）。"""
         return self._generate_with_fallback(prompt, max_tokens, json_mode=True)
 
+    @cached_vision
     def generate_from_image(self, image_data: bytes, media_type: str, prompt: str, max_tokens: int = 256) -> str:
         contents = [
             types.Part.from_bytes(data=image_data, mime_type=media_type),
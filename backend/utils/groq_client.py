@@ -6,6 +6,8 @@ from pathlib import Path
 from groq import Groq
 from dotenv import load_dotenv
 
+from utils.vision_cache import cached_vision
+
 load_dotenv(Path(__file__).parent.parent / ".env")
 
 
@@ -49,6 +51,7 @@ class GroqClient:
         )
         return (response.choices[0].message.content or "").strip()
 
+    @cached_vision
     def generate_from_image(self, image_data: bytes, media_type: str, prompt: str, max_tokens: int = 256) -> str:
         image_b64 = base64.standard_b64encode(image_data).decode("utf-8")
         response = self._get_client().chat.completions.create(
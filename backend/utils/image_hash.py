@@ -0,0 +1,154 @@
+"""背表紙画像の知覚ハッシュ（pHash）と、近傍検索用の BK-tree。
+
+同じ本を撮り直した画像は、解像度・明るさ・JPEG 圧縮・多少のトリミングが違っても
+pHash のハミング距離が小さくなる。登録済み画像のハッシュを BK-tree に載せておき、
+新しいアップロードを OCR / AI 抽出の前に照合する。
+"""
+from __future__ import annotations
+
+import io
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from models import RegisteredBook
+
+# 背表紙は細長いので、縦横比 1:2 のグレースケール画像の DCT 低周波 8x16 を使う（127bit）
+SAMPLE_H, SAMPLE_W = 32, 64
+HASH_H,   HASH_W   = 8, 16
+HASH_BITS          = HASH_H * HASH_W - 1      # 直流成分は除く
+MAX_DISTANCE       = 14    # この距離以内なら同じ背表紙とみなす（別の本同士は概ね 25 以上）
+
+ImageSource = bytes | str | Path
+
+
+@lru_cache(maxsize=None)
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    m[0] /= np.sqrt(2)
+    return m
+
+
+def phash(source: ImageSource) -> int:
+    """
+    知覚ハッシュ（pHash）を整数で返す。
+    背表紙は縦撮り・横撮りどちらもあり得るので、長辺が横になるように揃えてから計算する。
+    """
+    fp  = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+    img = Image.open(fp)
+    img.draft("L", (SAMPLE_W * 4, SAMPLE_H * 4))   # JPEG は縮小デコード
+    img = img.convert("L")
+    if img.height > img.width:
+        img = img.transpose(Image.Transpose.ROTATE_90)
+
+    pixels = np.asarray(img.resize((SAMPLE_W, SAMPLE_H), Image.Resampling.BOX), dtype=np.float64)
+    coeffs = _dct_matrix(SAMPLE_H) @ pixels @ _dct_matrix(SAMPLE_W).T
+    low    = coeffs[:HASH_H, :HASH_W].ravel()[1:]
+    bits   = low > np.median(low)
+    return int.from_bytes(np.packbits(bits).tobytes(), "big") >> (-HASH_BITS % 8)
+
+
+def to_hex(h: int) -> str:
+    return f"{h:0{-(-HASH_BITS // 4)}x}"
+
+
+def from_hex(s: str) -> int:
+    return int(s, 16)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """ハミング距離の BK-tree。ノードは [hash, 値, {距離: 子ノード}]。"""
+
+    def __init__(self):
+        self._root: list | None = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, h: int, value) -> None:
+        node = [h, value, {}]
+        self._size += 1
+        if self._root is None:
+            self._root = node
+            return
+        cur = self._root
+        while True:
+            d = hamming(h, cur[0])
+            if d == 0:
+                cur[1] = value   # 同一ハッシュは上書き
+                self._size -= 1
+                return
+            child = cur[2].get(d)
+            if child is None:
+                cur[2][d] = node
+                return
+            cur = child
+
+    def search(self, h: int, max_distance: int) -> list[tuple[int, object]]:
+        """距離 max_distance 以内の (距離, 値) を距離の昇順で返す。"""
+        if self._root is None:
+            return []
+        found, stack = [], [self._root]
+        while stack:
+            node = stack.pop()
+            d = hamming(h, node[0])
+            if d <= max_distance:
+                found.append((d, node[1]))
+            # 三角不等式で探索範囲を絞る
+            for dist, child in node[2].items():
+                if d - max_distance <= dist <= d + max_distance:
+                    stack.append(child)
+        found.sort(key=lambda x: x[0])
+        return found
+
+
+class SpineHashIndex:
+    """
+    registered_books.spine_hash を BK-tree に載せたプロセス内インデックス。
+    初回アクセス時に DB から構築し、以降は save 時に追記する。
+    """
+
+    def __init__(self, max_distance: int = MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._tree   = BKTree()
+        self._loaded = False
+        self._lock   = threading.Lock()
+
+    def ensure_loaded(self, db) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            rows = (
+                db.query(RegisteredBook.isbn, RegisteredBook.spine_hash)
+                .filter(RegisteredBook.spine_hash.isnot(None))
+                .all()
+            )
+            for isbn, spine_hash in rows:
+                self._tree.add(from_hex(spine_hash), isbn)
+            self._loaded = True
+
+    def find(self, db, h: int) -> tuple[str, int] | None:
+        """最も近い登録済み背表紙の (isbn, 距離) を返す。しきい値内になければ None。"""
+        self.ensure_loaded(db)
+        with self._lock:
+            hits = self._tree.search(h, self.max_distance)
+        return (hits[0][1], hits[0][0]) if hits else None
+
+    def add(self, isbn: str, h: int) -> None:
+        with self._lock:
+            self._tree.add(h, isbn)
+
+
+spine_hash_index = SpineHashIndex()
@@ -0,0 +1,239 @@
+"""本棚配置の長期履歴（差分エンコード + チェックポイント）。
+
+以前は sync のたびに全冊ぶんの PlacementEvent ノードを Neo4j に作っていたため、
+グラフが「同期回数 × 蔵書数」で増えていた。ここでは shelf_changes.record() が
+呼ばれるたびに、その version で動いた本だけを1行（zlib 圧縮した JSON）で残す。
+
+  差分:          {"m": [[isbn, shelf_index, x_pos, order_index], ...], "r": [isbn, ...], "t": total_shelves?}
+  チェックポイント: {"m": 全冊, "t": total_shelves}
+
+チェックポイントは最初の記録・全体再配置・CHECKPOINT_EVERY version ごとに入れる。
+任意時点の棚は「その時点以前の最新チェックポイント + 以降の差分」で復元する。
+created_at は shelf_layout_changes と同じく UTC（SQLite の CURRENT_TIMESTAMP）。
+"""
+from __future__ import annotations
+
+import json
+import zlib
+from datetime import datetime, timezone
+
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import ShelfDesign, ShelfLayout, ShelfLayoutHistory
+
+
+class LayoutHistory:
+
+    CHECKPOINT_EVERY = 100
+
+    # ── エンコード ────────────────────────────────────────────────
+
+    @staticmethod
+    def _pack(payload: dict) -> bytes:
+        return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    @staticmethod
+    def _unpack(data: bytes) -> dict:
+        return json.loads(zlib.decompress(data))
+
+    @staticmethod
+    def _encode_ops(ops: list[dict]) -> tuple[dict, bool]:
+        """操作列を差分に変換する。全体再配置（reset）を含むなら2つ目が True。"""
+        moved:   dict[str, list] = {}
+        removed: list[str]       = []
+        delta:   dict            = {}
+        reset = False
+        for op in ops:
+            kind = op["op"]
+            if kind in ("move", "insert"):
+                moved[op["isbn"]] = [op["isbn"], op["shelf_index"], op["x_pos"], op.get("order_index", 0)]
+                if op["isbn"] in removed:
+                    removed.remove(op["isbn"])
+            elif kind == "remove":
+                moved.pop(op["isbn"], None)
+                removed.append(op["isbn"])
+            elif kind == "shelves":
+                delta["t"] = op["total_shelves"]
+            elif kind == "reset":
+                reset = True
+        if moved:
+            delta["m"] = list(moved.values())
+        if removed:
+            delta["r"] = removed
+        return delta, reset
+
+    @staticmethod
+    def _snapshot(db: Session) -> dict:
+        db.flush()   # 同じトランザクションで追加・更新した行も含める
+        rows = db.query(
+            ShelfLayout.isbn, ShelfLayout.shelf_index, ShelfLayout.x_pos, ShelfLayout.order_index,
+        ).all()
+        design = db.query(ShelfDesign).first()
+        return {
+            "m": [[r.isbn, r.shelf_index, r.x_pos, r.order_index] for r in rows],
+            "t": design.total_shelves if design else 1,
+        }
+
+    # ── 書き込み ──────────────────────────────────────────────────
+
+    def append(self, db: Session, version: int, ops: list[dict]) -> None:
+        """version の操作を履歴に積む（commit は呼び出し側）。"""
+        delta, reset = self._encode_ops(ops)
+        checkpoint = (
+            reset
+            or version % self.CHECKPOINT_EVERY == 0
+            or db.query(ShelfLayoutHistory.id).first() is None
+        )
+        if not checkpoint and not delta:
+            return
+        db.add(ShelfLayoutHistory(
+            version=version,
+            is_checkpoint=checkpoint,
+            data=self._pack(self._snapshot(db) if checkpoint else delta),
+        ))
+
+    # ── 読み出し ──────────────────────────────────────────────────
+
+    @staticmethod
+    def _apply(state: dict, total: list, payload: dict, checkpoint: bool) -> None:
+        if checkpoint:
+            state.clear()
+        for isbn in payload.get("r", []):
+            state.pop(isbn, None)
+        for isbn, shelf_index, x_pos, order_index in payload.get("m", []):
+            state[isbn] = (shelf_index, x_pos, order_index)
+        if "t" in payload:
+            total[0] = payload["t"]
+
+    @staticmethod
+    def _to_utc(at: datetime) -> datetime:
+        """比較用に naive UTC にそろえる（タイムゾーンの無い at は UTC とみなす）"""
+        return at.astimezone(timezone.utc).replace(tzinfo=None) if at.tzinfo else at
+
+    def state_at(self, db: Session, at: datetime | None = None, version: int | None = None) -> dict | None:
+        """時刻 at（または version）時点の棚を復元する。履歴が無い時点なら None。"""
+        if at is not None:
+            at = self._to_utc(at)
+        query = db.query(ShelfLayoutHistory).filter(ShelfLayoutHistory.is_checkpoint.is_(True))
+        if version is not None:
+            query = query.filter(ShelfLayoutHistory.version <= version)
+        if at is not None:
+            query = query.filter(ShelfLayoutHistory.created_at <= at)
+        checkpoint = query.order_by(ShelfLayoutHistory.version.desc()).first()
+        if checkpoint is None:
+            return None
+
+        state: dict[str, tuple] = {}
+        total = [1]
+        last  = checkpoint
+        self._apply(state, total, self._unpack(checkpoint.data), True)
+
+        deltas = db.query(ShelfLayoutHistory)\
+            .filter(ShelfLayoutHistory.version > checkpoint.version)
+        if version is not None:
+            deltas = deltas.filter(ShelfLayoutHistory.version <= version)
+        if at is not None:
+            deltas = deltas.filter(ShelfLayoutHistory.created_at <= at)
+        for row in deltas.order_by(ShelfLayoutHistory.version).yield_per(500):
+            self._apply(state, total, self._unpack(row.data), row.is_checkpoint)
+            last = row
+
+        shelves: dict[int, list] = {}
+        for isbn, (shelf_index, x_pos, order_index) in sorted(state.items(), key=lambda kv: (kv[1][0], kv[1][1])):
+            shelves.setdefault(shelf_index, []).append({
+                "isbn":        isbn,
+                "shelf_index": shelf_index,
+                "x_pos":       x_pos,
+                "order_index": order_index,
+            })
+        return {
+            "version":       last.version,
+            "timestamp":     last.created_at.replace(tzinfo=timezone.utc).isoformat(),
+            "total_shelves": total[0],
+            "shelves":       [{"shelf_index": k, "books": v} for k, v in sorted(shelves.items())],
+        }
+
+    def placement_events(self, isbn: str, db: Session | None = None) -> list[dict]:
+        """
+        1冊の配置変遷（置かれた・動いた version ごと）を時系列で返す。
+        各イベントには移動先・移動元の段/列と、移動先の段での端・孤立の判定を付ける。
+
+        全履歴を棚全体として再生するのではなく、各行は展開して ISBN の文字列を探すだけにする。
+        その本が出てくる行があるチェックポイント区間だけ、区間の先頭のチェックポイントから
+        棚の状態を組み立てる（本が一度も動かない区間は JSON も読まない）。
+        """
+        own_session = db is None
+        db = db or SessionLocal()
+        needle = json.dumps(isbn, ensure_ascii=False).encode("utf-8")
+        try:
+            events: list[dict] = []
+            previous: tuple | None = None
+            window:   list[bytes]        = []     # 区間のチェックポイント + 以降の差分（未展開）
+            state:    dict | None        = None   # 区間の状態（その本が出てくるまで作らない）
+            total = [1]
+            rows = db.query(
+                ShelfLayoutHistory.version, ShelfLayoutHistory.created_at,
+                ShelfLayoutHistory.is_checkpoint, ShelfLayoutHistory.data,
+            ).order_by(ShelfLayoutHistory.version)
+            for row in rows.yield_per(500):
+                if row.is_checkpoint:
+                    window, state = [], None
+                elif not window:
+                    continue   # 最初のチェックポイントより前
+                raw = zlib.decompress(row.data)
+                if state is None:
+                    window.append(raw)
+                    if needle not in raw:
+                        if row.is_checkpoint:
+                            previous = None   # この時点で棚に無い
+                        continue
+                    # 区間の先頭から今の行までを組み立てる
+                    state = {}
+                    for i, chunk in enumerate(window):
+                        payload = json.loads(chunk)
+                        self._apply(state, total, payload, i == 0)
+                    window = [b""]   # 以降は state に直接適用する（区間が続いている印）
+                else:
+                    payload = json.loads(raw)
+                    self._apply(state, total, payload, False)
+                    if needle not in raw:
+                        continue
+
+                current = state.get(isbn)
+                if current is None:
+                    previous = None
+                    continue
+                if current == previous:
+                    continue
+                moved_now = any(m[0] == isbn for m in payload.get("m", []))
+                if not moved_now and previous is not None:
+                    previous = current
+                    continue
+                shelf = sorted(v[1] for v in state.values() if v[0] == current[0])
+                events.append({
+                    "version":      row.version,
+                    "timestamp":    row.created_at.replace(tzinfo=timezone.utc),
+                    "shelf_index":  current[0],
+                    "order_index":  current[2],
+                    "x_pos":        current[1],
+                    "is_edge":      current[1] in (shelf[0], shelf[-1]),
+                    "is_isolated":  len(shelf) == 1,
+                    "from":         previous and {"shelf_index": previous[0], "order_index": previous[2]},
+                })
+                previous = current
+            return events
+        finally:
+            if own_session:
+                db.close()
+
+
+# ============================================================
+# モジュールレベル互換
+# ============================================================
+
+_layout_history = LayoutHistory()
+
+append_layout_history = _layout_history.append
+layout_state_at       = _layout_history.state_at
+placement_events      = _layout_history.placement_events
@@ -0,0 +1,206 @@
+"""本棚配置を Neo4j に反映する write-behind ワーカー。
+
+/bookshelf/sync-layout は SQLite に commit した時点でレスポンスを返し、
+Neo4j への反映（ShelfPosition / LOCATES / SHELF_NEXT）はここに積む。
+短時間に続けて届いたスナップショットは ISBN 単位でまとめ（新しい方が勝つ）、
+静かになってから1回だけ update_shelf_layout_chain を呼ぶ。失敗したら
+バックオフしながら再試行する。
+
+各スナップショットは「変更のあった段に並ぶ本すべて」「実際に動いた本」「棚から外した本」
+「変更のあった段番号」の組。ISBN ごとに最新の行を残せば、まとめた段の集合に対しても
+段ごとに完全なリストになる（外した本は行から除き、後から戻された本は外した本から除く）。
+段番号は別に和集合で持つ。空になった段は行が1つも無いので、行からは分からないため。
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable
+
+from admin_neo4j.neo4j_crud import update_shelf_layout_chain
+
+logger = logging.getLogger(__name__)
+
+
+class ShelfSyncWorker:
+
+    DEBOUNCE_SECONDS  = 0.5    # 最後のスナップショットからこの時間静かなら反映する
+    MAX_DELAY_SECONDS = 3.0    # ドラッグが続いても、最初の未反映からこの時間で反映する
+    MAX_ATTEMPTS      = 5
+    BACKOFF_SECONDS   = 1.0    # 再試行の待ち時間（1, 2, 4, ... 秒）
+
+    _instance: "ShelfSyncWorker | None" = None
+
+    def __init__(self, apply: Callable[..., dict | None] = update_shelf_layout_chain):
+        self._apply = apply
+        self._cond  = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._stopping = False
+
+        # 未反映の変更
+        self._rows:     dict[str, dict] = {}
+        self._changed:  set[str]        = set()
+        self._removed:  set[str]        = set()
+        self._shelves:  set[int]        = set()
+        self._first_at: float | None    = None   # 最も古い未反映スナップショットの受付時刻
+        self._last_at:  float | None    = None   # 最も新しいスナップショットの受付時刻
+        self._in_flight_since: float | None = None
+        self._pending_snapshots = 0
+
+        # 統計
+        self.submitted      = 0
+        self.batches        = 0
+        self.applied        = 0
+        self.retries        = 0
+        self.dropped        = 0
+        self.last_success:  datetime | None = None
+        self.last_error:    str | None      = None
+        self.last_apply:    dict | None     = None   # update_shelf_layout_chain の戻り値（件数・段階ごとの時間）
+
+    @classmethod
+    def get_instance(cls) -> "ShelfSyncWorker":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    # ── 受付 ────────────────────────────────────────────────────
+
+    def submit(
+        self,
+        rows: list[dict],
+        changed_isbns: list[str],
+        removed_isbns: list[str] = (),
+        shelves: list[int] = (),
+    ) -> None:
+        """スナップショットを積む（すぐ戻る）。shelves は変更のあった段（空になった段も含む）。"""
+        now = time.monotonic()
+        with self._cond:
+            for row in rows:
+                self._rows[row["isbn"]] = row
+                self._removed.discard(row["isbn"])
+            self._changed.update(changed_isbns)
+            for isbn in removed_isbns:
+                self._rows.pop(isbn, None)
+                self._changed.discard(isbn)
+                self._removed.add(isbn)
+            self._shelves.update(shelves)
+            self._shelves.update(row["shelf_index"] for row in rows)
+            self.submitted += 1
+            self._pending_snapshots += 1
+            if self._first_at is None:
+                self._first_at = now
+            self._last_at = now
+            self._ensure_started()
+            self._cond.notify()
+
+    def _ensure_started(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="shelf-neo4j-sync", daemon=True)
+            self._thread.start()
+
+    # ── ワーカー本体 ──────────────────────────────────────────────
+
+    def _take_batch(self) -> tuple[list[dict], list[str], list[str], list[int]] | None:
+        """まとめ終わった未反映分を取り出す。停止要求で空なら None。"""
+        with self._cond:
+            while True:
+                if not self._rows and not self._removed and not self._shelves:
+                    if self._stopping:
+                        return None
+                    self._cond.wait()
+                    continue
+                now   = time.monotonic()
+                quiet = self._last_at + self.DEBOUNCE_SECONDS - now
+                limit = self._first_at + self.MAX_DELAY_SECONDS - now
+                wait  = min(quiet, limit)
+                if wait > 0 and not self._stopping:
+                    self._cond.wait(wait)
+                    continue
+                rows, changed, removed = list(self._rows.values()), list(self._changed), list(self._removed)
+                shelves = sorted(self._shelves)
+                self._in_flight_since = self._first_at
+                self._reset_pending()
+                self.batches += 1
+                return rows, changed, removed, shelves
+
+    def _reset_pending(self) -> None:
+        self._rows, self._changed, self._removed, self._shelves = {}, set(), set(), set()
+        self._first_at = self._last_at = None
+        self._pending_snapshots = 0
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            rows, changed, removed, shelves = batch
+
+            for attempt in range(1, self.MAX_ATTEMPTS + 1):
+                try:
+                    result = self._apply(rows, changed_isbns=changed, removed_isbns=removed, shelves=shelves)
+                except Exception as e:
+                    self.last_error = f"{type(e).__name__}: {e}"
+                    if attempt == self.MAX_ATTEMPTS:
+                        self.dropped += 1
+                        logger.error(f"[shelf-sync] Neo4j 反映を断念 ({len(rows)}冊): {e}")
+                        break
+                    self.retries += 1
+                    logger.warning(f"[shelf-sync] Neo4j 反映に失敗 (試行{attempt}): {e}")
+                    with self._cond:
+                        if not self._stopping:   # 停止時は待たずに再試行する
+                            self._cond.wait(self.BACKOFF_SECONDS * 2 ** (attempt - 1))
+                        # 待っている間に届いた新しい変更も一緒に反映する
+                        if self._rows or self._removed or self._shelves:
+                            merged = {r["isbn"]: r for r in rows if r["isbn"] not in self._removed}
+                            merged.update(self._rows)
+                            rows    = list(merged.values())
+                            changed = list((set(changed) - self._removed) | self._changed)
+                            removed = list((set(removed) - set(self._rows)) | self._removed)
+                            shelves = sorted(set(shelves) | self._shelves)
+                            self._reset_pending()
+                    continue
+                self.applied += 1
+                self.last_success = datetime.now()
+                self.last_apply   = result if isinstance(result, dict) else None
+                logger.info(f"[shelf-sync] Neo4j 反映 {len(rows)}冊 (移動 {len(changed)}冊 / 取り外し {len(removed)}冊)")
+                break
+
+            with self._cond:
+                self._in_flight_since = None
+                self._cond.notify_all()
+
+    # ── 停止・状態 ──────────────────────────────────────────────
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """未反映分を反映してから止める（アプリ終了時）。"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            oldest = self._in_flight_since or self._first_at
+            return {
+                "pending_books":  len(self._rows),
+                "pending_moved":  len(self._changed),
+                "pending_removed": len(self._removed),
+                "in_flight":      self._in_flight_since is not None,
+                "lag_seconds":    round(time.monotonic() - oldest, 3) if oldest else 0.0,
+                "submitted":      self.submitted,
+                "batches":        self.batches,
+                "coalesced":      self.submitted - self.batches - self._pending_snapshots,
+                "applied":        self.applied,
+                "retries":        self.retries,
+                "dropped":        self.dropped,
+                "last_success":   self.last_success.isoformat() if self.last_success else None,
+                "last_error":     self.last_error,
+                "last_apply":     self.last_apply,
+            }
+
+
+shelf_sync_worker = ShelfSyncWorker.get_instance()
@@ -0,0 +1,157 @@
+"""本棚配置の変更を WebSocket で配信するブロードキャスタ。
+
+配置を変える書き込みは shelf_changes.record() で操作を session.info に積む。
+このモジュールは Session の after_commit をフックして、commit された操作だけを
+接続中のクライアントへ流す（rollback された操作は捨てる）。
+
+クライアントごとに未送信の差分を ISBN 単位でまとめておき、送信が追いつかない
+クライアントには途中の状態を送らず最新の位置だけを送る（背圧）。まとめた差分が
+MAX_PENDING_BOOKS を超えたら {"type": "reset"} に置き換え、全体の取り直しを促す。
+
+送信メッセージ:
+  {"type": "diff", "base_version", "version",
+   "books": [{"isbn", "shelf_index", "x_pos"}], "removed": [isbn], "total_shelves"?}
+  {"type": "reset", "version"}
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+
+from fastapi import WebSocket
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = "layout_changes"   # shelf_changes.record() が session.info に積むキー
+
+
+class _Client:
+    """1接続分の未送信差分。イベントループのスレッドからだけ触る。"""
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self.ready = asyncio.Event()
+        self._clear()
+
+    def _clear(self) -> None:
+        self.books:   dict[str, dict] = {}
+        self.removed: set[str]        = set()
+        self.total_shelves: int | None = None
+        self.base_version:  int | None = None
+        self.version:       int | None = None
+        self.reset = False
+
+    def merge(self, version: int, ops: list[dict]) -> None:
+        if self.base_version is None:
+            self.base_version = version - 1
+        self.version = version
+        for op in ops:
+            kind = op["op"]
+            if kind in ("move", "insert"):
+                self.removed.discard(op["isbn"])
+                self.books[op["isbn"]] = {
+                    "isbn":        op["isbn"],
+                    "shelf_index": op["shelf_index"],
+                    "x_pos":       op["x_pos"],
+                }
+            elif kind == "remove":
+                self.books.pop(op["isbn"], None)
+                self.removed.add(op["isbn"])
+            elif kind == "shelves":
+                self.total_shelves = op["total_shelves"]
+            elif kind == "reset":
+                self.reset = True
+        if len(self.books) + len(self.removed) > self.max_pending:
+            self.reset = True
+        self.ready.set()
+
+    def take(self) -> dict:
+        if self.reset:
+            message = {"type": "reset", "version": self.version}
+        else:
+            message = {
+                "type":         "diff",
+                "base_version": self.base_version,
+                "version":      self.version,
+                "books":        list(self.books.values()),
+                "removed":      sorted(self.removed),
+            }
+            if self.total_shelves is not None:
+                message["total_shelves"] = self.total_shelves
+        self._clear()
+        self.ready.clear()
+        return message
+
+    async def pump(self, ws: WebSocket) -> None:
+        """差分が溜まるたびに送る。送信中に届いた変更は次の1通にまとまる。"""
+        while True:
+            await self.ready.wait()
+            await ws.send_json(self.take())
+
+
+class ShelfBroadcaster:
+
+    MAX_PENDING_BOOKS = 500
+
+    _instance: "ShelfBroadcaster | None" = None
+
+    def __init__(self, max_pending: int = MAX_PENDING_BOOKS):
+        self.max_pending = max_pending
+        self._clients: set[_Client] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> "ShelfBroadcaster":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def connect(self) -> _Client:
+        client = _Client(self.max_pending)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._clients.add(client)
+        return client
+
+    def disconnect(self, client: _Client) -> None:
+        with self._lock:
+            self._clients.discard(client)
+
+    @property
+    def client_count(self) -> int:
+        return len(self._clients)
+
+    def publish(self, version: int, ops: list[dict]) -> None:
+        """commit 済みの操作を全クライアントに配る。どのスレッドから呼んでもよい。"""
+        with self._lock:
+            loop = self._loop
+            if loop is None or not self._clients:
+                return
+        try:
+            loop.call_soon_threadsafe(self._dispatch, version, ops)
+        except RuntimeError:
+            pass   # イベントループ終了後
+
+    def _dispatch(self, version: int, ops: list[dict]) -> None:
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            client.merge(version, ops)
+
+
+shelf_broadcaster = ShelfBroadcaster.get_instance()
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session: Session) -> None:
+    for version, ops in session.info.pop(SESSION_KEY, []):
+        shelf_broadcaster.publish(version, ops)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session) -> None:
+    session.info.pop(SESSION_KEY, None)
@@ -0,0 +1,116 @@
+"""本棚配置のバージョン管理と変更ログ。
+
+配置を変える書き込み（並べ替え・差分適用・1冊配置・削除・段の増減・全体再配置）は
+同じトランザクションの中で record() を呼ぶ。ShelfDesign.layout_version を
+条件付き UPDATE（読んだ値のままなら +1）で進め、その version で行った操作を
+shelf_layout_changes に1行で残す。base_version 付きの書き込みは expected_version を渡し、
+先を越されていたら LayoutVersionConflict になる（API では 409）。
+操作は session.info にも積み、commit 後に WebSocket で配信される（shelf_broadcast）。
+長期の履歴（時点復元用）は layout_history に圧縮して残す。
+
+操作の形式:
+  {"op": "move",   "isbn", "shelf_index", "x_pos", "order_index"}
+  {"op": "insert", "isbn", "shelf_index", "x_pos", "order_index"}
+  {"op": "remove", "isbn"}
+  {"op": "shelves", "total_shelves"}
+  {"op": "reset"}        全体再配置。クライアントは /bookshelf/ を取り直す
+"""
+from __future__ import annotations
+
+import json
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import ShelfDesign, ShelfLayoutChange
+from utils.shelf_broadcast import SESSION_KEY
+from utils.layout_history import append_layout_history
+
+
+class LayoutVersionConflict(Exception):
+    """record(expected_version=...) の時点で layout_version が既に進んでいた"""
+
+    def __init__(self, current: int):
+        super().__init__(f"layout_version は既に {current} です")
+        self.current = current
+
+
+class ShelfChangeLog:
+
+    MAX_HISTORY = 1000   # 保持する version 数。これより古い差分は要求されたら全体取得を促す
+
+    @staticmethod
+    def _get_design(db: Session) -> ShelfDesign:
+        design = db.query(ShelfDesign).first()
+        if not design:
+            design = ShelfDesign(total_shelves=1, layout_version=0)
+            db.add(design)
+            db.flush()
+        return design
+
+    def current_version(self, db: Session) -> int:
+        return self._get_design(db).layout_version or 0
+
+    def _bump(self, db: Session, design: ShelfDesign, base: int) -> bool:
+        """layout_version が base のままなら base + 1 にする（比較と更新を1文で）"""
+        updated = db.query(ShelfDesign)\
+            .filter(ShelfDesign.id == design.id, func.coalesce(ShelfDesign.layout_version, 0) == base)\
+            .update({ShelfDesign.layout_version: base + 1}, synchronize_session=False)
+        if updated:
+            set_committed_value(design, "layout_version", base + 1)
+            return True
+        current = db.query(ShelfDesign.layout_version).filter(ShelfDesign.id == design.id).scalar() or 0
+        set_committed_value(design, "layout_version", current)
+        return False
+
+    def record(self, db: Session, ops: list[dict], expected_version: int | None = None) -> int:
+        """
+        version を進めて操作を記録する（commit は呼び出し側）。新しい version を返す。
+        expected_version を渡すと、その version からしか進めない（違えば LayoutVersionConflict）。
+        渡さない場合は、読んでから進めるまでに他が進めていたら読み直してやり直す。
+        """
+        design = self._get_design(db)
+        if expected_version is not None:
+            if not self._bump(db, design, expected_version):
+                raise LayoutVersionConflict(design.layout_version)
+        else:
+            while not self._bump(db, design, design.layout_version or 0):
+                pass
+        db.add(ShelfLayoutChange(
+            version=design.layout_version,
+            ops=json.dumps(ops, ensure_ascii=False, separators=(",", ":")),
+        ))
+        db.query(ShelfLayoutChange)\
+            .filter(ShelfLayoutChange.version <= design.layout_version - self.MAX_HISTORY)\
+            .delete(synchronize_session=False)
+        append_layout_history(db, design.layout_version, ops)
+        db.info.setdefault(SESSION_KEY, []).append((design.layout_version, ops))
+        return design.layout_version
+
+    def since(self, db: Session, version: int) -> list[dict] | None:
+        """
+        version より後の変更を古い順に返す。
+        ログが切り詰められていて埋められない場合は None（全体を取り直してもらう）。
+        """
+        current = self.current_version(db)
+        if version >= current:
+            return []
+        rows = db.query(ShelfLayoutChange)\
+            .filter(ShelfLayoutChange.version > version)\
+            .order_by(ShelfLayoutChange.version)\
+            .all()
+        if not rows or rows[0].version != version + 1:
+            return None
+        return [{"version": r.version, "ops": json.loads(r.ops)} for r in rows]
+
+
+# ============================================================
+# モジュールレベル互換
+# ============================================================
+
+_change_log = ShelfChangeLog()
+
+current_layout_version = _change_log.current_version
+record_layout_change   = _change_log.record
+layout_changes_since   = _change_log.since
@@ -0,0 +1,99 @@
+"""本棚レイアウトのベクトル化カーネル（NumPy）。
+
+背幅・x 座標・折り返し位置を1冊ずつの Python ループではなく配列演算で求める。
+全体再配置（ShelfService._pack_into_shelves）、x_pos の再計算（/bookshelf/migrate-x-pos）、
+Neo4j の SHELF_NEXT 隣接判定（BookshelfNeo4j.update_shelf_layout_chain）で共有する。
+
+  spine_widths      ページ数 → 背幅（ShelfService.calc_virtual_width と同じ式）
+  pack_greedy       並び順のまま棚幅で折り返す（先頭から詰める）→ 段番号と x
+  pack_breaks       折り返し位置（各段の先頭）を決めて段番号と x を返す
+  shelf_x_positions 段ごとに左から詰めた x（フレーム・隙間込み）
+  shelf_columns     段内で左から何番目か（order_index）
+  adjacent_mask     隣り合う2冊が SHELF_NEXT で結ぶ距離にあるか
+"""
+from __future__ import annotations
+
+from typing import Iterable
+
+import numpy as np
+
+PAGE_TO_PX    = 0.065   # 1ページあたりの背幅
+DEFAULT_SPINE = 20      # ページ数不明のときの背幅
+
+
+def spine_widths(pages: Iterable[int | None]) -> np.ndarray:
+    """ページ数の列 → 背幅(px, int64)。None / 0 は DEFAULT_SPINE。"""
+    p = np.fromiter((v or 0 for v in pages), dtype=np.float64)
+    return np.where(p > 0, np.floor(p * PAGE_TO_PX), DEFAULT_SPINE).astype(np.int64)
+
+
+def pack_breaks(widths: np.ndarray, starts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    各段の先頭位置 starts（昇順、先頭は 0）から、本ごとの段番号と段内の x（左端 0、隙間なし）を返す。
+    """
+    n = len(widths)
+    counts      = np.diff(np.append(starts, n))
+    shelf_index = np.repeat(np.arange(len(starts)), counts)
+    cum         = np.concatenate(([0], np.cumsum(widths)))
+    x_pos       = cum[:-1] - np.repeat(cum[starts], counts)
+    return shelf_index, x_pos
+
+
+def pack_greedy(widths: np.ndarray, shelf_max_px: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    並び順のまま、入らなくなったところで次の段へ送る（next-fit）。
+    累積和上の searchsorted で段ごとに折り返し位置を求めるので、Python のループは段数回。
+    1冊で棚幅を超える本はその本だけで1段にする。
+    """
+    n = len(widths)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    cum = np.concatenate(([0], np.cumsum(widths)))
+    starts = []
+    s = 0
+    while s < n:
+        starts.append(s)
+        end = int(np.searchsorted(cum, cum[s] + shelf_max_px, side="right")) - 1
+        s = max(end, s + 1)
+    return pack_breaks(widths, np.array(starts, dtype=np.int64))
+
+
+def shelf_x_positions(shelf_index: np.ndarray, widths: np.ndarray, frame: int, gap: int) -> np.ndarray:
+    """
+    段番号の列（同じ段は連続、段内は左から順）に対して、各段 frame から
+    背幅 + gap ずつ詰めた x を返す。
+    """
+    n = len(widths)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    step = widths + gap
+    cum  = np.concatenate(([0], np.cumsum(step)))
+    first = np.flatnonzero(np.r_[True, shelf_index[1:] != shelf_index[:-1]])
+    counts = np.diff(np.append(first, n))
+    return frame + cum[:-1] - np.repeat(cum[first], counts)
+
+
+def shelf_columns(shelf_index: np.ndarray) -> np.ndarray:
+    """
+    段番号の列（同じ段は連続、段内は左から順）に対して、段内で左から何番目か（0 始まり）を返す。
+    order_index はどの配置経路でもこの意味にそろえる（pos_r{段}_c{order_index} の列番号）。
+    """
+    n = len(shelf_index)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    first  = np.flatnonzero(np.r_[True, shelf_index[1:] != shelf_index[:-1]])
+    counts = np.diff(np.append(first, n))
+    return np.arange(n) - np.repeat(first, counts)
+
+
+def adjacent_mask(
+    shelf_index: np.ndarray, x_pos: np.ndarray, widths_px: np.ndarray, px_scale: float, max_gap_px: float,
+) -> np.ndarray:
+    """
+    (段, x) 順に並んだ本の、i 番目と i+1 番目が同じ段で隙間 max_gap_px 未満なら True（長さ n-1）。
+    隙間は (x[i+1] - x[i]) × px_scale − 背幅[i]。
+    """
+    if len(x_pos) < 2:
+        return np.zeros(0, dtype=bool)
+    gap = (x_pos[1:] - x_pos[:-1]) * px_scale - widths_px[:-1]
+    return (shelf_index[1:] == shelf_index[:-1]) & (gap < max_gap_px)
@@ -0,0 +1,272 @@
+"""本棚画面（GET /bookshelf/）用の非正規化リードモデル。
+
+shelflayout と registered_books を1回の JOIN で読み、本ごとの表示用 dict を
+プロセス内に保持する。レスポンスは JSON にシリアライズ済みのバイト列として
+キャッシュし、書き込み側（配置・並べ替え・削除・段の増減・書誌登録）が
+変わった本だけを差し替える。読み取りは Neo4j に一切触れない。
+
+uvicorn をワーカー1つで動かす前提のプロセス内キャッシュ。
+"""
+from __future__ import annotations
+
+import json
+import threading
+from typing import Iterable
+
+from sqlalchemy import Integer, case, cast, event, func, select
+from sqlalchemy.orm import Session
+
+from models import RegisteredBook, ShelfDesign, ShelfLayout
+
+SESSION_KEY = "read_model_invalidate"   # invalidate_after_commit() が session.info に立てる印
+
+# ShelfService.calc_virtual_width / shelf_kernel.spine_widths と同じ背幅
+# （pages × 0.065 の切り捨て、ページ数が不明または 0 以下なら 20px）を SQL で
+_SPINE_WIDTH = case((ShelfLayout.pages > 0, cast(ShelfLayout.pages * 0.065, Integer)), else_=20)
+
+
+class ShelfReadModel:
+
+    _instance: "ShelfReadModel | None" = None
+
+    def __init__(self):
+        self._books: dict[str, dict] | None = None   # isbn → 表示用 dict（未ロードなら None）
+        self._total_shelves  = 1
+        self._layout_version = 0
+        self._payload: bytes | None = None           # シリアライズ済みレスポンス
+        self._max_spine: tuple[int, int] | None = None   # (layout_version, 最も厚い本の背幅)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> "ShelfReadModel":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    # ── 読み取り ──────────────────────────────────────────────────
+
+    @staticmethod
+    def _query(isbns: Iterable[str] | None = None):
+        stmt = (
+            select(
+                ShelfLayout.isbn,
+                RegisteredBook.title,
+                ShelfLayout.cover,
+                RegisteredBook.spine_image,
+                ShelfLayout.size_label,
+                ShelfLayout.shelf_index,
+                ShelfLayout.x_pos,
+                ShelfLayout.order_index,
+                ShelfLayout.pages,
+                ShelfLayout.height_mm,
+                RegisteredBook.ndc,
+            )
+            .outerjoin(RegisteredBook, RegisteredBook.isbn == ShelfLayout.isbn)
+        )
+        if isbns is not None:
+            stmt = stmt.where(ShelfLayout.isbn.in_(list(isbns)))
+        return stmt
+
+    @staticmethod
+    def _to_book(row) -> dict:
+        return {
+            "isbn":        row.isbn,
+            "title":       row.title or "",
+            "cover":       row.cover,
+            "spine_image": row.spine_image,
+            "size_label":  row.size_label,
+            "shelf_index": row.shelf_index,
+            "x_pos":       row.x_pos,
+            "order_index": row.order_index,
+            "pages":       row.pages,
+            "height_mm":   row.height_mm,
+            "ndc":         row.ndc,
+        }
+
+    def _load_design(self, db: Session) -> None:
+        design = db.query(ShelfDesign).first()
+        if not design:
+            design = ShelfDesign(total_shelves=1, layout_version=0)
+            db.add(design)
+            db.commit()
+        self._total_shelves  = design.total_shelves
+        self._layout_version = design.layout_version or 0
+
+    def _serialize(self) -> bytes:
+        shelves: dict[int, list] = {}
+        for book in sorted(self._books.values(), key=lambda b: (b["shelf_index"], b["x_pos"])):
+            shelves.setdefault(book["shelf_index"], []).append(book)
+        payload = {
+            "shelves":        [{"shelf_index": k, "books": v} for k, v in sorted(shelves.items())],
+            "total_shelves":  self._total_shelves,
+            "layout_version": self._layout_version,
+        }
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def get_payload(self, db: Session) -> bytes:
+        """GET /bookshelf/ のレスポンス本文。キャッシュが温まっていれば DB にも触れない。"""
+        with self._lock:
+            if self._payload is not None:
+                return self._payload
+            if self._books is None:
+                self._books = {r.isbn: self._to_book(r) for r in db.execute(self._query())}
+                self._load_design(db)
+            self._payload = self._serialize()
+            return self._payload
+
+    # ── 書き込み側からの差分反映（いずれも commit 後に呼ぶ） ────────
+
+    def refresh_books(self, db: Session, isbns: Iterable[str]) -> None:
+        """指定した本の行を DB から読み直す（配置・書誌更新の後）。棚に無い本は取り除く。"""
+        isbns = list(isbns)
+        with self._lock:
+            if self._books is None:
+                return   # 未ロードなら次回の読み取りで全体を作る
+            rows = {r.isbn: self._to_book(r) for r in db.execute(self._query(isbns))}
+            for isbn in isbns:
+                if isbn in rows:
+                    self._books[isbn] = rows[isbn]
+                else:
+                    self._books.pop(isbn, None)
+            self._load_design(db)
+            self._payload = None
+
+    def apply_positions(self, positions: Iterable[dict], layout_version: int | None = None) -> None:
+        """sync-layout の位置情報（isbn, shelf_index, x_pos, order_index）をそのまま反映する。"""
+        with self._lock:
+            if self._books is None:
+                return
+            if layout_version is not None:
+                self._layout_version = layout_version
+            for pos in positions:
+                book = self._books.get(pos["isbn"])
+                if book is None:
+                    continue
+                book["shelf_index"] = pos["shelf_index"]
+                book["x_pos"]       = pos["x_pos"]
+                book["order_index"] = pos["order_index"]
+            self._payload = None
+
+    def remove(self, isbn: str, layout_version: int | None = None) -> None:
+        with self._lock:
+            if self._books is None:
+                return
+            self._books.pop(isbn, None)
+            if layout_version is not None:
+                self._layout_version = layout_version
+            self._payload = None
+
+    def set_total_shelves(self, total_shelves: int, layout_version: int | None = None) -> None:
+        with self._lock:
+            self._total_shelves = total_shelves
+            if layout_version is not None:
+                self._layout_version = layout_version
+            self._payload = None
+
+    def _max_spine_px(self, db: Session, layout_version: int) -> int:
+        """棚にある本の背幅の最大値。背幅は配置の書き込みでしか変わらないので version ごとに覚えておく"""
+        cached = self._max_spine
+        if cached is not None and cached[0] == layout_version:
+            return cached[1]
+        max_px = db.query(func.max(_SPINE_WIDTH)).scalar() or 0
+        self._max_spine = (layout_version, max_px)
+        return max_px
+
+    def get_range(
+        self,
+        db: Session,
+        from_shelf: int,
+        to_shelf: int | None,
+        x_from: float | None = None,
+        x_to: float | None = None,
+    ) -> dict:
+        """
+        段 from_shelf〜to_shelf（両端含む。None なら最後の段まで）の本だけを返す。(shelf_index, x_pos) の
+        インデックスを範囲で読む1回の JOIN。x_from / x_to を渡すと横方向も
+        その範囲に掛かる本に絞る（左端がはみ出す本も拾えるよう、x の下限は最も厚い本の背幅ぶん広げる）。
+        """
+        design  = db.query(ShelfDesign).first()
+        version = (design.layout_version or 0) if design else 0
+        stmt = self._query().where(ShelfLayout.shelf_index >= from_shelf)
+        if to_shelf is not None:
+            stmt = stmt.where(ShelfLayout.shelf_index <= to_shelf)
+        if x_from is not None:
+            # 前者はインデックスで読む範囲の下限、後者で右端が範囲に掛かる本だけに絞る
+            stmt = stmt.where(ShelfLayout.x_pos >= x_from - self._max_spine_px(db, version),
+                              ShelfLayout.x_pos + _SPINE_WIDTH >= x_from)
+        if x_to is not None:
+            stmt = stmt.where(ShelfLayout.x_pos <= x_to)
+        stmt = stmt.order_by(ShelfLayout.shelf_index, ShelfLayout.x_pos)
+
+        shelves: dict[int, list] = {}
+        for row in db.execute(stmt):
+            shelves.setdefault(row.shelf_index, []).append(self._to_book(row))
+
+        return {
+            "shelves":        [{"shelf_index": k, "books": v} for k, v in sorted(shelves.items())],
+            "total_shelves":  design.total_shelves if design else 1,
+            "layout_version": version,
+            "from_shelf":     from_shelf,
+            "to_shelf":       to_shelf,
+        }
+
+    @staticmethod
+    def get_summary(db: Session, shelf_max_px: int, frame: int, spine_gap: int) -> dict:
+        """段ごとの冊数・使用幅・空き幅（GROUP BY 1回）。本の中身は返さない。"""
+        rows = db.query(
+            ShelfLayout.shelf_index,
+            func.count(ShelfLayout.id).label("count"),
+            func.sum(_SPINE_WIDTH).label("used_px"),
+            func.max(ShelfLayout.x_pos + _SPINE_WIDTH + spine_gap).label("next_x"),
+        ).group_by(ShelfLayout.shelf_index).all()
+        by_shelf = {r.shelf_index: r for r in rows}
+
+        design = db.query(ShelfDesign).first()
+        total_shelves = design.total_shelves if design else 1
+        shelves = []
+        for i in range(max([total_shelves, *[k + 1 for k in by_shelf]])):
+            r       = by_shelf.get(i)
+            used_px = int(r.used_px) if r else 0
+            next_x  = max(frame, r.next_x) if r else frame
+            shelves.append({
+                "shelf_index": i,
+                "count":       r.count if r else 0,
+                "used_px":     used_px,
+                "free_px":     max(0, round(shelf_max_px - frame - next_x, 2)),
+                "occupancy":   round(min(1.0, used_px / shelf_max_px), 3),
+            })
+        return {
+            "total_shelves":  total_shelves,
+            "layout_version": (design.layout_version or 0) if design else 0,
+            "total_books":    sum(s["count"] for s in shelves),
+            "shelf_max_px":   shelf_max_px,
+            "shelves":        shelves,
+        }
+
+    def invalidate(self) -> None:
+        """全体を作り直す（全件再配置の後など）。"""
+        with self._lock:
+            self._books   = None
+            self._payload = None
+
+    @staticmethod
+    def invalidate_after_commit(db: Session) -> None:
+        """
+        db の commit が済んだら invalidate() する（rollback なら何もしない）。
+        commit 前に捨てると、その間に来た GET が古い行でキャッシュを作り直して残ってしまうため。
+        """
+        db.info[SESSION_KEY] = True
+
+
+shelf_read_model = ShelfReadModel.get_instance()
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session) -> None:
+    if session.info.pop(SESSION_KEY, False):
+        shelf_read_model.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session) -> None:
+    session.info.pop(SESSION_KEY, None)
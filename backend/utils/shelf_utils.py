@@ -1,6 +1,13 @@
+import math
+from itertools import accumulate
+
+import numpy as np
 from sqlalchemy.orm import Session
-from models import ShelfLayout, ShelfDesign, RegisteredBook
+from models import ShelfLayout, ShelfDesign, ShelfOccupancy, RegisteredBook
 from admin_neo4j.neo4j_crud import groups_from_neo4j
+from utils.shelf_read_model import shelf_read_model
+from utils.shelf_changes import record_layout_change
+from utils.shelf_kernel import pack_breaks, pack_greedy, shelf_columns, spine_widths
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,6 +20,11 @@ class ShelfService:
     FRAME      = 20
     SPINE_GAP  = 2
 
+    # 全体再配置の詰め方: "greedy"（先頭から詰める）/ "balanced"（段ごとの余白を均す）
+    PACKING           = "greedy"
+    INCREMENTAL       = True     # greedy の再配置は変化のあった段からだけやり直す
+    NDC_BREAK_PENALTY = 0.25   # balanced で NDC グループの途中で折り返すコスト（棚幅² に対する比）
+
     # ── サイズ計算 ────────────────────────────────────────────────
 
     @staticmethod
@@ -37,6 +49,7 @@ class ShelfService:
         try:
             self._place_one(db, book)
             db.commit()
+            shelf_read_model.refresh_books(db, [book.isbn])
             return True
 
         except Exception as e:
@@ -44,12 +57,29 @@ class ShelfService:
             logger.error(f"[add_to_shelf] 配置エラー [{book.isbn}]: {e}")
             return False
 
+    def add_many_to_shelf(self, db: Session, books: list) -> list[str]:
+        """
+        複数冊をまとめて棚に置く（add_from_hand の一括版）。既に棚にある本は飛ばす。
+        commit は呼び出し側。棚に置いた ISBN を返す。
+        """
+        isbns   = [b.isbn for b in books]
+        shelved = {
+            isbn for (isbn,) in
+            db.query(ShelfLayout.isbn).filter(ShelfLayout.isbn.in_(isbns)).all()
+        }
+        pending = [b for b in dict((b.isbn, b) for b in books).values() if b.isbn not in shelved]
+        return [r["isbn"] for r in self._place_many(db, pending)]
+
     # ── 内部: 全体再構築 ──────────────────────────────────────────
 
-    def _rebuild_all(self, db: Session, trigger_book=None):
+    def _rebuild_all(
+        self, db: Session, trigger_book=None, packing: str | None = None, incremental: bool | None = None,
+    ):
         """
         Neo4jのグループ順にISBNを並べ、棚幅(px)で折り返して配置する。
         trigger_book がNeo4jに未登録なら末尾追加。
+        packing は "greedy" / "balanced"（省略時は PACKING）。
+        greedy で incremental（省略時は INCREMENTAL）なら _repack_incremental で差分だけ書く。
         """
         design = self._get_design(db)
         shelf_max_px = getattr(design, "shelf_max_width", self.SHELF_MAX_WIDTH_PX)
@@ -83,100 +113,353 @@ class ShelfService:
                 "height_mm":  trigger_book.height_mm,
             })
 
-        rows = self._pack_into_shelves(isbns, books_map, shelf_max_px)
+        packing = packing or self.PACKING
+        if incremental is None:
+            incremental = self.INCREMENTAL
+        if packing == "greedy" and incremental and self._repack_incremental(db, design, isbns, books_map, shelf_max_px):
+            return
+
+        if packing == "balanced":
+            group_of: dict[str, int] = {}
+            for gi, group in enumerate(groups):
+                for b in group.get("books", []):
+                    group_of.setdefault(b["isbn"], gi)
+            rows = self._pack_balanced(isbns, books_map, shelf_max_px, group_of)
+        elif packing == "greedy":
+            rows = self._pack_into_shelves(isbns, books_map, shelf_max_px)
+        else:
+            raise ValueError(f"unknown packing: {packing}")
 
         if rows:
             design.total_shelves = rows[-1]["shelf_index"] + 1
 
         db.query(ShelfLayout).delete()
         db.bulk_insert_mappings(ShelfLayout, rows)
+        self.rebuild_occupancy(db)
+        record_layout_change(db, [{"op": "reset"}])
+        shelf_read_model.invalidate_after_commit(db)
         logger.info(f"[_rebuild_all] {len(rows)}冊 → {design.total_shelves}段")
 
-    def _pack_into_shelves(self, isbns, books_map, shelf_max_px):
-        rows = []
-
-        shelf_index = 0
-        x_cursor    = 0
-
-        for i, isbn in enumerate(isbns):
-            b = books_map.get(isbn)
-            if not b:
-                continue
-
-            width  = self.calc_virtual_width(b["pages"])
-            height = b["height_mm"]  # ← mmそのまま # ← 絶対ここだけ見る
-
+    def _repack_incremental(self, db: Session, design, isbns, books_map, shelf_max_px) -> bool:
+        """
+        greedy の全体再配置を、変化のあった段からだけやり直す（commit は呼び出し側）。
+
+        新旧の並び（isbn, ページ数）の共通の先頭・末尾を求め、最初に食い違う本が
+        旧配置で載っていた段の先頭から詰め直す。共通の末尾に入ってから最初に来る
+        旧配置の段の先頭で必ず折り返して打ち切り、それ以降の行はそのまま残す
+        （段番号がずれた場合だけ UPDATE 1回でまとめてずらす）。
+        先頭から詰める greedy は1冊の追加でも以降の折り返しが全部ずれるため、
+        旧の折り返し位置を優先する。結果は全体再配置と一致するとは限らないが、
+        段からはみ出さず並び順も保つ（詰め直したいときは incremental=False）。
+        書き込むのは位置が変わった行・増えた行・消えた行だけ。
+        旧配置が空など差分で扱えないときは False（全体を作り直す）。
+        """
+        new = [(isbn, books_map[isbn]["pages"]) for isbn in isbns if isbn in books_map]
+        old_rows = db.query(
+            ShelfLayout.id, ShelfLayout.isbn, ShelfLayout.shelf_index,
+            ShelfLayout.x_pos, ShelfLayout.order_index, ShelfLayout.pages,
+        ).order_by(ShelfLayout.shelf_index, ShelfLayout.x_pos).all()
+        if not new or not old_rows:
+            return False
+        old = [(r.isbn, r.pages) for r in old_rows]
+
+        # 共通の先頭・末尾
+        limit = min(len(new), len(old))
+        head = 0
+        while head < limit and new[head] == old[head]:
+            head += 1
+        if head == len(new) == len(old):
+            logger.info("[_rebuild_all] 変更なし")
+            return True
+        tail = 0
+        while tail < limit - head and new[-1 - tail] == old[-1 - tail]:
+            tail += 1
+
+        # 旧配置の段の先頭（旧の位置 → 段番号）
+        old_starts = {
+            i: r.shelf_index for i, r in enumerate(old_rows)
+            if i == 0 or r.shelf_index != old_rows[i - 1].shelf_index
+        }
+
+        # 最初に食い違う本が載っていた段の先頭から詰め直す（末尾への追加なら最後の段から）
+        start = min(head, len(old) - 1)
+        while start not in old_starts:
+            start -= 1
+        shelf_index = old_starts[start]
+        shift_from  = None   # 打ち切った位置の旧段番号（その段以降は残す）
+        offset      = len(new) - len(old)
+
+        placed: list[dict] = []
+        x_cursor, order, q = 0, 0, start
+        while q < len(new):
+            isbn, pages = new[q]
+            width = self.calc_virtual_width(pages)
+            if q >= len(new) - tail and q - offset > start and q - offset in old_starts:
+                # 詰め直し始めた段より後の、旧配置の段の先頭に来た。ここから先は旧配置のまま
+                if order > 0:
+                    shelf_index += 1
+                shift_from = old_starts[q - offset]
+                break
             if x_cursor + width > shelf_max_px:
                 shelf_index += 1
-                x_cursor = 0
-
-            rows.append({
+                x_cursor, order = 0, 0
+            b = books_map[isbn]
+            placed.append({
                 "isbn":        isbn,
                 "shelf_index": shelf_index,
                 "x_pos":       x_cursor,
-                "order_index": i,
-                "height_mm":   height,
+                "order_index": order,
+                "height_mm":   b["height_mm"],
                 "pages":       b["pages"],
             })
-
             x_cursor += width
+            order    += 1
+            q        += 1
+
+        # 詰め直した範囲の旧行と突き合わせる
+        old_end = q - offset if shift_from is not None else len(old)
+        old_mid = {r.isbn: r for r in old_rows[start:old_end]}
+        updates, inserts = [], []
+        for row in placed:
+            prev = old_mid.pop(row["isbn"], None)
+            if prev is None:
+                inserts.append(row)
+            elif (prev.shelf_index, prev.x_pos, prev.order_index, prev.pages) != \
+                    (row["shelf_index"], row["x_pos"], row["order_index"], row["pages"]):
+                updates.append({"id": prev.id, **row})
+        removed = list(old_mid.values())
+
+        shift = shelf_index - shift_from if shift_from is not None else 0
+        if shift:
+            db.query(ShelfLayout)\
+                .filter(ShelfLayout.shelf_index >= shift_from)\
+                .update({ShelfLayout.shelf_index: ShelfLayout.shelf_index + shift}, synchronize_session=False)
+        if removed:
+            db.query(ShelfLayout)\
+                .filter(ShelfLayout.id.in_([r.id for r in removed]))\
+                .delete(synchronize_session=False)
+        if updates:
+            db.bulk_update_mappings(ShelfLayout, updates)
+        if inserts:
+            db.bulk_insert_mappings(ShelfLayout, inserts)
+
+        last_shelf = old_rows[-1].shelf_index + shift if shift_from is not None else shelf_index
+        design.total_shelves = last_shelf + 1
+
+        if shift:
+            # 以降の段がすべて動いたので、差分ではなく全体の取り直しを促す
+            self.rebuild_occupancy(db)
+            record_layout_change(db, [{"op": "reset"}])
+        else:
+            self.refresh_occupancy(
+                db, {r.shelf_index for r in old_rows[start:old_end]} | {r["shelf_index"] for r in placed}
+            )
+            record_layout_change(db, [
+                *({"op": "remove", "isbn": r.isbn} for r in removed),
+                *({"op": "move", **{k: r[k] for k in ("isbn", "shelf_index", "x_pos", "order_index")}} for r in updates),
+                *({"op": "insert", **{k: r[k] for k in ("isbn", "shelf_index", "x_pos", "order_index")}} for r in inserts),
+                {"op": "shelves", "total_shelves": design.total_shelves},
+            ])
+        shelf_read_model.invalidate_after_commit(db)
+        logger.info(
+            f"[_rebuild_all] 差分再配置: 段{old_starts[start]}〜{shelf_index} を詰め直し "
+            f"(更新 {len(updates)} / 追加 {len(inserts)} / 削除 {len(removed)} / 段ずらし {shift})"
+        )
+        return True
 
-        return rows
-
-    # ── 内部: 1冊ランダム配置 ─────────────────────────────────────
+    def _pack_into_shelves(self, isbns, books_map, shelf_max_px):
+        """並び順のまま棚幅で折り返す（先頭から詰める）。幅・折り返しは shelf_kernel でまとめて計算"""
+        order = [i for i, isbn in enumerate(isbns) if isbn in books_map]
+        if not order:
+            return []
+        books = [books_map[isbns[i]] for i in order]
+        shelf_index, x_pos = pack_greedy(spine_widths(b["pages"] for b in books), shelf_max_px)
+        columns = shelf_columns(shelf_index)
+
+        return [
+            {
+                "isbn":        b["isbn"],
+                "shelf_index": si,
+                "x_pos":       x,
+                "order_index": c,
+                "height_mm":   b["height_mm"],
+                "pages":       b["pages"],
+            }
+            for b, si, x, c in zip(books, shelf_index.tolist(), x_pos.tolist(), columns.tolist())
+        ]
 
-    def _place_one(self, db: Session, book):
-        design       = self._get_design(db)
-        shelf_max_px = getattr(design, "shelf_max_width", self.SHELF_MAX_WIDTH_PX)
+    def _pack_balanced(self, isbns, books_map, shelf_max_px, group_of=None, ndc_break_penalty=None):
+        """
+        並び順を保ったまま、折り返し位置を動的計画法で決める（Knuth–Plass の行分割と同じ考え方）。
+        段数は先頭から詰めた場合（順序を保つ詰め方の最小）と同じにし、その中で
+        最終段以外の余白の二乗和が最小になる折り返しを選ぶ。group_of（isbn → グループ番号）を
+        渡すと、同じ NDC グループの途中で折り返すたびに NDC_BREAK_PENALTY 分のコストを足す。
+        幅の累積和を使い、各位置から1段に入る冊数 k だけ遡るので O(n·k)。
+        """
+        items = [(i, isbn) for i, isbn in enumerate(isbns) if isbn in books_map]
+        n = len(items)
+        if n == 0:
+            return []
+
+        widths = spine_widths(books_map[isbn]["pages"] for _, isbn in items).tolist()
+        prefix = list(accumulate(widths, initial=0))
+        groups = [group_of.get(isbn) for _, isbn in items] if group_of else None
+
+        W       = shelf_max_px
+        ratio   = self.NDC_BREAK_PENALTY if ndc_break_penalty is None else ndc_break_penalty
+        penalty = ratio * W * W
+        # 段数を最優先にするため、1段を余白コストの総和の上限より重く数える
+        shelf_weight = (W * W + penalty) * (n + 1)
+
+        best = [0.0] + [math.inf] * n   # best[j]: 先頭 j 冊を並べる最小コスト
+        back = [0] * (n + 1)            # back[j]: その最後の段の先頭
+        lo = 0
+        for j in range(1, n + 1):
+            while lo < j - 1 and prefix[j] - prefix[lo] > W:
+                lo += 1                 # 1段に収まる先頭の下限（1冊だけなら幅超えでも置く）
+            last = j == n
+            best_j, arg = math.inf, j - 1
+            for i in range(lo, j):
+                slack = 0 if last else W - (prefix[j] - prefix[i])
+                cost  = best[i] + shelf_weight + (slack * slack if slack > 0 else 0)
+                if groups is not None and i > 0 and groups[i - 1] == groups[i]:
+                    cost += penalty
+                if cost < best_j:
+                    best_j, arg = cost, i
+            best[j], back[j] = best_j, arg
+
+        starts, j = [], n
+        while j > 0:
+            starts.append(back[j])
+            j = back[j]
+        starts.reverse()
+        shelf_index, x_pos = pack_breaks(np.array(widths, dtype=np.int64), np.array(starts, dtype=np.int64))
+        columns = shelf_columns(shelf_index)
+
+        return [
+            {
+                "isbn":        isbn,
+                "shelf_index": si,
+                "x_pos":       x,
+                "order_index": c,
+                "height_mm":   books_map[isbn]["height_mm"],
+                "pages":       books_map[isbn]["pages"],
+            }
+            for (_, isbn), si, x, c in zip(items, shelf_index.tolist(), x_pos.tolist(), columns.tolist())
+        ]
 
-        w = self.calc_virtual_width(book.pages)
+    # ── 内部: 1冊ランダム配置 ─────────────────────────────────────
 
+    def _aggregate_occupancy(self, rows, shelf_max_px: int) -> list[dict]:
+        """(shelf_index, x_pos, pages) の行から shelf_occupancy の行を作る"""
         shelf_info: dict[int, dict] = {}
+        for row in rows:
+            info = shelf_info.setdefault(row.shelf_index, {"count": 0, "next_x": self.FRAME})
+            info["count"] += 1
+            right = row.x_pos + self.calc_virtual_width(row.pages) + self.SPINE_GAP
+            if right > info["next_x"]:
+                info["next_x"] = right
+        return [
+            {
+                "shelf_index": si,
+                "count":       info["count"],
+                "next_x":      info["next_x"],
+                "free_px":     shelf_max_px - self.FRAME - info["next_x"],
+            }
+            for si, info in shelf_info.items()
+        ]
 
-        for row in db.query(ShelfLayout).order_by(
-            ShelfLayout.shelf_index, ShelfLayout.x_pos
-        ).all():
-            si = row.shelf_index
-
-            if si not in shelf_info:
-                shelf_info[si] = {"count": 0, "next_x": self.FRAME}
-
-            shelf_info[si]["count"] += 1
+    def rebuild_occupancy(self, db: Session) -> None:
+        """shelf_occupancy を shelflayout 全体から作り直す（commit は呼び出し側）"""
+        design       = self._get_design(db)
+        shelf_max_px = getattr(design, "shelf_max_width", self.SHELF_MAX_WIDTH_PX)
+        db.flush()
+        rows = db.query(ShelfLayout.shelf_index, ShelfLayout.x_pos, ShelfLayout.pages).all()
+        db.query(ShelfOccupancy).delete(synchronize_session=False)
+        db.bulk_insert_mappings(ShelfOccupancy, self._aggregate_occupancy(rows, shelf_max_px))
 
-            # ✅ width_unit を使わない
-            row_width = self.calc_virtual_width(row.pages)
+    def refresh_occupancy(self, db: Session, shelves) -> None:
+        """
+        指定した段の shelf_occupancy を、その段の本だけから計算し直す
+        （並べ替え・差分適用・削除の後。commit は呼び出し側）。
+        """
+        shelves = list(shelves)
+        if not shelves:
+            return
+        design       = self._get_design(db)
+        shelf_max_px = getattr(design, "shelf_max_width", self.SHELF_MAX_WIDTH_PX)
+        db.flush()
+        rows = db.query(ShelfLayout.shelf_index, ShelfLayout.x_pos, ShelfLayout.pages)\
+            .filter(ShelfLayout.shelf_index.in_(shelves)).all()
+        db.query(ShelfOccupancy)\
+            .filter(ShelfOccupancy.shelf_index.in_(shelves))\
+            .delete(synchronize_session=False)
+        db.bulk_insert_mappings(ShelfOccupancy, self._aggregate_occupancy(rows, shelf_max_px))
+
+    def _choose_slot(self, db: Session, w: int, shelf_max_px: int) -> tuple[int, int, int]:
+        """
+        幅 w の本を置く (段, x, order_index) を決め、shelf_occupancy を置いた後の状態に更新する。
+        入る段のうち一番上（free_px のインデックスで探す）、どこにも入らなければ新しい段の左端。
+        """
+        slot = db.query(ShelfOccupancy)\
+            .filter(ShelfOccupancy.free_px >= w)\
+            .order_by(ShelfOccupancy.shelf_index)\
+            .first()
+
+        if slot is None:
+            last = db.query(ShelfOccupancy.shelf_index)\
+                .order_by(ShelfOccupancy.shelf_index.desc())\
+                .first()
+            slot = ShelfOccupancy(
+                shelf_index=last.shelf_index + 1 if last else 0,
+                next_x=self.FRAME,
+                count=0,
+            )
+            db.add(slot)
+
+        shelf_idx, x_pos, order_idx = slot.shelf_index, slot.next_x, slot.count
+        slot.count   = order_idx + 1
+        slot.next_x  = x_pos + w + self.SPINE_GAP
+        slot.free_px = shelf_max_px - self.FRAME - slot.next_x
+        db.flush()   # 次の本の検索に反映させる
+        return shelf_idx, x_pos, order_idx
+
+    def _place_many(self, db: Session, books: list) -> list[dict]:
+        """
+        複数冊を shelf_occupancy に従って順に配置し、まとめて INSERT する
+        （commit は呼び出し側）。配置した行を返す。
+        """
+        design       = self._get_design(db)
+        shelf_max_px = getattr(design, "shelf_max_width", self.SHELF_MAX_WIDTH_PX)
 
-            right = row.x_pos + row_width + self.SPINE_GAP
-            if right > shelf_info[si]["next_x"]:
-                shelf_info[si]["next_x"] = right
+        rows = []
+        for book in books:
+            shelf_idx, x_pos, order_idx = self._choose_slot(
+                db, self.calc_virtual_width(book.pages), shelf_max_px
+            )
+            rows.append({
+                "isbn":        book.isbn,
+                "shelf_index": shelf_idx,
+                "order_index": order_idx,
+                "x_pos":       x_pos,
+                "height_mm":   book.height_mm,
+                "pages":       book.pages,
+            })
+            logger.info(f"[_place_many] {book.isbn} → 棚{shelf_idx} x={x_pos}")
 
-        free_shelves = [
-            si for si, info in shelf_info.items()
-            if info["next_x"] + w + self.FRAME <= shelf_max_px
-        ]
+        if not rows:
+            return rows
 
-        if free_shelves:
-            shelf_idx = min(free_shelves)
-            x_pos     = shelf_info[shelf_idx]["next_x"]
-            order_idx = shelf_info[shelf_idx]["count"]
-        else:
-            shelf_idx = max(shelf_info.keys()) + 1 if shelf_info else 0
-            x_pos     = self.FRAME
-            order_idx = 0
-            design.total_shelves = shelf_idx + 1
-
-        # ✅ width_unit 完全削除
-        new_layout = ShelfLayout(
-            isbn=book.isbn,
-            shelf_index=shelf_idx,
-            order_index=order_idx,
-            x_pos=x_pos,
-            height_mm=book.height_mm,
-            pages=book.pages,
-        )
+        design.total_shelves = max(design.total_shelves or 1, max(r["shelf_index"] for r in rows) + 1)
+        db.bulk_insert_mappings(ShelfLayout, rows)
+        record_layout_change(db, [
+            {"op": "insert", **{k: r[k] for k in ("isbn", "shelf_index", "x_pos", "order_index")}}
+            for r in rows
+        ])
+        return rows
 
-        db.add(new_layout)
-        logger.info(f"[_place_one] {book.isbn} → 棚{shelf_idx} x={x_pos}")
+    def _place_one(self, db: Session, book):
+        self._place_many(db, [book])
 
     # ── ユーティリティ ────────────────────────────────────────────
 
@@ -210,4 +493,7 @@ _shelf_service = ShelfService()
 calc_virtual_width   = ShelfService.calc_virtual_width
 calc_spine_height_px = ShelfService.calc_spine_height_px
 add_to_shelf         = _shelf_service.add_to_shelf
+add_many_to_shelf    = _shelf_service.add_many_to_shelf
+rebuild_occupancy    = _shelf_service.rebuild_occupancy
+refresh_occupancy    = _shelf_service.refresh_occupancy
 
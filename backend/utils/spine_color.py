@@ -0,0 +1,193 @@
+"""背表紙画像の代表色抽出（NumPy によるベクトル化メジアンカット）。
+
+colorthief の get_color(quality=1) はフルサイズ画像の全ピクセルを Python で
+走査するため1枚数秒かかる。ここでは同じピクセルを NumPy で 5bit/チャネルの
+3次元ヒストグラムに集計し、その上でメジアンカット（MMCQ と同じ手順）を行う。
+縮小はしない。補間や縮小デコードで色が混ざると、僅差のパレット候補が入れ替わって
+別の色が選ばれることがあるため（scripts/bench_spine_color.py で一致率を確認できる）。
+その代わりメモリは、ヒストグラムを HISTO_CHUNK ピクセルずつ集計して一時配列を抑え、
+フル解像度のデコードを同時に MAX_DECODES 枚までに制限して上限を決める。
+"""
+from __future__ import annotations
+
+import heapq
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+from PIL import Image
+
+SIGBITS     = 5                      # colorthief (MMCQ) と同じ量子化ビット数
+RSHIFT      = 8 - SIGBITS
+HISTO_SIZE  = 1 << SIGBITS
+SAMPLE_PIXELS = 4_000_000            # これを超える画像だけ間引く（背表紙のスキャンは 100 万画素前後）
+HISTO_CHUNK = 1 << 18                # ヒストグラムを一度に集計するピクセル数
+MAX_DECODES = 2                      # フル解像度で同時にデコードする枚数（RGBA で最大 16MB/枚）
+MAX_COLORS  = 5                      # colorthief.get_color と同じパレットサイズ
+FRACT_BY_POPULATIONS = 0.75
+
+ImageSource = bytes | str | Path
+
+_decode_slots = threading.BoundedSemaphore(MAX_DECODES)
+
+
+# ── 画像読み込み ────────────────────────────────────────────────
+
+def _load_pixels(source: ImageSource) -> np.ndarray:
+    """
+    画像をそのままの解像度で読み込み、(N, 4) の RGBA 配列を返す。
+    SAMPLE_PIXELS を超える画像は、colorthief の quality と同じく
+    ピクセル列を一定間隔で間引く（色を混ぜない）。
+    """
+    fp     = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+    pixels = np.asarray(Image.open(fp).convert("RGBA"), dtype=np.uint8).reshape(-1, 4)
+    stride = -(-len(pixels) // SAMPLE_PIXELS)
+    return pixels[::stride] if stride > 1 else pixels
+
+
+def _build_histogram(pixels: np.ndarray) -> np.ndarray:
+    """
+    colorthief と同じ条件（不透明かつ白以外）のピクセルで 32^3 ヒストグラムを作る。
+    一時配列が画像サイズに比例しないよう HISTO_CHUNK ピクセルずつ足し込む。
+    """
+    counts = np.zeros(HISTO_SIZE ** 3, dtype=np.int64)
+    for start in range(0, len(pixels), HISTO_CHUNK):
+        chunk      = pixels[start:start + HISTO_CHUNK]
+        rgb, alpha = chunk[:, :3], chunk[:, 3]
+        valid      = (alpha >= 125) & ~np.all(rgb > 250, axis=1)
+        q          = (rgb[valid] >> RSHIFT).astype(np.int32)
+        index      = (q[:, 0] << (2 * SIGBITS)) | (q[:, 1] << SIGBITS) | q[:, 2]
+        counts    += np.bincount(index, minlength=HISTO_SIZE ** 3)
+    return counts.reshape(HISTO_SIZE, HISTO_SIZE, HISTO_SIZE)
+
+
+# ── メジアンカット ──────────────────────────────────────────────
+
+class _Box:
+    """ヒストグラム上の直方体 [lo, hi]（両端含む）。"""
+
+    __slots__ = ("lo", "hi", "count", "volume")
+
+    def __init__(self, histo: np.ndarray, lo: tuple, hi: tuple):
+        self.lo     = lo
+        self.hi     = hi
+        self.count  = int(self.view(histo).sum())
+        self.volume = int(np.prod(np.array(hi) - np.array(lo) + 1))
+
+    def view(self, histo: np.ndarray) -> np.ndarray:
+        return histo[self.lo[0]:self.hi[0] + 1,
+                     self.lo[1]:self.hi[1] + 1,
+                     self.lo[2]:self.hi[2] + 1]
+
+    def average(self, histo: np.ndarray) -> tuple[int, int, int]:
+        sub = self.view(histo)
+        mult = 1 << RSHIFT
+        if not self.count:
+            center = (np.array(self.lo) + np.array(self.hi) + 1) * mult / 2
+            return tuple(int(c) for c in center)
+        rgb = []
+        for axis in range(3):
+            other  = tuple(a for a in range(3) if a != axis)
+            proj   = sub.sum(axis=other)
+            coords = (np.arange(self.lo[axis], self.hi[axis] + 1) + 0.5) * mult
+            rgb.append(int(proj @ coords / self.count))
+        return tuple(rgb)
+
+    def split(self, histo: np.ndarray) -> tuple["_Box", "_Box | None"]:
+        """最も長い軸で分割する（MMCQ と同じく中央値から長い側へ半分寄せた位置で切る）。"""
+        if self.count <= 1:
+            return self, None
+        extent = np.array(self.hi) - np.array(self.lo)
+        axis   = int(np.argmax(extent))
+        if extent[axis] == 0:
+            return self, None
+
+        other = tuple(a for a in range(3) if a != axis)
+        cum   = np.cumsum(self.view(histo).sum(axis=other))
+        total = cum[-1]
+
+        lo, hi = self.lo[axis], self.hi[axis]
+        i      = lo + int(np.argmax(cum > total / 2))    # 中央値のセル
+        left, right = i - lo, hi - i
+        if left <= right:
+            d2 = min(hi - 1, int(i + right / 2))
+        else:
+            d2 = max(lo, int(i - 1 - left / 2))
+        # 空の箱ができないように調整
+        while d2 < hi and not cum[d2 - lo]:
+            d2 += 1
+        while d2 > lo and cum[d2 - lo] == total and cum[d2 - lo - 1]:
+            d2 -= 1
+
+        hi1 = list(self.hi); hi1[axis] = d2
+        lo2 = list(self.lo); lo2[axis] = d2 + 1
+        return _Box(histo, self.lo, tuple(hi1)), _Box(histo, tuple(lo2), self.hi)
+
+
+def _median_cut(histo: np.ndarray, max_colors: int) -> list[_Box]:
+    occupied = np.nonzero(histo)
+    if not occupied[0].size:
+        return []
+    # 初期の箱は実際に色が存在する範囲（バウンディングボックス）
+    root = _Box(histo, tuple(int(a.min()) for a in occupied), tuple(int(a.max()) for a in occupied))
+
+    def _iterate(boxes: list[_Box], priority, target: float) -> list[_Box]:
+        heap = [(-priority(b), i, b) for i, b in enumerate(boxes)]
+        heapq.heapify(heap)
+        seq = len(heap)
+        while len(heap) < target:
+            _, _, box = heapq.heappop(heap)
+            b1, b2 = box.split(histo)
+            if b2 is None:
+                heapq.heappush(heap, (0, seq, b1))   # これ以上分割できない
+                seq += 1
+                if all(p == 0 for p, _, _ in heap):
+                    break
+                continue
+            for b in (b1, b2):
+                heapq.heappush(heap, (-priority(b), seq, b))
+                seq += 1
+        return [b for _, _, b in heap]
+
+    # MMCQ と同様に、まず人口で、残りを 人口×体積 で分割する
+    boxes = _iterate([root], lambda b: b.count, FRACT_BY_POPULATIONS * max_colors)
+    boxes = _iterate(boxes, lambda b: b.count * b.volume, max_colors)
+    return sorted(boxes, key=lambda b: b.count * b.volume, reverse=True)
+
+
+# ── 外部API ──────────────────────────────────────────────────────
+
+def dominant_color(source: ImageSource) -> tuple[int, int, int] | None:
+    """画像（bytes またはパス）の代表色を (R, G, B) で返す。抽出できなければ None。"""
+    with _decode_slots:   # ピクセル配列を持つのはヒストグラムを作るまで
+        histo = _build_histogram(_load_pixels(source))
+    boxes = _median_cut(histo, MAX_COLORS)
+    if not boxes:
+        return None
+    return boxes[0].average(histo)
+
+
+def extract_dominant_color(source: ImageSource) -> str | None:
+    """代表色を 'R,G,B' 形式で返す（registered_books.spine_color の保存形式）。"""
+    try:
+        rgb = dominant_color(source)
+    except Exception:
+        return None
+    return ",".join(str(c) for c in rgb) if rgb else None
+
+
+def extract_dominant_colors(sources: Iterable[ImageSource], workers: int = 4) -> list[str | None]:
+    """
+    複数画像の代表色をまとめて抽出する（バッチAPI）。
+    画像のデコードは PIL が GIL を解放するのでスレッド並列で効く。
+    workers を増やしても、フル解像度のピクセルを同時に持つのは MAX_DECODES 枚まで。
+    返り値は入力と同じ順序。
+    """
+    sources = list(sources)
+    if workers <= 1 or len(sources) <= 1:
+        return [extract_dominant_color(s) for s in sources]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(extract_dominant_color, sources))
@@ -0,0 +1,105 @@
+"""アップロード画像のストリーミング受信と、内容アドレス方式の背表紙画像ストア。
+
+UploadFile を一度に read() せず、チャンク単位で一時ファイルへ書き出しながら
+SHA-256 を計算し、サイズ上限を超えた時点で打ち切る。保存時は一時ファイルを
+{sha256}.{ext} へ原子的に rename する（同じ画像は同じファイルになる）。
+OCR・代表色・知覚ハッシュなど後段の処理はこのファイルを直接読む。
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+from fastapi import HTTPException, UploadFile
+
+CHUNK_SIZE       = 1024 * 1024          # 1 MiB
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024     # スマホの高解像度写真でも十分な上限
+ALLOWED_EXTS     = {"jpg", "jpeg", "png", "webp", "gif", "bmp"}
+
+
+@dataclass
+class StagedUpload:
+    """一時ファイルに受信済みのアップロード。"""
+
+    path:         Path
+    sha256:       str
+    size:         int
+    content_type: str | None = None
+    filename:     str | None = None
+
+    @property
+    def ext(self) -> str:
+        if self.filename and "." in self.filename:
+            ext = self.filename.rsplit(".", 1)[-1].lower()
+            if ext in ALLOWED_EXTS:
+                return ext
+        return "jpg"
+
+    def discard(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+async def stage_upload(
+    upload: UploadFile,
+    staging_dir: Path,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+) -> StagedUpload:
+    """
+    アップロードをチャンク単位で staging_dir の一時ファイルに書き出す。
+    SHA-256 は受信しながら計算する。max_bytes を超えたら 413 を返す。
+    staging_dir は保存先と同じファイルシステムに置く（rename を原子的にするため）。
+    """
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    hasher = hashlib.sha256()
+    size   = 0
+
+    fd, tmp_name = tempfile.mkstemp(dir=staging_dir, suffix=".part")
+    tmp_path     = Path(tmp_name)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await upload.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"画像サイズが上限（{max_bytes // (1024 * 1024)}MB）を超えています",
+                    )
+                hasher.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    if size == 0:
+        tmp_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=400, detail="画像が空です")
+
+    return StagedUpload(
+        path=tmp_path,
+        sha256=hasher.hexdigest(),
+        size=size,
+        content_type=upload.content_type,
+        filename=upload.filename,
+    )
+
+
+def commit_to_store(staged: StagedUpload, store_dir: Path) -> Path:
+    """
+    一時ファイルを store_dir/{sha256}.{ext} へ原子的に移動する。
+    同じ内容のファイルが既にあれば一時ファイルを捨ててそれを使う。
+    """
+    store_dir.mkdir(parents=True, exist_ok=True)
+    target = store_dir / f"{staged.sha256}.{staged.ext}"
+    if target.exists():
+        staged.discard()
+        return target
+    try:
+        os.replace(staged.path, target)
+    except OSError:
+        shutil.move(staged.path, target)   # 別ファイルシステムの場合
+    staged.path = target
+    return target
@@ -0,0 +1,104 @@
+# vision_cache.py
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+class VisionCache:
+    """
+    画像入力の LLM 応答キャッシュ。キーは「画像バイト列の SHA-256 + プロンプトのバージョン」。
+    同じ写真の再送（UI からのリトライ）で有料の Vision 呼び出しを繰り返さないために使う。
+    NOT_FOUND のような「見つからなかった」応答もそのままキャッシュする。
+    Gemini / Groq のどちらのクライアントからも同じインスタンスを共有する。
+    """
+
+    TTL_SECONDS = 24 * 60 * 60
+    MAX_ENTRIES = 512
+
+    _instance: "VisionCache | None" = None
+
+    def __init__(self, ttl_seconds: float = TTL_SECONDS, max_entries: int = MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock   = threading.Lock()
+        self.hits    = 0
+        self.misses  = 0
+
+    @classmethod
+    def get_instance(cls) -> "VisionCache":
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def make_key(image_data: bytes, prompt_version: str, image_sha256: str | None = None) -> str:
+        digest = image_sha256 or hashlib.sha256(image_data).hexdigest()
+        return f"{digest}:{prompt_version}"
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)   # 最も古く使われたものから捨てる
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def cached_vision(method):
+    """
+    generate_from_image 用デコレータ。prompt_version が渡された時だけキャッシュを使う
+    （バージョンを渡さない呼び出しは従来どおり毎回 API を叩く）。
+    image_data には bytes のほかファイルパスも渡せる。パスの場合はキャッシュに
+    無かった時だけ読み込む。受信時に計算済みの image_sha256 があれば再計算しない。
+    例外はキャッシュしない。
+    """
+    @functools.wraps(method)
+    def wrapper(
+        self, image_data, media_type: str, prompt: str, *args,
+        prompt_version: str | None = None, image_sha256: str | None = None, **kwargs,
+    ):
+        def _call():
+            data = Path(image_data).read_bytes() if isinstance(image_data, (str, Path)) else image_data
+            return method(self, data, media_type, prompt, *args, **kwargs)
+
+        if prompt_version is None:
+            return _call()
+
+        if image_sha256 is None and isinstance(image_data, (str, Path)):
+            with open(image_data, "rb") as f:
+                image_sha256 = hashlib.file_digest(f, "sha256").hexdigest()
+
+        cache = VisionCache.get_instance()
+        key   = cache.make_key(image_data, prompt_version, image_sha256)
+        hit   = cache.get(key)
+        if hit is not None:
+            return hit
+
+        result = _call()
+        cache.put(key, result)
+        return result
+
+    return wrapper
@@ -1,4 +1,4 @@
-import { createContext, useState, useCallback } from "react";
+import { createContext, useState, useCallback, useEffect, useRef } from "react";
 import ErrorModal from "../components/ErrorModal";
 import axios from "axios";
 
@@ -14,6 +14,56 @@ export function MyBookshelfProvider({ children }) {
     setMyBookshelf(data);
   }, []);
 
+  // 他のタブ・手札からの配置変更を WebSocket で受け取り、差分だけ反映する
+  const bookshelfRef = useRef(myBookshelf);
+  useEffect(() => { bookshelfRef.current = myBookshelf; }, [myBookshelf]);
+
+  const applyLayoutDiff = useCallback((msg) => {
+    const known = new Set();
+    (bookshelfRef.current.shelves || []).forEach((s) => s.books.forEach((b) => known.add(b.isbn)));
+    // 全体再配置・新しく置かれた本は書誌ごと取り直す
+    if (msg.type === "reset" || msg.books.some((d) => !known.has(d.isbn))) {
+      fetchBookshelf();
+      return;
+    }
+    setMyBookshelf((prev) => {
+      const books = new Map();
+      (prev.shelves || []).forEach((s) => s.books.forEach((b) => books.set(b.isbn, b)));
+      msg.removed.forEach((isbn) => books.delete(isbn));
+      msg.books.forEach((d) => {
+        if (books.has(d.isbn)) books.set(d.isbn, { ...books.get(d.isbn), shelf_index: d.shelf_index, x_pos: d.x_pos });
+      });
+      const grouped = {};
+      [...books.values()]
+        .sort((a, b) => a.shelf_index - b.shelf_index || a.x_pos - b.x_pos)
+        .forEach((b) => (grouped[b.shelf_index] ||= []).push(b));
+      return {
+        ...prev,
+        shelves: Object.keys(grouped).map(Number).sort((a, b) => a - b)
+          .map((i) => ({ shelf_index: i, books: grouped[i] })),
+        total_shelves: msg.total_shelves ?? prev.total_shelves,
+        layout_version: msg.version,
+      };
+    });
+  }, [fetchBookshelf]);
+
+  useEffect(() => {
+    let ws;
+    let retryTimer;
+    let closed = false;
+    const connect = () => {
+      ws = new WebSocket("ws://localhost:8000/bookshelf/ws");
+      ws.onmessage = (e) => applyLayoutDiff(JSON.parse(e.data));
+      ws.onclose = () => { if (!closed) retryTimer = setTimeout(connect, 3000); };
+    };
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      ws?.close();
+    };
+  }, [applyLayoutDiff]);
+
   // 2. 段数（1段あたりの冊数）の更新・再構築
   const updateShelfLayout = async (newSize) => {
     // サーバー側のAPIエンドポイントに合わせてパスを変更してください